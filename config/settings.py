@@ -54,11 +54,15 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'gestao.middleware.InstrumentacaoConsultasMiddleware',
+    'gestao.middleware.ServerTimingMiddleware',
+    'gestao.middleware.MetricasConexoesMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'gestao.middleware.RoteamentoReplicaMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -76,6 +80,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'gestao.context_processors.papeis',
             ],
         },
     },
@@ -139,9 +144,64 @@ DATABASES = {
         'PASSWORD': env('DB_PASSWORD'),
         'HOST': DB_HOST_CLOUD, 
         'PORT': DB_PORT_CLOUD,
+        # Segundos que a conexão é reaproveitada entre requisições da mesma thread (0 = uma por requisição)
+        'CONN_MAX_AGE': env.int('DB_CONN_MAX_AGE', default=60),
+        # Testa a conexão reaproveitada no início de cada requisição e reabre se o servidor a derrubou
+        'CONN_HEALTH_CHECKS': env.bool('DB_CONN_HEALTH_CHECKS', default=True),
     }
 }
 
+# Pool de conexões (gestao/pool_banco.py), para gunicorn com várias threads: limita as conexões
+# abertas por processo e as reaproveita entre threads. PostgreSQL: pool nativo do Django, que requer
+# psycopg 3 e psycopg_pool (psycopg[binary,pool] em requirements.txt); MySQL: backend gestao.pool_mysql.
+if env.bool('DB_POOL', default=False):
+    DATABASES['default']['CONN_MAX_AGE'] = 0  # o pool substitui as conexões persistentes
+    DATABASES['default'].setdefault('OPTIONS', {})['pool'] = {
+        'min_size': env.int('DB_POOL_MIN', default=1),
+        'max_size': env.int('DB_POOL_MAX', default=5),
+        'timeout': env.float('DB_POOL_TIMEOUT', default=10),  # espera máxima por uma conexão livre (s)
+        'max_lifetime': env.float('DB_POOL_MAX_LIFETIME', default=1800),  # recicla conexões antigas (s)
+    }
+    if DATABASES['default']['ENGINE'] == 'django.db.backends.mysql':
+        DATABASES['default']['ENGINE'] = 'gestao.pool_mysql'
+
+# Réplica de leitura (gestao/replica.py), opcional: busca, monitoramento, exportações, indicadores e
+# relatórios dos comandos leem dela. DB_REPLICA_HOST aponta para a réplica do Cloud SQL; localmente,
+# DB_REPLICA_NAME pode ser um segundo arquivo SQLite (cópia do banco principal).
+if env('DB_REPLICA_HOST', default=None) or env('DB_REPLICA_NAME', default=None):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': env('DB_REPLICA_NAME', default=DATABASES['default']['NAME']),
+        'HOST': env('DB_REPLICA_HOST', default=DATABASES['default']['HOST']),
+        'PORT': env('DB_REPLICA_PORT', default=DATABASES['default']['PORT']),
+        'OPTIONS': dict(DATABASES['default'].get('OPTIONS', {})),
+        # Nos testes a réplica é o próprio banco de teste do default
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_ROUTERS = ['gestao.replica.RoteadorReplica']
+# Por quantos segundos após uma escrita o usuário continua lendo do primário (atraso máximo tolerado da réplica)
+GESTAO_REPLICA_JANELA_SEGUNDOS = env.int('GESTAO_REPLICA_JANELA_SEGUNDOS', default=15)
+
+
+# Cache compartilhado entre os workers do gunicorn e as instâncias do Cloud Run (gestao/cache.py).
+# Padrão: tabela no próprio banco (criada pela migração gestao 0028 / `createcachetable`).
+# CACHE_URL troca o backend sem mudar código, ex.: redis://10.0.0.3:6379/0 (Memorystore) ou locmemcache:// (testes).
+CACHES = {
+    'default': env.cache_url('CACHE_URL', default='dbcache://gestao_cache'),
+}
+if CACHES['default']['BACKEND'] == 'django.core.cache.backends.db.DatabaseCache':
+    # O padrão (300 entradas) faria o cull descartar as versões dos namespaces
+    CACHES['default'].setdefault('OPTIONS', {}).setdefault('MAX_ENTRIES', 20000)
+
+# Fragmentos de template ({% cache ... using="fragmentos" %}): o HTML depende só dos papéis e dos
+# valores na chave, então não precisa ser compartilhado; a memória do processo evita uma consulta por fragmento
+CACHES['fragmentos'] = {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    'LOCATION': 'gestao-fragmentos',
+    'TIMEOUT': 3600,
+    'OPTIONS': {'MAX_ENTRIES': 1000},
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -235,6 +295,31 @@ LOGGING = {
     },
 }
 
+# Instrumentação de consultas por requisição (gestao.middleware)
+# Fração das requisições medidas (0.0 desliga, 1.0 mede todas)
+GESTAO_INSTRUMENTACAO_AMOSTRAGEM = env.float('GESTAO_INSTRUMENTACAO_AMOSTRAGEM', default=1.0 if DEBUG else 0.1)
+GESTAO_ORCAMENTO_CONSULTAS = env.int('GESTAO_ORCAMENTO_CONSULTAS', default=40)
+GESTAO_ORCAMENTO_TEMPO_BANCO_MS = env.int('GESTAO_ORCAMENTO_TEMPO_BANCO_MS', default=500)
+# Quantas vezes a mesma instrução pode se repetir antes de ser tratada como N+1
+GESTAO_LIMITE_REPETICOES = env.int('GESTAO_LIMITE_REPETICOES', default=10)
+# Requisições mais lentas que isso têm o tempo por fase registrado em nível INFO (Server-Timing sempre é enviado)
+GESTAO_LIMITE_LENTIDAO_MS = env.int('GESTAO_LIMITE_LENTIDAO_MS', default=1000)
+# Intervalo mínimo entre dois registros das métricas de conexões/pool no log, por processo (0 desliga)
+GESTAO_METRICAS_CONEXOES_INTERVALO_SEGUNDOS = env.int('GESTAO_METRICAS_CONEXOES_INTERVALO_SEGUNDOS', default=60)
+
+# Envios de e-mail das ações em lote (gestao.email_utils.enviar_apos_commit): por padrão dentro da requisição,
+# logo após o commit. Com True saem numa thread, sem prender a resposta, mas uma instância encerrada (Cloud Run
+# reduzindo a escala) mata a thread; as respostas aos remetentes perdidas assim ficam na fila de
+# RespostaRemetentePendente para o comando enviar_respostas_pendentes (agendar a cada poucos minutos)
+GESTAO_ENVIOS_EM_SEGUNDO_PLANO = env.bool('GESTAO_ENVIOS_EM_SEGUNDO_PLANO', default=False)
+
+# PIN de autorização (Profile): validade da autorização emitida após um PIN correto e limite de tentativas erradas
+GESTAO_PIN_VALIDADE_SEGUNDOS = env.int('GESTAO_PIN_VALIDADE_SEGUNDOS', default=900)
+GESTAO_PIN_MAX_TENTATIVAS = env.int('GESTAO_PIN_MAX_TENTATIVAS', default=5)
+GESTAO_PIN_BLOQUEIO_SEGUNDOS = env.int('GESTAO_PIN_BLOQUEIO_SEGUNDOS', default=900)
+# Por quanto tempo os grupos do usuário ficam guardados na sessão (gestao/papeis.py); 0 desliga
+GESTAO_PAPEIS_VALIDADE_SEGUNDOS = env.int('GESTAO_PAPEIS_VALIDADE_SEGUNDOS', default=300)
+
 # Configurações de Segurança para Produção (HTTPS)
 if not DEBUG:
     SESSION_COOKIE_SECURE = True
@@ -0,0 +1,105 @@
+"""
+Cache compartilhado com namespaces versionados
+
+Os valores ficam no backend de CACHES['default'] (tabela no banco por padrão), portanto valem para
+todos os workers e instâncias. Cada namespace tem uma versão; `invalidar(namespace)` troca a versão
+e todos os valores gravados com a anterior passam a ser ignorados, em qualquer instância.
+
+    contadores = obter_ou_calcular('painel', 'contadores', calcular_contadores, ttl=60)
+    invalidar('painel')  # ex.: num signal, quando os dados mudam
+
+A versão e o valor são lidos juntos (um get_many, uma consulta no cache em banco). Só uma
+requisição recalcula um valor ausente (trava com cache.add); as concorrentes esperam um pouco
+pelo resultado antes de calcular por conta própria.
+"""
+import time
+from functools import partial
+
+from django.core.cache import cache
+from django.db import transaction
+
+PREFIXO = 'gestao'
+TTL_PADRAO = 300
+# Tempo máximo que um cálculo segura a trava (e que as concorrentes esperam por ele)
+TRAVA_SEGUNDOS = 10
+ESPERA_INTERVALO = 0.05
+ESPERA_MAXIMA = 2.0
+
+
+def _chave_versao(namespace):
+    return f'{PREFIXO}:ns:{namespace}'
+
+
+def _chave_valor(namespace, chave):
+    return f'{PREFIXO}:{namespace}:{chave}'
+
+
+def _trocar_versao(namespace):
+    cache.set(_chave_versao(namespace), time.time_ns(), None)
+
+
+def invalidar(namespace):
+    """
+    Descarta (em todas as instâncias) os valores guardados no namespace.
+    Dentro de uma transação a troca fica para o commit (uma só vez por namespace): antes dele outra
+    requisição ainda leria os dados antigos e os guardaria na versão nova.
+    """
+    conexao = transaction.get_connection()
+    if not conexao.in_atomic_block:
+        _trocar_versao(namespace)
+        return
+    for _, funcao, _ in conexao.run_on_commit:
+        if getattr(funcao, 'func', None) is _trocar_versao and funcao.args == (namespace,):
+            return
+    transaction.on_commit(partial(_trocar_versao, namespace))
+
+
+def versao(namespace):
+    """
+    Versão atual do namespace (muda a cada `invalidar`). Serve para validar cópias guardadas fora
+    do cache, como os papéis do usuário na sessão (gestao/papeis.py).
+    """
+    chave_versao = _chave_versao(namespace)
+    atual = cache.get(chave_versao)
+    if atual is None:
+        cache.add(chave_versao, time.time_ns(), None)
+        atual = cache.get(chave_versao)
+    return atual
+
+
+def obter_ou_calcular(namespace, chave, calcular, ttl=TTL_PADRAO):
+    """
+    Devolve o valor guardado em `namespace`/`chave` ou o calcula com `calcular()` e o guarda por `ttl` segundos.
+    `calcular` deve devolver algo serializável (listas, dicts, tuplas; nada de querysets preguiçosos).
+    """
+    chave_versao = _chave_versao(namespace)
+    chave_valor = _chave_valor(namespace, chave)
+
+    encontrados = cache.get_many([chave_versao, chave_valor])
+    versao = encontrados.get(chave_versao)
+    if versao is None:
+        # Namespace novo (ou descartado pelo backend): começa numa versão que nenhum valor antigo tem
+        cache.add(chave_versao, time.time_ns(), None)
+        versao = cache.get(chave_versao)
+    else:
+        guardado = encontrados.get(chave_valor)
+        if guardado is not None and guardado[0] == versao:
+            return guardado[1]
+
+    chave_trava = f'{chave_valor}:calculando'
+    if not cache.add(chave_trava, 1, TRAVA_SEGUNDOS):
+        # Outra requisição já está calculando: espera o resultado dela
+        limite = time.monotonic() + ESPERA_MAXIMA
+        while time.monotonic() < limite:
+            time.sleep(ESPERA_INTERVALO)
+            guardado = cache.get(chave_valor)
+            if guardado is not None and guardado[0] == versao:
+                return guardado[1]
+        return calcular()
+
+    try:
+        valor = calcular()
+        cache.set(chave_valor, (versao, valor), ttl)
+    finally:
+        cache.delete(chave_trava)
+    return valor
@@ -0,0 +1,14 @@
+from django.utils.functional import SimpleLazyObject
+
+from .papeis import assinatura_papeis, papeis_usuario
+
+
+def papeis(request):
+    """
+    `papeis_usuario` nos templates: grupos do usuário lidos da sessão, só quando usados.
+    `assinatura_papeis` entra nas chaves dos {% cache %} (menu lateral, cards do painel).
+    """
+    return {
+        'papeis_usuario': SimpleLazyObject(lambda: papeis_usuario(request)),
+        'assinatura_papeis': SimpleLazyObject(lambda: assinatura_papeis(request)),
+    }
@@ -0,0 +1,369 @@
+"""
+Geração de dados sintéticos em volume (suíte de desempenho e reprodução local de cenários de produção)
+
+Tudo é gravado com bulk_create em lotes. Como bulk_create não chama save() nem dispara signals,
+os campos derivados (protocolo, data_limite, interessados_resumo, anexo_inicial_principal, intervalos de status)
+são calculados aqui mesmo, com as mesmas regras do modelo.
+"""
+import itertools
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.auth.models import Group, User
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+from .models import Anexo, Documento, HistoricoEdicao, IntervaloStatus, NivelPrioridade, Remetente, SolicitacaoDocumento, TipoDocumento
+
+ARQUIVO_PLACEHOLDER = 'anexos/sinteticos/placeholder.pdf'
+
+# (descrição, prazo em dias, peso no sorteio)
+PRIORIDADES = [
+    ('Normal', 15, 70),
+    ('Alta', 7, 20),
+    ('Urgente', 3, 10),
+]
+
+# (descrição, peso no sorteio)
+TIPOS_DOCUMENTO = [
+    ('Ofício', 40),
+    ('Memorando', 20),
+    ('Requerimento', 15),
+    ('Processo Administrativo', 15),
+    ('Notificação Extrajudicial', 10),
+]
+
+ORGAOS = [
+    'Secretaria de Saúde', 'Secretaria de Educação', 'Secretaria de Obras', 'Secretaria de Fazenda',
+    'Secretaria de Meio Ambiente', 'Secretaria de Assistência Social', 'Secretaria de Cultura',
+    'Secretaria de Transportes', 'Gabinete do Prefeito', 'Controladoria Geral', 'Câmara Municipal',
+    'Ministério Público Estadual', 'Tribunal de Contas do Estado', 'Defensoria Pública',
+]
+
+
+@contextmanager
+def sem_auto_now_add(*campos):
+    """ Permite gravar datas retroativas em campos auto_now_add durante o bulk_create. """
+    originais = [(campo, campo.auto_now_add) for campo in campos]
+    for campo, _ in originais:
+        campo.auto_now_add = False
+    try:
+        yield
+    finally:
+        for campo, valor in originais:
+            campo.auto_now_add = valor
+
+
+class GeradorDadosSinteticos:
+    """
+    Gera documentos distribuídos ao longo dos últimos `dias` dias, cada um com a situação
+    coerente com a sua idade (recentes ainda na fila ou em análise, antigos finalizados),
+    interessados, anexo inicial (e de resposta, quando houver), diligências, as linhas de histórico
+    e os intervalos de status.
+    Todos os anexos apontam para um único arquivo placeholder, gravado no armazenamento do campo
+    Anexo.arquivo (o mesmo que monta as URLs dos anexos nas telas e nos e-mails).
+
+    Uso:
+        gerador = GeradorDadosSinteticos(dias=365, semente=42)
+        gerador.gerar(50000)
+    """
+
+    def __init__(self, dias=365, semente=None, tamanho_lote=2000, num_procuradores=8, num_remetentes=300, progresso=None):
+        self.dias = dias
+        self.armazenamento = Anexo._meta.get_field('arquivo').storage
+        self.tamanho_lote = tamanho_lote
+        self.num_procuradores = num_procuradores
+        self.num_remetentes = num_remetentes
+        self.progresso = progresso or (lambda mensagem: None)
+        self.aleatorio = random.Random(semente)
+        self.agora = timezone.now()
+
+    # --- Dados de referência ---
+
+    def preparar_referencias(self):
+        """ Cria (ou reaproveita) prioridades, tipos, usuários, grupos e remetentes usados pelos documentos. """
+        self.prioridades = []
+        self.pesos_prioridade = []
+        for descricao, prazo_dias, peso in PRIORIDADES:
+            prioridade, _ = NivelPrioridade.objects.get_or_create(descricao=descricao, defaults={'prazo_dias': prazo_dias})
+            self.prioridades.append(prioridade)
+            self.pesos_prioridade.append(peso)
+
+        self.tipos = []
+        self.pesos_tipo = []
+        for descricao, peso in TIPOS_DOCUMENTO:
+            tipo, _ = TipoDocumento.objects.get_or_create(descricao=descricao)
+            self.tipos.append(tipo)
+            self.pesos_tipo.append(peso)
+
+        grupo_procuradores, _ = Group.objects.get_or_create(name='Procuradores')
+        grupo_protocolo, _ = Group.objects.get_or_create(name='Protocolo')
+
+        self.procuradores = []
+        for indice in range(1, self.num_procuradores + 1):
+            usuario, criado = User.objects.get_or_create(
+                username=f'procurador.sintetico{indice}',
+                defaults={'first_name': 'Procurador', 'last_name': f'Sintético {indice}', 'email': f'procurador{indice}@sintetico.local'},
+            )
+            if criado:
+                usuario.groups.add(grupo_procuradores)
+            self.procuradores.append(usuario)
+
+        self.protocolador, criado = User.objects.get_or_create(
+            username='protocolo.sintetico',
+            defaults={'first_name': 'Protocolo', 'last_name': 'Sintético', 'email': 'protocolo@sintetico.local'},
+        )
+        if criado:
+            self.protocolador.groups.add(grupo_protocolo)
+
+        existentes = Remetente.objects.filter(cpf_cnpj__startswith='99.').count()
+        novos = [
+            Remetente(
+                tipo_remetente='Órgão Público',
+                nome_razao_social=f'{self.aleatorio.choice(ORGAOS)} - Unidade {indice}',
+                cpf_cnpj=f'99.{indice:06d}/0001-00',
+                email=f'unidade{indice}@sintetico.local',
+            )
+            for indice in range(existentes + 1, self.num_remetentes + 1)
+        ]
+        Remetente.objects.bulk_create(novos, batch_size=self.tamanho_lote)
+        self.remetentes = list(Remetente.objects.filter(cpf_cnpj__startswith='99.').only('id', 'nome_razao_social'))
+
+        if not self.armazenamento.exists(ARQUIVO_PLACEHOLDER):
+            self.armazenamento.save(ARQUIVO_PLACEHOLDER, ContentFile(b'%PDF-1.4\n% documento sintetico\n%%EOF\n'))
+
+    # --- Documentos ---
+
+    def _proximos_sequenciais(self, inicio):
+        """ Último sequencial de protocolo já usado em cada dia da janela (para não colidir com dados existentes). """
+        ultimos = {}
+        protocolos = Documento.objects.filter(protocolo__gte=inicio.strftime('%Y-%m-%d')).values_list('protocolo', flat=True)
+        for protocolo in protocolos.iterator():
+            prefixo, _, sequencial = protocolo.rpartition('-')
+            if sequencial.isdigit():
+                ultimos[prefixo] = max(ultimos.get(prefixo, 0), int(sequencial))
+        return ultimos
+
+    def _montar_documento(self, recebimento, protocolo):
+        """
+        Percorre o fluxo real (distribuição, devolução, diligência, resposta, confirmação,
+        rejeição, finalização) até o momento atual e para onde o relógio alcançar.
+        Retorna o documento, as transições [(momento, antigo, novo, usuário, procurador_id)] e as diligências.
+        """
+        aleatorio = self.aleatorio
+        agora = self.agora
+        prioridade = aleatorio.choices(self.prioridades, self.pesos_prioridade)[0]
+        documento = Documento(
+            protocolo=protocolo,
+            status='Aguardando Distribuição',
+            remetente=aleatorio.choice(self.remetentes),
+            tipo_documento=aleatorio.choices(self.tipos, self.pesos_tipo)[0],
+            prioridade=prioridade,
+            num_doc_origem=f'{aleatorio.randint(1, 9999)}/{recebimento.year}',
+            data_doc_origem=(recebimento - timedelta(days=aleatorio.randint(0, 15))).date(),
+            observacoes_protocolo=aleatorio.choice(['', 'Documento encaminhado para manifestação jurídica.', 'Urgência solicitada pelo órgão de origem.']),
+            protocolado_por=self.protocolador,
+            notificar_remetente=aleatorio.random() < 0.3,
+            data_recebimento=recebimento,
+        )
+        # Interessados já resolvidos aqui para gravar o resumo junto com o documento
+        interessados = aleatorio.sample(self.remetentes, aleatorio.choice([0, 1, 1, 2, 2, 3]))
+        interessados.sort(key=lambda remetente: (remetente.nome_razao_social, remetente.id))
+        documento.interessados_resumo = [{'id': remetente.id, 'nome': remetente.nome_razao_social} for remetente in interessados]
+        documento._interessados_sinteticos = interessados
+        transicoes = []
+        diligencias = []
+
+        def mudar(momento, novo_status, usuario):
+            transicoes.append((momento, documento.status, novo_status, usuario, documento.procurador_atribuido_id))
+            documento.status = novo_status
+
+        def atribuir(momento, procurador):
+            documento.procurador_atribuido = procurador
+            documento.data_atribuicao = momento
+            documento.data_limite = momento.date() + timedelta(days=prioridade.prazo_dias)
+            mudar(momento, 'Em Análise', self.protocolador)
+
+        momento = recebimento + timedelta(hours=aleatorio.randint(1, 72))
+        if momento > agora:
+            return documento, transicoes, diligencias
+        procurador = aleatorio.choice(self.procuradores)
+        atribuir(momento, procurador)
+
+        # ~5% são devolvidos à distribuição pelo procurador e redistribuídos
+        if aleatorio.random() < 0.05:
+            momento += timedelta(days=aleatorio.randint(0, 3), hours=aleatorio.randint(1, 8))
+            if momento > agora:
+                return documento, transicoes, diligencias
+            documento.procurador_atribuido = None
+            documento.data_atribuicao = None
+            documento.data_limite = None
+            mudar(momento, 'Devolvido pela Análise', procurador)
+            documento.motivo_ultima_devolucao = 'Matéria de competência de outra especializada.'
+
+            momento += timedelta(hours=aleatorio.randint(2, 48))
+            if momento > agora:
+                return documento, transicoes, diligencias
+            procurador = aleatorio.choice(self.procuradores)
+            atribuir(momento, procurador)
+
+        # ~10% passam por diligência (documentação complementar pedida à chefia)
+        if aleatorio.random() < 0.10:
+            momento += timedelta(days=aleatorio.randint(1, 5))
+            if momento > agora:
+                return documento, transicoes, diligencias
+            diligencia = SolicitacaoDocumento(
+                procurador=procurador,
+                descricao_necessidade='Encaminhar cópia integral do processo administrativo de origem.',
+                status='Pendente',
+                data_solicitacao=momento,
+            )
+            diligencias.append(diligencia)
+            mudar(momento, 'Em Diligência', procurador)
+
+            momento += timedelta(days=aleatorio.randint(2, 15))
+            if momento > agora:
+                if aleatorio.random() < 0.5:
+                    diligencia.status = 'Enviada'
+                    diligencia.analisado_por = self.protocolador
+                return documento, transicoes, diligencias
+            diligencia.status = aleatorio.choices(['Atendida', 'Rejeitada'], [80, 20])[0]
+            diligencia.analisado_por = self.protocolador
+            diligencia.data_resposta = momento
+            diligencia.observacao_chefia = 'Documentação juntada aos autos.' if diligencia.status == 'Atendida' else 'Informações já constam dos autos.'
+            mudar(momento, 'Em Análise', self.protocolador)
+
+        # ~20% das análises estouram o prazo
+        momento += timedelta(days=aleatorio.randint(1, max(2, int(prioridade.prazo_dias * 1.25))), hours=aleatorio.randint(0, 8))
+        if momento > agora:
+            return documento, transicoes, diligencias
+        documento.data_resposta_procurador = momento
+        mudar(momento, 'Análise Concluída', procurador)
+
+        # ~40% passam pela confirmação da chefia; ~10% destes são rejeitados e voltam ao procurador
+        if aleatorio.random() < 0.4:
+            momento += timedelta(hours=aleatorio.randint(1, 24))
+            if momento > agora:
+                return documento, transicoes, diligencias
+            mudar(momento, 'Aguardando Confirmação', self.protocolador)
+
+            momento += timedelta(days=aleatorio.randint(0, 3), hours=aleatorio.randint(1, 8))
+            if momento > agora:
+                return documento, transicoes, diligencias
+            if aleatorio.random() < 0.1:
+                documento.motivo_rejeicao_analista = 'Fundamentação insuficiente; complementar o parecer.'
+                mudar(momento, 'Rejeitado', self.protocolador)
+                momento += timedelta(days=aleatorio.randint(1, 5))
+                if momento > agora:
+                    return documento, transicoes, diligencias
+                documento.data_resposta_procurador = momento
+                mudar(momento, 'Análise Concluída', procurador)
+
+        momento += timedelta(days=aleatorio.randint(0, 5), hours=aleatorio.randint(1, 8))
+        if momento > agora:
+            return documento, transicoes, diligencias
+        documento.data_finalizacao = momento
+        documento.finalizado_por = self.protocolador
+        documento.obs_finalizacao = 'Resposta encaminhada aos interessados.'
+        mudar(momento, 'Finalizado', self.protocolador)
+        return documento, transicoes, diligencias
+
+    def _gravar_lote(self, lote):
+        documentos = [documento for documento, _, _ in lote]
+        Documento.objects.bulk_create(documentos)
+
+        if any(documento.pk is None for documento in documentos):
+            # MySQL não devolve as chaves do bulk_create: recupera pelo protocolo
+            ids = dict(Documento.objects.filter(protocolo__in=[d.protocolo for d in documentos]).values_list('protocolo', 'id'))
+            for documento in documentos:
+                documento.pk = ids[documento.protocolo]
+
+        Interessado = Documento.interessados.through
+        vinculos = []
+        historicos = []
+        anexos = []
+        diligencias = []
+        intervalos = []
+        for documento, transicoes, diligencias_documento in lote:
+            vinculos.extend(
+                Interessado(documento_id=documento.pk, remetente_id=remetente.id) for remetente in documento._interessados_sinteticos
+            )
+
+            anexos.append(Anexo(
+                documento_id=documento.pk, arquivo=ARQUIVO_PLACEHOLDER, tipo_anexo='INICIAL',
+                usuario_upload=self.protocolador, data_upload=documento.data_recebimento,
+            ))
+            if documento.data_resposta_procurador:
+                anexos.append(Anexo(
+                    documento_id=documento.pk, arquivo=ARQUIVO_PLACEHOLDER, tipo_anexo='RESPOSTA',
+                    usuario_upload=documento.procurador_atribuido, data_upload=documento.data_resposta_procurador,
+                ))
+
+            for diligencia in diligencias_documento:
+                diligencia.documento_id = documento.pk
+                diligencias.append(diligencia)
+
+            # Intervalos de status: o primeiro começa no recebimento, cada transição fecha o anterior
+            intervalo = IntervaloStatus(documento_id=documento.pk, status='Aguardando Distribuição', inicio=documento.data_recebimento)
+            intervalos.append(intervalo)
+            for momento, antigo, novo, usuario, procurador_id in transicoes:
+                historicos.append(HistoricoEdicao(
+                    documento_id=documento.pk, usuario=usuario, data_alteracao=momento,
+                    campo_alterado='Status', valor_antigo=antigo, valor_novo=novo,
+                ))
+                intervalo.fim = momento
+                intervalo.duracao_segundos = int((momento - intervalo.inicio).total_seconds())
+                intervalo = IntervaloStatus(documento_id=documento.pk, status=novo, procurador_id=procurador_id, inicio=momento)
+                intervalos.append(intervalo)
+
+        Interessado.objects.bulk_create(vinculos)
+        Anexo.objects.bulk_create(anexos)
+        HistoricoEdicao.objects.bulk_create(historicos)
+        SolicitacaoDocumento.objects.bulk_create(diligencias)
+        IntervaloStatus.objects.bulk_create(intervalos)
+
+        # anexo_inicial_principal (mantido pelos signals de Anexo, que o bulk_create não dispara)
+        primeiro_inicial = Anexo.objects.filter(
+            documento=OuterRef('pk'), tipo_anexo='INICIAL', ativo=True
+        ).order_by('pk').values('pk')[:1]
+        Documento.objects.filter(pk__in=[documento.pk for documento in documentos]).update(anexo_inicial_principal=Subquery(primeiro_inicial))
+
+        return {'interessados': len(vinculos), 'anexos': len(anexos), 'historicos': len(historicos), 'diligencias': len(diligencias), 'intervalos_status': len(intervalos)}
+
+    def gerar(self, quantidade):
+        """ Gera `quantidade` documentos. Retorna um dicionário com os totais gravados. """
+        self.preparar_referencias()
+
+        inicio = self.agora - timedelta(days=self.dias)
+        ultimos_sequenciais = self._proximos_sequenciais(inicio)
+        # Recebimentos espaçados uniformemente na janela, com variação aleatória (já em ordem cronológica)
+        passo = (self.agora - inicio) / max(quantidade, 1)
+        recebimentos = (inicio + passo * (indice + self.aleatorio.random()) for indice in range(quantidade))
+
+        totais = {'documentos': 0, 'interessados': 0, 'anexos': 0, 'historicos': 0, 'diligencias': 0, 'intervalos_status': 0}
+        campos_data = [
+            Documento._meta.get_field('data_recebimento'),
+            Anexo._meta.get_field('data_upload'),
+            HistoricoEdicao._meta.get_field('data_alteracao'),
+            SolicitacaoDocumento._meta.get_field('data_solicitacao'),
+        ]
+        with sem_auto_now_add(*campos_data):
+            while totais['documentos'] < quantidade:
+                lote = []
+                for recebimento in itertools.islice(recebimentos, self.tamanho_lote):
+                    prefixo = timezone.localtime(recebimento).strftime('%Y-%m-%d')
+                    ultimos_sequenciais[prefixo] = ultimos_sequenciais.get(prefixo, 0) + 1
+                    lote.append(self._montar_documento(recebimento, f'{prefixo}-{ultimos_sequenciais[prefixo]:03d}'))
+
+                with transaction.atomic():
+                    gravados = self._gravar_lote(lote)
+
+                totais['documentos'] += len(lote)
+                for chave, quantidade_gravada in gravados.items():
+                    totais[chave] += quantidade_gravada
+                self.progresso(f"{totais['documentos']}/{quantidade} documentos gravados")
+
+        return totais
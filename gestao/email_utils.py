@@ -1,26 +1,36 @@
 """
 Utilitários para envio de e-mails HTML com templates
 """
+import logging
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from urllib.parse import urljoin
-from django.core.mail import EmailMultiAlternatives
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import connections, transaction
 from django.template.loader import render_to_string
 from django.conf import settings
 from django.utils.html import strip_tags
 from datetime import datetime, timedelta
 
+from .metricas import medir
 
-def enviar_email_html(assunto, template_name, contexto, destinatarios, anexos=None, logo_path=None):
+logger = logging.getLogger('gestao')
+
+
+def enviar_email_html(assunto, template_name, contexto, destinatarios, anexos=None, logo_path=None, connection=None):
     try:
         contexto['ano_atual'] = datetime.now().year
-        html_content = render_to_string(template_name, contexto)
+        with medir('email_render'):
+            html_content = render_to_string(template_name, contexto)
         text_content = strip_tags(html_content)
         
         email = EmailMultiAlternatives(
             subject=assunto,
             body=text_content,
             from_email=settings.DEFAULT_FROM_EMAIL,
-            to=destinatarios
+            to=destinatarios,
+            connection=connection,
         )
         email.attach_alternative(html_content, "text/html")
         email.mixed_subtype = 'related'
@@ -30,18 +40,20 @@ def enviar_email_html(assunto, template_name, contexto, destinatarios, anexos=No
             for anexo in anexos:
                 # Se for um objeto de arquivo do Django (FieldFile/File)
                 if hasattr(anexo, 'open'):
-                    with anexo.open('rb') as f:
+                    with medir('anexos'), anexo.open('rb') as f:
                         # Pega o nome do arquivo e o conteúdo binário
                         email.attach(os.path.basename(anexo.name), f.read())
                 
                 # Se for um caminho string (tentativa de arquivo local)
                 elif isinstance(anexo, str) and os.path.exists(anexo):
-                    email.attach_file(anexo)
+                    with medir('anexos'):
+                        email.attach_file(anexo)
                 
                 else:
                     print(f"Aviso: Anexo {anexo} não pôde ser processado.")
 
-        email.send()
+        with medir('smtp'):
+            email.send()
         return True
         
     except Exception as e:
@@ -49,6 +61,72 @@ def enviar_email_html(assunto, template_name, contexto, destinatarios, anexos=No
         return False
 
 
+def enviar_emails_em_paralelo(envios, max_threads=4):
+    """
+    Envia vários e-mails HTML (enviar_email_html) com um pool limitado de threads.
+    Cada thread abre uma conexão SMTP e a reaproveita em todos os seus envios.
+
+    Args:
+        envios: iterável de (chave, kwargs de enviar_email_html)
+        max_threads (int): envios simultâneos
+
+    Yields:
+        (chave, enviado) à medida que os envios terminam
+    """
+    local = threading.local()
+    conexoes = []
+    trava = threading.Lock()
+
+    def enviar(kwargs):
+        if not hasattr(local, 'conexao'):
+            local.conexao = get_connection()
+            with trava:
+                conexoes.append(local.conexao)
+            try:
+                local.conexao.open()
+            except Exception:
+                # Sem conexão aberta, cada send() tenta de novo e a falha é tratada em enviar_email_html
+                logger.exception("Erro ao conectar ao servidor de e-mail")
+        return enviar_email_html(connection=local.conexao, **kwargs)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_threads) as executor:
+            futuros = {executor.submit(enviar, kwargs): chave for chave, kwargs in envios}
+            for futuro in as_completed(futuros):
+                yield futuros[futuro], futuro.result()
+    finally:
+        for conexao in conexoes:
+            try:
+                conexao.close()
+            except Exception:
+                pass
+
+
+def enviar_apos_commit(funcao, *args):
+    """
+    Executa `funcao(*args)` (envios de e-mail) depois do commit da transação atual. Por padrão roda no
+    próprio callback do commit; com GESTAO_ENVIOS_EM_SEGUNDO_PLANO = True, numa thread própria (a
+    requisição responde sem esperar o SMTP, mas a thread morre se a instância for encerrada: envios que
+    não podem se perder precisam de uma fila durável, como a de gestao/respostas.py).
+    """
+    def executar():
+        try:
+            funcao(*args)
+        except Exception:
+            logger.exception("Erro nos envios em segundo plano (%s)", funcao.__name__)
+        finally:
+            # A thread abriu as próprias conexões com o banco
+            connections.close_all()
+
+    def iniciar():
+        if settings.GESTAO_ENVIOS_EM_SEGUNDO_PLANO:
+            threading.Thread(target=executar, name=f'envios-{funcao.__name__}', daemon=True).start()
+        else:
+            funcao(*args)
+
+    transaction.on_commit(iniciar)
+
+
 def verificar_prazo_proximo(data_limite, dias=3):
     """
     Verifica se uma data limite está próxima (dentro de X dias)
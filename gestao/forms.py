@@ -1,9 +1,11 @@
 from django import forms
 from django.forms import inlineformset_factory
 from django.contrib.auth.models import User
-from .models import Documento, Anexo, Remetente, TipoDocumento, NivelPrioridade, User
+from .models import Documento, Anexo, Remetente, TipoDocumento, NivelPrioridade, User, SITUACAO_PRAZO_CHOICES
 from django.utils import timezone
 
+from .cache import obter_ou_calcular
+
 # Este é o formulário principal para cadastrar um processo
 class DocumentoForm(forms.ModelForm):
     class Meta:
@@ -121,6 +123,26 @@ class DocumentoFilterForm(forms.Form):
         widget=forms.Select(attrs={'class': 'form-select'})
     )
 
+    prazo = forms.ChoiceField(
+        label='Situação do Prazo',
+        choices=[('', 'Todos os Prazos')] + SITUACAO_PRAZO_CHOICES,
+        required=False,
+        widget=forms.Select(attrs={'class': 'form-select'})
+    )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Opções vindas do cache compartilhado em vez de uma consulta por renderização;
+        # a validação continua usando o queryset (uma consulta, só quando o filtro é enviado)
+        self.fields['interessados'].choices = [('', '---------')] + obter_ou_calcular(
+            'referencias', 'remetentes',
+            lambda: list(Remetente.objects.order_by('nome_razao_social').values_list('id', 'nome_razao_social')),
+        )
+        self.fields['tipo_documento'].choices = [('', '---------')] + obter_ou_calcular(
+            'referencias', 'tipos_documento',
+            lambda: list(TipoDocumento.objects.order_by('descricao').values_list('id', 'descricao')),
+        )
+
 class AnexoForm(forms.ModelForm):
     class Meta:
         model = Anexo
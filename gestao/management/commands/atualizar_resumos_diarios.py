@@ -0,0 +1,57 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from gestao.models import Documento, ResumoProdutividadeDiaria
+from gestao.produtividade import consolidar_periodo
+from gestao.replica import ler_da_replica
+
+
+class Command(BaseCommand):
+    help = 'Atualiza incrementalmente a tabela de resumos diários de produtividade (indicadores da chefia)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reprocessar-dias', type=int, default=7,
+            help='Quantos dias antes do último consolidado são recalculados (capta respostas e correções tardias). Padrão: 7',
+        )
+        parser.add_argument('--desde', help='Recalcula a partir desta data (AAAA-MM-DD)')
+        parser.add_argument('--tudo', action='store_true', help='Recalcula todo o histórico')
+        parser.add_argument('--janela', type=int, default=31, help='Dias processados por transação (padrão: 31)')
+
+    def handle(self, *args, **options):
+        # As leituras (Documento e o último dia consolidado) vão para a réplica, se houver; a gravação dos resumos, ao primário
+        with ler_da_replica():
+            self.atualizar(options)
+
+    def atualizar(self, options):
+        hoje = timezone.localdate()
+
+        if options['desde']:
+            try:
+                inicio = date.fromisoformat(options['desde'])
+            except ValueError:
+                raise CommandError('Data inválida em --desde (use AAAA-MM-DD).')
+        else:
+            ultimo_consolidado = None if options['tudo'] else ResumoProdutividadeDiaria.objects.aggregate(ultimo=Max('data'))['ultimo']
+            if ultimo_consolidado:
+                inicio = ultimo_consolidado - timedelta(days=options['reprocessar_dias'])
+            else:
+                primeiro_recebimento = Documento.objects.aggregate(primeiro=Min('data_recebimento'))['primeiro']
+                if not primeiro_recebimento:
+                    self.stdout.write('Nenhum documento para consolidar.')
+                    return
+                inicio = timezone.localtime(primeiro_recebimento).date()
+
+        total_linhas = 0
+        janela_inicio = inicio
+        while janela_inicio <= hoje:
+            janela_fim = min(janela_inicio + timedelta(days=options['janela'] - 1), hoje)
+            linhas = consolidar_periodo(janela_inicio, janela_fim)
+            total_linhas += linhas
+            self.stdout.write(f'{janela_inicio:%d/%m/%Y} a {janela_fim:%d/%m/%Y}: {linhas} linha(s)')
+            janela_inicio = janela_fim + timedelta(days=1)
+
+        self.stdout.write(self.style.SUCCESS(f'Resumos atualizados de {inicio:%d/%m/%Y} a {hoje:%d/%m/%Y} ({total_linhas} linhas).'))
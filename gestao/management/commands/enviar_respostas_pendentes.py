@@ -0,0 +1,50 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from gestao.models import RespostaRemetentePendente
+from gestao.respostas import enviar_respostas_remetentes
+from gestao.travas import trava_execucao
+
+
+class Command(BaseCommand):
+    help = 'Reenvia as respostas aos remetentes que ficaram na fila (falha no SMTP ou instância encerrada antes do envio)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--espera', type=int, default=10,
+            help='Minutos desde a confirmação (ou a última tentativa) antes de reenviar: a própria requisição pode estar enviando. Padrão: 10',
+        )
+        parser.add_argument('--max-tentativas', type=int, default=5, help='Tentativas por resposta antes de desistir (padrão: 5)')
+        parser.add_argument('--lote', type=int, default=200, help='Respostas enviadas por rodada (padrão: 200)')
+        parser.add_argument('--duracao-trava', type=int, default=30, help='Minutos de validade da trava de execução (padrão: 30)')
+
+    def handle(self, *args, **options):
+        with trava_execucao('enviar_respostas_pendentes', timedelta(minutes=options['duracao_trava'])) as obtida:
+            if not obtida:
+                self.stdout.write(self.style.WARNING('Outra execução de enviar_respostas_pendentes está em andamento; nada a fazer.'))
+                return
+            self.reenviar(options)
+
+    def reenviar(self, options):
+        limite = timezone.now() - timedelta(minutes=options['espera'])
+        fila = RespostaRemetentePendente.objects.filter(tentativas__lt=options['max_tentativas'])
+        documento_ids = list(fila.filter(
+            Q(ultima_tentativa__lte=limite) | Q(ultima_tentativa__isnull=True, criada_em__lte=limite)
+        ).order_by('id').values_list('documento_id', flat=True))
+
+        total_enviados = 0
+        total_falhas = 0
+        for inicio in range(0, len(documento_ids), options['lote']):
+            enviados, falhas = enviar_respostas_remetentes(documento_ids[inicio:inicio + options['lote']])
+            total_enviados += enviados
+            total_falhas += len(falhas)
+
+        desistidas = RespostaRemetentePendente.objects.filter(tentativas__gte=options['max_tentativas']).count()
+        if desistidas:
+            self.stdout.write(self.style.WARNING(
+                f'{desistidas} resposta(s) atingiram {options["max_tentativas"]} tentativas e não serão reenviadas (ver RespostaRemetentePendente).'
+            ))
+        self.stdout.write(self.style.SUCCESS(f'Respostas reenviadas: {total_enviados}; falhas: {total_falhas}.'))
@@ -0,0 +1,41 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from gestao.dados_sinteticos import GeradorDadosSinteticos
+
+
+class Command(BaseCommand):
+    help = 'Gera documentos sintéticos em volume (com histórico, diligências, interessados e anexos) para testes de escala'
+
+    def add_arguments(self, parser):
+        parser.add_argument('quantidade', type=int, help='Quantidade de documentos a gerar')
+        parser.add_argument('--dias', type=int, default=365, help='Janela de recebimento, em dias até hoje (padrão: 365)')
+        parser.add_argument('--lote', type=int, default=5000, help='Documentos por lote de bulk_create (padrão: 5000)')
+        parser.add_argument('--procuradores', type=int, default=8, help='Procuradores sintéticos (padrão: 8)')
+        parser.add_argument('--remetentes', type=int, default=300, help='Remetentes/interessados sintéticos (padrão: 300)')
+        parser.add_argument('--semente', type=int, default=None, help='Semente aleatória (gera sempre o mesmo conjunto)')
+        parser.add_argument('--forcar', action='store_true', help='Permite rodar com DEBUG=False')
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG and not options['forcar']:
+            raise CommandError('DEBUG=False: isto parece produção. Use --forcar se tiver certeza.')
+        if options['quantidade'] <= 0:
+            raise CommandError('A quantidade deve ser maior que zero.')
+
+        gerador = GeradorDadosSinteticos(
+            dias=options['dias'],
+            semente=options['semente'],
+            tamanho_lote=options['lote'],
+            num_procuradores=options['procuradores'],
+            num_remetentes=options['remetentes'],
+            progresso=lambda mensagem: self.stdout.write(mensagem),
+        )
+
+        inicio = time.monotonic()
+        totais = gerador.gerar(options['quantidade'])
+        duracao = time.monotonic() - inicio
+
+        resumo = ', '.join(f'{quantidade} {nome}' for nome, quantidade in totais.items())
+        self.stdout.write(self.style.SUCCESS(f'Gerados em {duracao:.1f}s: {resumo}.'))
@@ -1,72 +1,129 @@
-import os
+import time
+from datetime import timedelta
+
 from django.core.management.base import BaseCommand
+from django.db.models import Count
 from django.utils import timezone
 from django.contrib.auth.models import User
-from gestao.models import Documento
-from gestao.email_utils import enviar_email_html
+from gestao.models import STATUS_PENDENTES_PROCURADOR, Documento, NotificacaoEnviada
+from gestao.email_utils import enviar_emails_em_paralelo
+from gestao.travas import trava_execucao
 
 class Command(BaseCommand):
-    help = 'Envia relatórios de atrasos para Procuradores e Chefia'
+    help = 'Envia relatórios de atrasos para Procuradores e Chefia (idempotente: cada alerta sai uma vez por dia)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--duracao-trava', type=int, default=30, help='Minutos de validade da trava de execução (padrão: 30)')
+        parser.add_argument('--reter-dias', type=int, default=30, help='Dias mantidos no registro de notificações enviadas (padrão: 30)')
+        parser.add_argument('--threads', type=int, default=4, help='Envios de e-mail simultâneos (padrão: 4)')
 
     def handle(self, *args, **options):
+        with trava_execucao('notificar_atrasos', timedelta(minutes=options['duracao_trava'])) as obtida:
+            if not obtida:
+                self.stdout.write(self.style.WARNING('Outra execução de notificar_atrasos está em andamento; nada a fazer.'))
+                return
+            self.notificar(options)
+
+    def notificar(self, options):
+        inicio = time.monotonic()
         hoje = timezone.localdate()
         ano_atual = hoje.year
-        
-        processos_atrasados = Documento.objects.filter(
+
+        NotificacaoEnviada.objects.filter(data__lt=hoje - timedelta(days=options['reter_dias'])).delete()
+
+        atrasados = Documento.objects.filter(
             data_limite__lt=hoje,
             data_finalizacao__isnull=True,
-            status__in=['Em Análise', 'Em Diligência']
-        ).select_related('procurador_atribuido')
-
-        if not processos_atrasados.exists():
-            return
+            status__in=STATUS_PENDENTES_PROCURADOR,
+            procurador_atribuido__isnull=False,
+        )
 
-        emails_chefes = list(User.objects.filter(groups__name='Procurador-Chefe').values_list('email', flat=True))
-        
-        # Estrutura principal agrupada
+        # 1. Um grupo por procurador, com o total já contado no banco
         agrupamento_atrasos = {}
+        totais = atrasados.values(
+            'procurador_atribuido', 'procurador_atribuido__first_name', 'procurador_atribuido__last_name',
+            'procurador_atribuido__username', 'procurador_atribuido__email',
+        ).annotate(total=Count('id')).order_by('procurador_atribuido__first_name', 'procurador_atribuido__username')
+        for linha in totais:
+            nome = f"{linha['procurador_atribuido__first_name']} {linha['procurador_atribuido__last_name']}".strip()
+            agrupamento_atrasos[linha['procurador_atribuido']] = {
+                'nome': nome or linha['procurador_atribuido__username'],
+                'email': linha['procurador_atribuido__email'],
+                'processos': [],
+                'total_processos': linha['total'],
+            }
+
+        if not agrupamento_atrasos:
+            self.stdout.write('Nenhum processo em atraso.')
+            return
 
-        for doc in processos_atrasados:
-            dias_atraso = (hoje - doc.data_limite).days
-            proc = doc.procurador_atribuido
-            proc_id = proc.id
-            nome_proc = proc.get_full_name() or proc.username
-            
-            if proc_id not in agrupamento_atrasos:
-                agrupamento_atrasos[proc_id] = {
-                    'nome': nome_proc,
-                    'email': proc.email,
-                    'processos': [],
-                    'total_processos': 0
-                }
-            
-            agrupamento_atrasos[proc_id]['processos'].append({
-                'protocolo': doc.protocolo,
-                'data_limite': doc.data_limite,
-                'dias_atraso': dias_atraso,
+        # 2. Os processos em streaming, como tuplas (nenhum modelo é instanciado)
+        linhas = atrasados.order_by('data_limite', 'id').values_list(
+            'id', 'procurador_atribuido', 'protocolo', 'data_limite'
+        ).iterator(chunk_size=2000)
+        ids_atrasados = []
+        for doc_id, proc_id, protocolo, data_limite in linhas:
+            grupo = agrupamento_atrasos.get(proc_id)
+            if grupo is None:
+                continue  # atribuído entre as duas consultas; entra na próxima execução
+            grupo['processos'].append({
+                'documento_id': doc_id,
+                'protocolo': protocolo,
+                'data_limite': data_limite,
+                'dias_atraso': (hoje - data_limite).days,
             })
-            agrupamento_atrasos[proc_id]['total_processos'] += 1
+            ids_atrasados.append(doc_id)
+        duracao_consultas = time.monotonic() - inicio
 
-        # 1. Enviar e-mails individuais (Procuradores)
+        envios = []
+
+        # 3. E-mails individuais (Procuradores), só com os processos ainda não alertados hoje
+        ja_enviadas = NotificacaoEnviada.ja_enviadas('atraso_procurador', hoje)
+        pulados = 0
         for p_id, p_data in agrupamento_atrasos.items():
-            if p_data['email']:
-                enviar_email_html(
-                    assunto=f"ALERTA: Seus Processos Fora do Prazo",
-                    template_name='emails/atraso_procurador.html',
-                    contexto={'nome': p_data['nome'], 'processos': p_data['processos'], 'ano_atual': ano_atual, 'hoje': hoje},
-                    destinatarios=[p_data['email']]
-                )
+            pendentes = [p for p in p_data['processos'] if (p_id, p['documento_id']) not in ja_enviadas]
+            if not p_data['email'] or not pendentes:
+                pulados += 1
+                continue
+            envios.append((('atraso_procurador', p_id, [p['documento_id'] for p in pendentes]), {
+                'assunto': "ALERTA: Seus Processos Fora do Prazo",
+                'template_name': 'emails/atraso_procurador.html',
+                'contexto': {'nome': p_data['nome'], 'processos': pendentes, 'ano_atual': ano_atual, 'hoje': hoje},
+                'destinatarios': [p_data['email']],
+            }))
 
-        # 2. Enviar e-mail para Chefes (Passando o agrupamento completo)
-        if emails_chefes:
-            enviar_email_html(
-                assunto="RELATÓRIO DE GESTÃO: Processos Fora do Prazo na Procuradoria",
-                template_name='emails/atraso_chefia.html',
-                contexto={
-                    'agrupamento': agrupamento_atrasos.values(), # Enviamos os grupos
-                    'total_geral': len(processos_atrasados),
+        # 4. Relatório completo para cada chefe que ainda tenha processo não relatado hoje
+        ja_enviadas = NotificacaoEnviada.ja_enviadas('atraso_chefia', hoje)
+        chefes = User.objects.filter(groups__name='Procurador-Chefe').exclude(email='').values_list('id', 'email')
+        for chefe_id, email_chefe in chefes:
+            if all((chefe_id, doc_id) in ja_enviadas for doc_id in ids_atrasados):
+                continue
+            envios.append((('atraso_chefia', chefe_id, ids_atrasados), {
+                'assunto': "RELATÓRIO DE GESTÃO: Processos Fora do Prazo na Procuradoria",
+                'template_name': 'emails/atraso_chefia.html',
+                'contexto': {
+                    'agrupamento': list(agrupamento_atrasos.values()),
+                    'total_geral': len(ids_atrasados),
                     'hoje': hoje,
-                    'ano_atual': ano_atual
+                    'ano_atual': ano_atual,
                 },
-                destinatarios=emails_chefes
-            )
\ No newline at end of file
+                'destinatarios': [email_chefe],
+            }))
+
+        # 5. Envio concorrente; o registro é gravado aqui (na thread principal) a cada envio bem-sucedido
+        enviados = falhas = 0
+        inicio_envio = time.monotonic()
+        for (tipo, destinatario_id, documento_ids), enviado in enviar_emails_em_paralelo(envios, options['threads']):
+            if enviado:
+                NotificacaoEnviada.registrar(tipo, hoje, destinatario_id, documento_ids)
+                enviados += 1
+            else:
+                falhas += 1
+        duracao_envio = time.monotonic() - inicio_envio
+
+        mensagem = (
+            f'{len(ids_atrasados)} processo(s) em atraso de {len(agrupamento_atrasos)} procurador(es); '
+            f'{enviados} e-mail(s) enviado(s), {falhas} falha(s), {pulados} procurador(es) já notificado(s) ou sem e-mail. '
+            f'Consultas {duracao_consultas:.2f}s, envio {duracao_envio:.2f}s, total {time.monotonic() - inicio:.2f}s.'
+        )
+        self.stdout.write(self.style.WARNING(mensagem) if falhas else self.style.SUCCESS(mensagem))
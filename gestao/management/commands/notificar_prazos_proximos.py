@@ -0,0 +1,101 @@
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.urls import reverse
+from django.utils import timezone
+from gestao.models import DIAS_ALERTA_PRAZO, STATUS_PENDENTES_PROCURADOR, Documento, NotificacaoEnviada
+from gestao.email_utils import build_absolute_system_url, enviar_emails_em_paralelo
+from gestao.travas import trava_execucao
+
+
+class Command(BaseCommand):
+    help = 'Envia a cada procurador um lembrete consolidado dos processos que vencem nos próximos dias (um lembrete por prazo)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=DIAS_ALERTA_PRAZO, help=f'Processos que vencem até daqui a N dias (padrão: {DIAS_ALERTA_PRAZO})')
+        parser.add_argument('--duracao-trava', type=int, default=30, help='Minutos de validade da trava de execução (padrão: 30)')
+        parser.add_argument('--threads', type=int, default=4, help='Envios de e-mail simultâneos (padrão: 4)')
+
+    def handle(self, *args, **options):
+        with trava_execucao('notificar_prazos_proximos', timedelta(minutes=options['duracao_trava'])) as obtida:
+            if not obtida:
+                self.stdout.write(self.style.WARNING('Outra execução de notificar_prazos_proximos está em andamento; nada a fazer.'))
+                return
+            self.notificar(options)
+
+    def notificar(self, options):
+        inicio = time.monotonic()
+        hoje = timezone.localdate()
+        limite = hoje + timedelta(days=options['dias'])
+
+        # Lembretes já enviados para estes prazos: (procurador, documento, data limite)
+        ja_enviados = set(NotificacaoEnviada.objects.filter(
+            tipo='prazo_proximo', data__range=(hoje, limite)
+        ).values_list('destinatario_id', 'documento_id', 'data'))
+
+        # Faixa de datas no índice (status, data_limite); só tuplas, sem instanciar modelos
+        linhas = Documento.objects.filter(
+            status__in=STATUS_PENDENTES_PROCURADOR,
+            data_limite__range=(hoje, limite),
+            procurador_atribuido__isnull=False,
+        ).exclude(procurador_atribuido__email='').order_by('data_limite', 'id').values_list(
+            'id', 'protocolo', 'data_limite', 'tipo_documento__descricao', 'prioridade__descricao',
+            'procurador_atribuido', 'procurador_atribuido__first_name', 'procurador_atribuido__last_name',
+            'procurador_atribuido__username', 'procurador_atribuido__email',
+        ).iterator(chunk_size=2000)
+
+        grupos = {}
+        total_processos = 0
+        for doc_id, protocolo, data_limite, tipo, prioridade, proc_id, first_name, last_name, username, email in linhas:
+            total_processos += 1
+            if (proc_id, doc_id, data_limite) in ja_enviados:
+                continue
+            if proc_id not in grupos:
+                grupos[proc_id] = {
+                    'nome': f'{first_name} {last_name}'.strip() or username,
+                    'email': email,
+                    'processos': [],
+                }
+            grupos[proc_id]['processos'].append({
+                'documento_id': doc_id,
+                'protocolo': protocolo,
+                'data_limite': data_limite,
+                'dias_restantes': (data_limite - hoje).days,
+                'tipo_documento': tipo,
+                'prioridade': prioridade,
+                'url': build_absolute_system_url(reverse('gestao:documento_detail', args=[doc_id])),
+            })
+        duracao_consultas = time.monotonic() - inicio
+
+        envios = [
+            ((proc_id, grupo['processos']), {
+                'assunto': f"Lembrete: {len(grupo['processos'])} processo(s) com prazo próximo",
+                'template_name': 'emails/prazos_proximos_procurador.html',
+                'contexto': {'nome': grupo['nome'], 'processos': grupo['processos'], 'dias': options['dias'], 'hoje': hoje},
+                'destinatarios': [grupo['email']],
+            })
+            for proc_id, grupo in grupos.items()
+        ]
+
+        enviados = falhas = 0
+        inicio_envio = time.monotonic()
+        for (proc_id, processos), enviado in enviar_emails_em_paralelo(envios, options['threads']):
+            if not enviado:
+                falhas += 1
+                continue
+            enviados += 1
+            por_prazo = defaultdict(list)
+            for processo in processos:
+                por_prazo[processo['data_limite']].append(processo['documento_id'])
+            for data_limite, documento_ids in por_prazo.items():
+                NotificacaoEnviada.registrar('prazo_proximo', data_limite, proc_id, documento_ids)
+        duracao_envio = time.monotonic() - inicio_envio
+
+        mensagem = (
+            f'{total_processos} processo(s) vencendo até {limite:%d/%m/%Y}; '
+            f'{enviados} lembrete(s) enviado(s), {falhas} falha(s). '
+            f'Consultas {duracao_consultas:.2f}s, envio {duracao_envio:.2f}s, total {time.monotonic() - inicio:.2f}s.'
+        )
+        self.stdout.write(self.style.WARNING(mensagem) if falhas else self.style.SUCCESS(mensagem))
@@ -0,0 +1,66 @@
+"""
+Cronometragem por fase das requisições (banco, renderização, leitura de anexos, SMTP)
+
+As fases medidas com `medir()` são acumuladas na requisição corrente e publicadas pelo
+ServerTimingMiddleware no cabeçalho HTTP Server-Timing e nos campos do log.
+Fora de uma requisição (comandos de gerenciamento) as medições são simplesmente ignoradas.
+As fases podem se sobrepor: consultas preguiçosas avaliadas no template contam em 'db' e em 'render'.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# { fase: [tempo_total_ms, quantidade] } da requisição corrente
+_fases = ContextVar('gestao_metricas_fases', default=None)
+
+
+def iniciar_coleta():
+    """ Abre a coleta de fases para a requisição corrente. Retorna o token para encerrar_coleta(). """
+    return _fases.set({})
+
+
+def encerrar_coleta(token):
+    """ Fecha a coleta e devolve as fases acumuladas. """
+    fases = _fases.get() or {}
+    _fases.reset(token)
+    return fases
+
+
+def registrar(fase, duracao_ms):
+    fases = _fases.get()
+    if fases is None:
+        return
+    acumulado = fases.setdefault(fase, [0.0, 0])
+    acumulado[0] += duracao_ms
+    acumulado[1] += 1
+
+
+@contextmanager
+def medir(fase):
+    """
+    Mede o bloco e soma o tempo à fase informada.
+
+    Uso:
+        with medir('smtp'):
+            email.send()
+    """
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        registrar(fase, (time.perf_counter() - inicio) * 1000)
+
+
+def medidor_banco(execute, sql, params, many, context):
+    """ execute_wrapper que soma o tempo das consultas na fase 'db'. """
+    with medir('db'):
+        return execute(sql, params, many, context)
+
+
+def formatar_server_timing(fases, total_ms):
+    """ Monta o valor do cabeçalho Server-Timing (https://www.w3.org/TR/server-timing/). """
+    partes = []
+    for fase, (duracao_ms, quantidade) in fases.items():
+        partes.append(f'{fase};dur={duracao_ms:.1f};desc="{quantidade}x"')
+    partes.append(f'total;dur={total_ms:.1f}')
+    return ', '.join(partes)
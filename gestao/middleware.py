@@ -0,0 +1,199 @@
+"""
+Middlewares de instrumentação de desempenho
+"""
+import json
+import logging
+import random
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from .metricas import encerrar_coleta, formatar_server_timing, iniciar_coleta, medidor_banco
+from .pool_banco import estatisticas_conexoes
+from .replica import COOKIE_ULTIMA_ESCRITA, escopo_requisicao, replica_configurada
+
+logger = logging.getLogger('gestao.desempenho')
+
+# Literais embutidos no SQL (LIMIT/OFFSET, valores de extra() ou RawSQL) viram parâmetros
+_LITERAIS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+# Listas de parâmetros de tamanho variável (IN (%s, %s, ...)) viram uma única forma
+_LISTA_PARAMETROS = re.compile(r'\((?:\s*%s\s*,)*\s*%s\s*\)')
+
+
+def forma_sql(sql):
+    """ Normaliza o SQL parametrizado para agrupar execuções da mesma instrução. """
+    return _LISTA_PARAMETROS.sub('(...)', _LITERAIS.sub('%s', sql))
+
+
+class MonitorConsultas:
+    """ execute_wrapper que conta as consultas, soma o tempo de banco e agrupa as instruções repetidas. """
+
+    def __init__(self):
+        self.total = 0
+        self.tempo_ms = 0.0
+        self.formas = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.tempo_ms += (time.perf_counter() - inicio) * 1000
+            self.total += 1
+            self.formas[forma_sql(sql)] += 1
+
+    def repetidas(self, limite):
+        """ Instruções executadas mais de `limite` vezes na mesma requisição (provável N+1). """
+        return [(sql, vezes) for sql, vezes in self.formas.most_common() if vezes > limite]
+
+
+class InstrumentacaoConsultasMiddleware:
+    """
+    Mede, por requisição amostrada, o número de consultas, o tempo total de banco e as
+    instruções repetidas. Registra um aviso estruturado no logger 'gestao.desempenho' quando
+    a view ultrapassa o orçamento configurado ou repete a mesma instrução mais de N vezes.
+
+    Configuração (settings): GESTAO_INSTRUMENTACAO_AMOSTRAGEM (0.0 a 1.0),
+    GESTAO_ORCAMENTO_CONSULTAS, GESTAO_ORCAMENTO_TEMPO_BANCO_MS e GESTAO_LIMITE_REPETICOES.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.amostragem = getattr(settings, 'GESTAO_INSTRUMENTACAO_AMOSTRAGEM', 1.0)
+        self.orcamento_consultas = getattr(settings, 'GESTAO_ORCAMENTO_CONSULTAS', 40)
+        self.orcamento_tempo_ms = getattr(settings, 'GESTAO_ORCAMENTO_TEMPO_BANCO_MS', 500)
+        self.limite_repeticoes = getattr(settings, 'GESTAO_LIMITE_REPETICOES', 10)
+
+    def __call__(self, request):
+        if self.amostragem <= 0 or random.random() >= self.amostragem:
+            return self.get_response(request)
+
+        monitor = MonitorConsultas()
+        request.monitor_consultas = monitor
+        with ExitStack() as pilha:
+            for conexao in connections.all():
+                pilha.enter_context(conexao.execute_wrapper(monitor))
+            response = self.get_response(request)
+
+        self.avaliar(request, response, monitor)
+        return response
+
+    def avaliar(self, request, response, monitor):
+        repetidas = monitor.repetidas(self.limite_repeticoes)
+        excedeu_consultas = monitor.total > self.orcamento_consultas
+        excedeu_tempo = monitor.tempo_ms > self.orcamento_tempo_ms
+
+        resolver_match = getattr(request, 'resolver_match', None)
+        dados = {
+            'view': resolver_match.view_name if resolver_match else None,
+            'metodo': request.method,
+            'caminho': request.path,
+            'status': response.status_code,
+            'consultas': monitor.total,
+            'tempo_banco_ms': round(monitor.tempo_ms, 1),
+        }
+
+        if not (excedeu_consultas or excedeu_tempo or repetidas):
+            logger.debug("Consultas da requisição: %s", json.dumps(dados, ensure_ascii=False), extra=dados)
+            return
+
+        dados.update({
+            'orcamento_consultas': self.orcamento_consultas,
+            'orcamento_tempo_banco_ms': self.orcamento_tempo_ms,
+            'repetidas': [{'sql': sql[:300], 'vezes': vezes} for sql, vezes in repetidas[:5]],
+        })
+        logger.warning(
+            "Orçamento de consultas excedido ou N+1 detectado: %s", json.dumps(dados, ensure_ascii=False), extra=dados
+        )
+
+
+class ServerTimingMiddleware:
+    """
+    Publica o tempo de cada fase da requisição (db, render, anexos, smtp...) no cabeçalho
+    Server-Timing, visível no DevTools do navegador, e como campos estruturados no log.
+    Requisições acima de GESTAO_LIMITE_LENTIDAO_MS são registradas em nível INFO; as demais em DEBUG.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.limite_lentidao_ms = getattr(settings, 'GESTAO_LIMITE_LENTIDAO_MS', 1000)
+
+    def __call__(self, request):
+        token = iniciar_coleta()
+        inicio = time.perf_counter()
+        try:
+            with ExitStack() as pilha:
+                for conexao in connections.all():
+                    pilha.enter_context(conexao.execute_wrapper(medidor_banco))
+                response = self.get_response(request)
+        finally:
+            fases = encerrar_coleta(token)
+        total_ms = (time.perf_counter() - inicio) * 1000
+
+        response['Server-Timing'] = formatar_server_timing(fases, total_ms)
+
+        resolver_match = getattr(request, 'resolver_match', None)
+        dados = {
+            'view': resolver_match.view_name if resolver_match else None,
+            'metodo': request.method,
+            'caminho': request.path,
+            'status': response.status_code,
+            'total_ms': round(total_ms, 1),
+            'fases': {fase: round(duracao_ms, 1) for fase, (duracao_ms, _) in fases.items()},
+        }
+        nivel = logging.INFO if total_ms > self.limite_lentidao_ms else logging.DEBUG
+        logger.log(nivel, "Tempo por fase: %s", json.dumps(dados, ensure_ascii=False), extra=dados)
+        return response
+
+
+class MetricasConexoesMiddleware:
+    """
+    Registra no logger 'gestao.desempenho', no máximo a cada GESTAO_METRICAS_CONEXOES_INTERVALO_SEGUNDOS
+    por processo, os contadores de conexões com o banco (gestao.pool_banco.estatisticas_conexoes):
+    checkouts, esperas e reconexões do pool, ou conexões abertas nos modos sem pool.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.intervalo = getattr(settings, 'GESTAO_METRICAS_CONEXOES_INTERVALO_SEGUNDOS', 60)
+        self.proximo_registro = time.monotonic() + self.intervalo
+        self.trava = threading.Lock()
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if self.intervalo > 0 and time.monotonic() >= self.proximo_registro and self.trava.acquire(blocking=False):
+            try:
+                self.proximo_registro = time.monotonic() + self.intervalo
+                dados = {'conexoes': estatisticas_conexoes()}
+                logger.info("Conexões com o banco: %s", json.dumps(dados, ensure_ascii=False), extra=dados)
+            finally:
+                self.trava.release()
+        return response
+
+
+class RoteamentoReplicaMiddleware:
+    """
+    Abre o escopo de roteamento da requisição (gestao.replica) e, se ela gravou algo no banco, marca
+    num cookie o momento da escrita: as próximas leituras do usuário ficam no primário por
+    GESTAO_REPLICA_JANELA_SEGUNDOS, enquanto a réplica alcança o que ele acabou de gravar.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with escopo_requisicao() as escopo:
+            response = self.get_response(request)
+        # Sem réplica não há atraso a compensar
+        if escopo['escrita'] and replica_configurada():
+            response.set_cookie(
+                COOKIE_ULTIMA_ESCRITA, str(time.time()),
+                max_age=settings.GESTAO_REPLICA_JANELA_SEGUNDOS,
+                secure=request.is_secure(), httponly=True, samesite='Lax',
+            )
+        return response
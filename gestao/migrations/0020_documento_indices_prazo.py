@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-19 14:29
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("gestao", "0019_anexo_descricao"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="documento",
+            index=models.Index(fields=["data_limite"], name="documento_data_limite_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="documento",
+            index=models.Index(fields=["status", "data_limite"], name="documento_status_limite_idx"),
+        ),
+    ]
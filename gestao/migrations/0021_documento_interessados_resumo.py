@@ -0,0 +1,34 @@
+# Generated by Django 5.2.7 on 2026-10-19 14:29
+
+from django.db import migrations, models
+
+
+def preencher_interessados_resumo(apps, schema_editor):
+    Documento = apps.get_model("gestao", "Documento")
+    Vinculo = Documento.interessados.through
+
+    resumos = {}
+    vinculos = Vinculo.objects.values_list("documento_id", "remetente_id", "remetente__nome_razao_social").order_by(
+        "remetente__nome_razao_social", "remetente_id"
+    )
+    for documento_id, remetente_id, nome in vinculos.iterator(chunk_size=2000):
+        resumos.setdefault(documento_id, []).append({"id": remetente_id, "nome": nome})
+
+    for documento_id, resumo in resumos.items():
+        Documento.objects.filter(pk=documento_id).update(interessados_resumo=resumo)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("gestao", "0020_documento_indices_prazo"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="documento",
+            name="interessados_resumo",
+            field=models.JSONField(blank=True, default=list, editable=False, verbose_name="Resumo dos Interessados"),
+        ),
+        migrations.RunPython(preencher_interessados_resumo, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.7 on 2026-10-19 14:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def preencher_anexo_inicial_principal(apps, schema_editor):
+    Documento = apps.get_model("gestao", "Documento")
+    Anexo = apps.get_model("gestao", "Anexo")
+
+    primeiro_inicial = (
+        Anexo.objects.filter(documento=OuterRef("pk"), tipo_anexo="INICIAL", ativo=True).order_by("pk").values("pk")[:1]
+    )
+    Documento.objects.update(anexo_inicial_principal=Subquery(primeiro_inicial))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("gestao", "0021_documento_interessados_resumo"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="documento",
+            name="anexo_inicial_principal",
+            field=models.ForeignKey(
+                blank=True,
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to="gestao.anexo",
+                verbose_name="Anexo Inicial Principal",
+            ),
+        ),
+        migrations.RunPython(preencher_anexo_inicial_principal, migrations.RunPython.noop),
+    ]
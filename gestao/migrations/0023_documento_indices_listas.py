@@ -0,0 +1,25 @@
+# Generated by Django 5.2.7 on 2026-10-19 14:32
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("gestao", "0022_documento_anexo_inicial_principal"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="documento",
+            index=models.Index(
+                fields=["procurador_atribuido", "status", "data_limite"], name="documento_proc_status_lim_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="documento",
+            index=models.Index(fields=["status", "data_resposta_procurador"], name="documento_status_resposta_idx"),
+        ),
+    ]
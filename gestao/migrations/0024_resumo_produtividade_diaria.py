@@ -0,0 +1,79 @@
+# Generated by Django 5.2.7 on 2026-10-19 14:43
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("gestao", "0023_documento_indices_listas"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ResumoProdutividadeDiaria",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("data", models.DateField(verbose_name="Data")),
+                ("recebidos", models.PositiveIntegerField(default=0, verbose_name="Recebidos")),
+                ("atribuidos", models.PositiveIntegerField(default=0, verbose_name="Atribuídos")),
+                ("respondidos", models.PositiveIntegerField(default=0, verbose_name="Respondidos")),
+                (
+                    "respondidos_com_atraso",
+                    models.PositiveIntegerField(default=0, verbose_name="Respondidos após o prazo"),
+                ),
+                ("finalizados", models.PositiveIntegerField(default=0, verbose_name="Finalizados")),
+                ("em_atraso", models.PositiveIntegerField(default=0, verbose_name="Em atraso no fim do dia")),
+                (
+                    "tempo_resposta_total_horas",
+                    models.FloatField(default=0, verbose_name="Soma dos tempos de resposta (horas)"),
+                ),
+                (
+                    "histograma_resposta",
+                    models.JSONField(blank=True, default=list, verbose_name="Histograma do tempo de resposta (dias)"),
+                ),
+                (
+                    "prioridade",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="+",
+                        to="gestao.nivelprioridade",
+                        verbose_name="Prioridade",
+                    ),
+                ),
+                (
+                    "procurador",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Procurador",
+                    ),
+                ),
+                (
+                    "tipo_documento",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="+",
+                        to="gestao.tipodocumento",
+                        verbose_name="Tipo de Documento",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Resumo Diário de Produtividade",
+                "verbose_name_plural": "Resumos Diários de Produtividade",
+                "indexes": [models.Index(fields=["data", "procurador"], name="resumo_diario_data_proc_idx")],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("data", "procurador", "tipo_documento", "prioridade"), name="resumo_diario_unico"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,96 @@
+# Generated by Django 5.2.7 on 2026-10-19 14:46
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# Melhor estimativa de quando o documento entrou no status atual
+INICIO_POR_STATUS = {
+    "Finalizado": "data_finalizacao",
+    "Aguardando Confirmação": "data_resposta_procurador",
+    "Análise Concluída": "data_resposta_procurador",
+    "Em Análise": "data_atribuicao",
+    "Em Diligência": "data_atribuicao",
+    "Rejeitado": "data_resposta_procurador",
+}
+
+
+def abrir_intervalos_atuais(apps, schema_editor):
+    """O passado não é recuperável: cada documento existente ganha só o intervalo aberto do status atual."""
+    Documento = apps.get_model("gestao", "Documento")
+    IntervaloStatus = apps.get_model("gestao", "IntervaloStatus")
+
+    campos = ["id", "status", "procurador_atribuido_id", "data_recebimento", *set(INICIO_POR_STATUS.values())]
+    lote = []
+    for documento in Documento.objects.values(*campos).iterator(chunk_size=2000):
+        inicio = (
+            documento.get(INICIO_POR_STATUS.get(documento["status"], "data_recebimento"))
+            or documento["data_recebimento"]
+        )
+        lote.append(
+            IntervaloStatus(
+                documento_id=documento["id"],
+                status=documento["status"],
+                procurador_id=documento["procurador_atribuido_id"],
+                inicio=inicio,
+            )
+        )
+        if len(lote) >= 2000:
+            IntervaloStatus.objects.bulk_create(lote)
+            lote = []
+    IntervaloStatus.objects.bulk_create(lote)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("gestao", "0024_resumo_produtividade_diaria"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="IntervaloStatus",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("status", models.CharField(max_length=50, verbose_name="Status")),
+                ("inicio", models.DateTimeField(verbose_name="Início")),
+                ("fim", models.DateTimeField(blank=True, null=True, verbose_name="Fim")),
+                (
+                    "duracao_segundos",
+                    models.PositiveBigIntegerField(blank=True, null=True, verbose_name="Duração (segundos)"),
+                ),
+                (
+                    "documento",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="intervalos_status",
+                        to="gestao.documento",
+                        verbose_name="Documento",
+                    ),
+                ),
+                (
+                    "procurador",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Procurador",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Intervalo de Status",
+                "verbose_name_plural": "Intervalos de Status",
+                "ordering": ["documento", "inicio"],
+                "indexes": [
+                    models.Index(fields=["status", "inicio"], name="intervalo_status_inicio_idx"),
+                    models.Index(fields=["status", "fim"], name="intervalo_status_fim_idx"),
+                    models.Index(fields=["documento", "fim"], name="intervalo_documento_fim_idx"),
+                ],
+            },
+        ),
+        migrations.RunPython(abrir_intervalos_atuais, migrations.RunPython.noop),
+    ]
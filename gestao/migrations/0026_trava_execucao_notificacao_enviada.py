@@ -0,0 +1,74 @@
+# Generated by Django 5.2.7 on 2026-10-19 14:49
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("gestao", "0025_intervalo_status"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TravaExecucao",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("nome", models.CharField(max_length=100, unique=True, verbose_name="Nome")),
+                ("dono", models.CharField(max_length=64, verbose_name="Dono")),
+                ("adquirida_em", models.DateTimeField(verbose_name="Adquirida em")),
+                ("expira_em", models.DateTimeField(verbose_name="Expira em")),
+            ],
+            options={
+                "verbose_name": "Trava de Execução",
+                "verbose_name_plural": "Travas de Execução",
+            },
+        ),
+        migrations.CreateModel(
+            name="NotificacaoEnviada",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                (
+                    "tipo",
+                    models.CharField(
+                        choices=[("atraso_procurador", "Atraso (procurador)"), ("atraso_chefia", "Atraso (chefia)")],
+                        max_length=30,
+                        verbose_name="Tipo",
+                    ),
+                ),
+                ("data", models.DateField(verbose_name="Dia de referência")),
+                ("enviada_em", models.DateTimeField(auto_now_add=True, verbose_name="Enviada em")),
+                (
+                    "destinatario",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Destinatário",
+                    ),
+                ),
+                (
+                    "documento",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="gestao.documento",
+                        verbose_name="Documento",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Notificação Enviada",
+                "verbose_name_plural": "Notificações Enviadas",
+                "indexes": [models.Index(fields=["data"], name="notificacao_enviada_data_idx")],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("tipo", "data", "destinatario", "documento"), name="notificacao_enviada_unica"
+                    )
+                ],
+            },
+        ),
+    ]
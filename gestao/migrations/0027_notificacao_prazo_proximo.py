@@ -0,0 +1,26 @@
+# Generated by Django 5.2.7 on 2026-10-19 14:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("gestao", "0026_trava_execucao_notificacao_enviada"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="notificacaoenviada",
+            name="tipo",
+            field=models.CharField(
+                choices=[
+                    ("atraso_procurador", "Atraso (procurador)"),
+                    ("atraso_chefia", "Atraso (chefia)"),
+                    ("prazo_proximo", "Prazo próximo (procurador)"),
+                ],
+                max_length=30,
+                verbose_name="Tipo",
+            ),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.7 on 2026-10-19 15:10
+
+from django.core.management import call_command
+from django.db import migrations
+
+
+def criar_tabela_cache(apps, schema_editor):
+    # Tabela do DatabaseCache (CACHES em config/settings.py); não faz nada se o backend for outro
+    call_command("createcachetable", database=schema_editor.connection.alias, verbosity=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("gestao", "0027_notificacao_prazo_proximo"),
+    ]
+
+    operations = [
+        migrations.RunPython(criar_tabela_cache, migrations.RunPython.noop),
+    ]
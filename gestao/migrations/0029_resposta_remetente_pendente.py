@@ -0,0 +1,36 @@
+# Generated by Django 5.2.7 on 2026-10-19 15:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("gestao", "0028_tabela_cache"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RespostaRemetentePendente",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("criada_em", models.DateTimeField(auto_now_add=True, verbose_name="Criada em")),
+                ("tentativas", models.PositiveSmallIntegerField(default=0, verbose_name="Tentativas")),
+                ("ultima_tentativa", models.DateTimeField(blank=True, null=True, verbose_name="Última tentativa")),
+                (
+                    "documento",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="gestao.documento",
+                        verbose_name="Documento",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Resposta ao Remetente Pendente",
+                "verbose_name_plural": "Respostas aos Remetentes Pendentes",
+            },
+        ),
+    ]
@@ -1,9 +1,18 @@
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+from django.core import signing
+from django.core.cache import cache
+from django.utils.crypto import salted_hmac
 from django.db import models
+from django.db.models import BooleanField, Case, Func, IntegerField, Q, Value, When
+from django.db.models.functions import Length
 from django.contrib.auth.models import User
 from datetime import datetime, timedelta 
 from django.utils import timezone
 from django.core.validators import FileExtensionValidator
 
+from .cache import invalidar
+
 # Modelo para a tabela: niveis_prioridade
 class NivelPrioridade(models.Model):
     descricao = models.CharField(max_length=50, unique=True, verbose_name="Descrição")
@@ -48,8 +57,170 @@ class Remetente(models.Model):
     class Meta:
         verbose_name = "Remetente"
         verbose_name_plural = "Remetentes"
-        
-        
+
+
+# Colunas efetivamente renderizadas por cada listagem de documentos.
+# Os TextFields (observações e motivos) ficam de fora, salvo quando a tabela os exibe.
+PROJECOES_LISTAGEM = {
+    'distribuicao': (
+        'protocolo', 'status', 'num_doc_origem', 'data_recebimento',
+        'motivo_ultima_devolucao', 'motivo_ultima_reativacao', 'interessados_resumo',
+        'tipo_documento__descricao', 'prioridade__descricao',
+    ),
+    'procurador_dashboard': (
+        'protocolo', 'status', 'data_recebimento', 'data_limite', 'interessados_resumo',
+        'tipo_documento__descricao', 'prioridade__descricao',
+    ),
+    'monitoramento': (
+        'protocolo', 'status', 'num_doc_origem', 'data_limite', 'interessados_resumo',
+        'tipo_documento__descricao', 'prioridade__descricao',
+        'procurador_atribuido__username', 'procurador_atribuido__first_name', 'procurador_atribuido__last_name',
+    ),
+    'confirmacao': (
+        'protocolo', 'status', 'num_doc_origem', 'data_resposta_procurador', 'interessados_resumo',
+        'tipo_documento__descricao', 'prioridade__descricao',
+        'procurador_atribuido__username', 'procurador_atribuido__first_name', 'procurador_atribuido__last_name',
+    ),
+    'busca': (
+        'protocolo', 'status', 'num_doc_origem', 'data_recebimento', 'data_limite', 'data_finalizacao',
+        'interessados_resumo', 'tipo_documento__descricao',
+    ),
+}
+
+
+# Janela (em dias) usada para considerar um prazo como "próximo do vencimento"
+DIAS_ALERTA_PRAZO = 3
+
+# Status em que o processo depende do procurador (card "pendentes" do dashboard, alertas de prazo e atraso)
+STATUS_PENDENTES_PROCURADOR = ['Em Análise', 'Rejeitado', 'Em Diligência']
+
+SITUACAO_PRAZO_CHOICES = [
+    ('atrasado', 'Atrasados'),
+    ('prazo_proximo', f'Vencendo em até {DIAS_ALERTA_PRAZO} dias'),
+    ('no_prazo', 'No prazo'),
+]
+
+
+class DiasAte(Func):
+    """ Número inteiro de dias entre uma data de referência e a coluna informada (coluna - referência). """
+    output_field = IntegerField()
+
+    def __init__(self, expressao, referencia, **extra):
+        super().__init__(expressao, Value(referencia), **extra)
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template='DATEDIFF(%(expressions)s)', **extra_context)
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        # date - date já resulta em inteiro (dias) no PostgreSQL
+        return self.as_sql(compiler, connection, template='(%(expressions)s::date)', arg_joiner=' - ', **extra_context)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler, connection,
+            template='CAST(julianday(%(expressions)s) AS INTEGER)', arg_joiner=') - julianday(',
+            **extra_context
+        )
+
+
+# Grupos que enxergam todos os documentos (busca e consulta)
+PAPEIS_VISAO_GERAL = {'Protocolo', 'Protocolador-Chefe', 'Procurador-Chefe'}
+# Grupos que enxergam e trabalham apenas os documentos atribuídos a si
+PAPEIS_PROCURADOR = {'Procuradores', 'Procurador-Analista'}
+
+
+def _papeis(user, papeis):
+    if papeis is None:
+        papeis = set(user.groups.values_list('name', flat=True))
+    return papeis
+
+
+class DocumentoQuerySet(models.QuerySet):
+
+    def visible_to(self, user, papeis=None):
+        """
+        Documentos que o usuário pode consultar, como um único filtro SQL.
+        `papeis`: nomes dos grupos do usuário (papeis_usuario(request)); sem eles, são lidos do banco.
+        Superusuário, protocolo e chefias veem tudo; procuradores e analistas, só os atribuídos a si.
+        """
+        papeis = _papeis(user, papeis)
+        if user.is_superuser or PAPEIS_VISAO_GERAL & papeis:
+            return self.all()
+        if PAPEIS_PROCURADOR & papeis:
+            return self.filter(procurador_atribuido=user)
+        return self.none()
+
+    def actionable_by(self, user, papeis=None, somente_atribuidos=False):
+        """
+        Documentos em que o usuário pode agir como procurador (tela de análise).
+        Superusuário e Procurador-Chefe agem em todos, a menos que `somente_atribuidos` (ações que só o
+        próprio procurador faz, como a devolução); procuradores e analistas, só nos atribuídos a si.
+        """
+        papeis = _papeis(user, papeis)
+        if not somente_atribuidos and (user.is_superuser or 'Procurador-Chefe' in papeis):
+            return self.all()
+        if PAPEIS_PROCURADOR & papeis:
+            return self.filter(procurador_atribuido=user)
+        return self.none()
+
+    def para_listagem(self, listagem):
+        """
+        Restringe o SELECT às colunas que a listagem informada exibe,
+        trazendo os campos de exibição das FKs no mesmo JOIN (select_related + only).
+        """
+        campos = PROJECOES_LISTAGEM[listagem]
+        relacionados = sorted({campo.split('__')[0] for campo in campos if '__' in campo})
+        return self.select_related(*relacionados).only(*campos)
+
+    def com_prazos(self, dias_alerta=DIAS_ALERTA_PRAZO):
+        """
+        Anota `dias_restantes`, `atrasado` e `prazo_proximo` calculados no banco
+        contra timezone.localdate(), permitindo ordenar pelas anotações.
+        """
+        hoje = timezone.localdate()
+        em_aberto = Q(data_limite__isnull=False, data_finalizacao__isnull=True)
+        return self.annotate(
+            dias_restantes=DiasAte('data_limite', hoje),
+            atrasado=Case(
+                When(em_aberto & Q(data_limite__lt=hoje), then=Value(True)),
+                default=Value(False),
+                output_field=BooleanField(),
+            ),
+            prazo_proximo=Case(
+                When(em_aberto & Q(data_limite__range=(hoje, hoje + timedelta(days=dias_alerta))), then=Value(True)),
+                default=Value(False),
+                output_field=BooleanField(),
+            ),
+        )
+
+    def ordenar_por_urgencia(self, dias_alerta=DIAS_ALERTA_PRAZO):
+        """
+        Ordena por urgência, calculada no SQL: atrasados primeiro, depois pelo prazo
+        da prioridade (menor prazo = mais urgente) e pelos dias restantes.
+        """
+        return self.com_prazos(dias_alerta).order_by(
+            '-atrasado',
+            'prioridade__prazo_dias',
+            models.F('dias_restantes').asc(nulls_last=True),
+            'id',
+        )
+
+    def filtrar_prazo(self, situacao, dias_alerta=DIAS_ALERTA_PRAZO):
+        """
+        Filtra pela situação do prazo (ver SITUACAO_PRAZO_CHOICES) usando apenas
+        comparações diretas em `data_limite`, para que o índice da coluna seja aproveitado.
+        """
+        hoje = timezone.localdate()
+        abertos = self.filter(data_limite__isnull=False, data_finalizacao__isnull=True)
+        if situacao == 'atrasado':
+            return abertos.filter(data_limite__lt=hoje)
+        if situacao == 'prazo_proximo':
+            return abertos.filter(data_limite__range=(hoje, hoje + timedelta(days=dias_alerta)))
+        if situacao == 'no_prazo':
+            return abertos.filter(data_limite__gt=hoje + timedelta(days=dias_alerta))
+        return self
+
+
 # Modelo para a tabela principal: documentos
 class Documento(models.Model):
     STATUS_CHOICES = [
@@ -72,6 +243,10 @@ class Documento(models.Model):
     )
     
    
+    # Cópia compacta de `interessados` ([{"id": ..., "nome": ...}]) mantida pelo m2m_changed,
+    # usada pelas listagens para exibir as badges sem o prefetch do ManyToMany
+    interessados_resumo = models.JSONField(default=list, blank=True, editable=False, verbose_name="Resumo dos Interessados")
+
     notificar_remetente = models.BooleanField(default=False, verbose_name="Notificar Remetente na Finalização?")
     tipo_documento = models.ForeignKey(TipoDocumento, on_delete=models.PROTECT, verbose_name="Tipo de Documento")
     prioridade = models.ForeignKey(NivelPrioridade, on_delete=models.PROTECT, verbose_name="Prioridade")
@@ -98,7 +273,33 @@ class Documento(models.Model):
     motivo_ultima_devolucao = models.TextField(blank=True, null=True, verbose_name="Motivo da Última Devolução")
     motivo_ultima_reativacao = models.TextField(blank=True, null=True, verbose_name="Motivo da Última Reativação")
     motivo_rejeicao_analista = models.TextField(blank=True, null=True, verbose_name="Motivo da Rejeição (Analista)")
-    
+
+    # Primeiro anexo INICIAL ativo, mantido pelos signals de Anexo (links de e-mail sem consulta extra)
+    anexo_inicial_principal = models.ForeignKey(
+        'Anexo',
+        on_delete=models.SET_NULL,
+        related_name='+',
+        blank=True, null=True,
+        editable=False,
+        verbose_name="Anexo Inicial Principal"
+    )
+
+    objects = DocumentoQuerySet.as_manager()
+
+    @property
+    def url_anexo_inicial(self):
+        """ URL do anexo inicial principal (use select_related('anexo_inicial_principal') para evitar a consulta). """
+        if self.anexo_inicial_principal_id and self.anexo_inicial_principal.arquivo:
+            return self.anexo_inicial_principal.arquivo.url
+        return None
+
+    def atualizar_anexo_inicial_principal(self):
+        """ Reaponta `anexo_inicial_principal` para o primeiro anexo INICIAL ativo do documento. """
+        primeiro_id = self.anexos.filter(tipo_anexo='INICIAL', ativo=True).order_by('pk').values_list('pk', flat=True).first()
+        if primeiro_id != self.anexo_inicial_principal_id:
+            Documento.objects.filter(pk=self.pk).update(anexo_inicial_principal_id=primeiro_id)
+            self.anexo_inicial_principal_id = primeiro_id
+
     @property
     def esta_atrasado(self):
         if self.data_limite and not self.data_finalizacao:
@@ -108,9 +309,45 @@ class Documento(models.Model):
     def __str__(self):
         return self.protocolo
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Guarda os valores lidos do banco: o signal de IntervaloStatus detecta a transição sem nova consulta
+        if 'status' in instance.__dict__:
+            instance._status_carregado = instance.status
+        if 'procurador_atribuido_id' in instance.__dict__:
+            instance._procurador_carregado = instance.procurador_atribuido_id
+        return instance
+
+    @classmethod
+    def atualizar_interessados_resumo(cls, documento_ids):
+        """ Recalcula `interessados_resumo` dos documentos informados com uma única leitura da tabela M2M. """
+        documento_ids = set(documento_ids)
+        if not documento_ids:
+            return
+        resumos = {documento_id: [] for documento_id in documento_ids}
+        vinculos = cls.interessados.through.objects.filter(
+            documento_id__in=documento_ids
+        ).values_list('documento_id', 'remetente_id', 'remetente__nome_razao_social').order_by(
+            'remetente__nome_razao_social', 'remetente_id'
+        )
+        for documento_id, remetente_id, nome in vinculos:
+            resumos[documento_id].append({'id': remetente_id, 'nome': nome})
+        for documento_id, resumo in resumos.items():
+            # update() direto: não dispara o save() (protocolo/data_limite) nem altera outras colunas
+            cls.objects.filter(pk=documento_id).update(interessados_resumo=resumo)
+
     class Meta:
         verbose_name = "Documento"
         verbose_name_plural = "Documentos"
+        indexes = [
+            # Filtros de prazo (atrasados / vencendo) na busca e no monitoramento
+            models.Index(fields=['data_limite'], name='documento_data_limite_idx'),
+            models.Index(fields=['status', 'data_limite'], name='documento_status_limite_idx'),
+            # Mesa de trabalho do procurador e lista de confirmação (paginadas)
+            models.Index(fields=['procurador_atribuido', 'status', 'data_limite'], name='documento_proc_status_lim_idx'),
+            models.Index(fields=['status', 'data_resposta_procurador'], name='documento_status_resposta_idx'),
+        ]
 
 
     def save(self, *args, **kwargs):
@@ -119,7 +356,10 @@ class Documento(models.Model):
             hoje = timezone.localdate()
             prefixo = hoje.strftime('%Y-%m-%d')
             
-            ultimo_doc_hoje = Documento.objects.filter(protocolo__startswith=prefixo).order_by('-protocolo').first()
+            # Maior sequencial numericamente: com mais de 999 no dia, '1000' vem antes de '999' na ordem de texto
+            ultimo_doc_hoje = Documento.objects.filter(protocolo__startswith=prefixo).order_by(
+                Length('protocolo').desc(), '-protocolo'
+            ).first()
             
             sequencial = 1
             if ultimo_doc_hoje:
@@ -131,7 +371,7 @@ class Documento(models.Model):
                     # Se houver erro ao extrair, volta para 1 por segurança
                     sequencial = 1
                     
-            # Formata o sequencial com 3 dígitos (001, 002, ..., 010, ..., 100)
+            # Formata o sequencial com ao menos 3 dígitos (001, 002, ..., 010, ..., 100, ..., 1000)
             sequencial_formatado = f"{sequencial:03d}" 
             
             self.protocolo = f"{prefixo}-{sequencial_formatado}"
@@ -148,30 +388,6 @@ class Documento(models.Model):
         super().save(*args, **kwargs)
 
 
-@property
-def first_initial_attachment_url(self):
-    """ Retorna a URL do primeiro anexo do tipo 'INICIAL', ou None se não houver. """
-        
-        # --- DEBUGGING ---
-    print(f"--- Verificando anexos para Doc ID: {self.pk}, Protocolo: {self.protocolo} ---")
-    todos_anexos = self.anexos.all()
-    print(f"Total de anexos encontrados: {todos_anexos.count()}")
-    for a in todos_anexos:
-        print(f"  - Anexo ID: {a.pk}, Tipo: '{a.tipo_anexo}', Arquivo: {a.arquivo.name}")
-        # --- FIM DEBUGGING ---
-
-        # Filtra os anexos deste documento pelo tipo
-    first_anexo = self.anexos.filter(tipo_anexo='INICIAL').first() 
-        
-        # --- DEBUGGING ---
-    if first_anexo:
-        print(f"==> Encontrado anexo INICIAL: ID {first_anexo.pk}, URL: {first_anexo.arquivo.url}")
-        return first_anexo.arquivo.url
-    else:
-        print(f"==> Nenhum anexo INICIAL encontrado.")
-        return None
-        # --- FIM DEBUGGING ---
-
 class Anexo(models.Model):
     TIPO_CHOICES = [
         ('INICIAL', 'Documento Inicial'),
@@ -199,12 +415,98 @@ class Anexo(models.Model):
         verbose_name = "Anexo"
         verbose_name_plural = "Anexos"
 
+class PinBloqueado(Exception):
+    """ Tentativas erradas demais: o PIN nem é conferido até o bloqueio expirar. """
+
+
 class Profile(models.Model):
+    """
+    O PIN de autorização é guardado com o hasher padrão (PBKDF2, caro de propósito). Por isso ele é
+    conferido uma vez e troca-se por uma autorização assinada de curta duração (`emitir_autorizacao_pin`),
+    reaproveitada nas confirmações seguintes da sessão. As tentativas erradas são contadas no cache
+    e, passado o limite, recusadas sem rodar o hasher.
+    """
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="profile")
     pin_autorizacao = models.CharField(max_length=128, blank=True, null=True, verbose_name="PIN de Autorização (Criptografado)")
 
+    SALT_AUTORIZACAO_PIN = 'gestao.profile.pin'
+
     def __str__(self):
         return self.user.username
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Valor lido do banco: o signal do User só grava o Profile se ele mudou
+        if 'pin_autorizacao' in instance.__dict__:
+            instance._pin_carregado = instance.pin_autorizacao
+        return instance
+
+    def alterado(self):
+        """ True se o Profile ainda não existe no banco ou foi modificado desde que foi lido. """
+        return self._state.adding or getattr(self, '_pin_carregado', None) != self.pin_autorizacao
+
+    def definir_pin(self, pin):
+        """ Grava o novo PIN. Autorizações emitidas com o PIN anterior deixam de valer. """
+        self.pin_autorizacao = make_password(pin)
+        self.save(update_fields=['pin_autorizacao'])
+
+    def _chave_tentativas_pin(self):
+        return f'gestao:pin:tentativas:{self.user_id}'
+
+    @staticmethod
+    def formato_pin_valido(pin):
+        """ O PIN tem exatamente 4 algarismos. """
+        return bool(pin) and len(pin) == 4 and pin.isascii() and pin.isdigit()
+
+    def verificar_pin(self, pin):
+        """
+        Confere o PIN digitado. Retorna True/False; levanta PinBloqueado se o limite de erros foi atingido.
+        Só um PIN bem formado e diferente do cadastrado conta como tentativa errada.
+        """
+        chave = self._chave_tentativas_pin()
+        if cache.get(chave, 0) >= settings.GESTAO_PIN_MAX_TENTATIVAS:
+            raise PinBloqueado()
+        if not self.pin_autorizacao or not self.formato_pin_valido(pin):
+            return False
+        if check_password(pin, self.pin_autorizacao):
+            cache.delete(chave)
+            return True
+        # add() não sobrescreve: a janela de bloqueio conta a partir do primeiro erro
+        cache.add(chave, 0, settings.GESTAO_PIN_BLOQUEIO_SEGUNDOS)
+        try:
+            cache.incr(chave)
+        except ValueError:
+            cache.set(chave, 1, settings.GESTAO_PIN_BLOQUEIO_SEGUNDOS)
+        return False
+
+    @classmethod
+    def impressao_pin(cls, pin_hash):
+        """
+        Resumo do hash do PIN que amarra as autorizações a ele: trocar o PIN invalida as anteriores.
+        Pode ficar na sessão (gestao/papeis.py) no lugar do hash.
+        """
+        if not pin_hash:
+            return None
+        return salted_hmac(cls.SALT_AUTORIZACAO_PIN, pin_hash).hexdigest()[:16]
+
+    def emitir_autorizacao_pin(self):
+        """ Autorização assinada (com data) emitida após um PIN correto. """
+        dados = {'u': self.user_id, 'p': self.impressao_pin(self.pin_autorizacao)}
+        return signing.dumps(dados, salt=self.SALT_AUTORIZACAO_PIN, compress=True)
+
+    @classmethod
+    def autorizacao_pin_confere(cls, autorizacao, user_id, impressao):
+        if not autorizacao or not impressao:
+            return False
+        try:
+            dados = signing.loads(autorizacao, salt=cls.SALT_AUTORIZACAO_PIN, max_age=settings.GESTAO_PIN_VALIDADE_SEGUNDOS)
+        except signing.BadSignature:
+            return False
+        return dados.get('u') == user_id and dados.get('p') == impressao
+
+    def autorizacao_pin_valida(self, autorizacao):
+        return self.autorizacao_pin_confere(autorizacao, self.user_id, self.impressao_pin(self.pin_autorizacao))
     
 
 class HistoricoEdicao(models.Model):
@@ -239,4 +541,201 @@ class SolicitacaoDocumento(models.Model):
     data_resposta = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
-        return f"Diligência {self.id} - {self.documento.protocolo}"
\ No newline at end of file
+        return f"Diligência {self.id} - {self.documento.protocolo}"
+
+# Histograma do tempo de resposta: uma faixa por dia (0 a 30) e a última para "mais de 30 dias"
+FAIXAS_TEMPO_RESPOSTA = 32
+
+
+class ResumoProdutividadeDiaria(models.Model):
+    """
+    Consolidação diária por procurador, tipo de documento e prioridade, lida pelos indicadores da chefia.
+    Mantida apenas pelo comando `atualizar_resumos_diarios` (ver gestao/produtividade.py).
+    Contagens e somas podem ser agregadas por qualquer período; os percentis saem da soma dos histogramas.
+    """
+    data = models.DateField(verbose_name="Data")
+    procurador = models.ForeignKey(User, on_delete=models.PROTECT, related_name='+', blank=True, null=True, verbose_name="Procurador")
+    tipo_documento = models.ForeignKey(TipoDocumento, on_delete=models.PROTECT, related_name='+', verbose_name="Tipo de Documento")
+    prioridade = models.ForeignKey(NivelPrioridade, on_delete=models.PROTECT, related_name='+', verbose_name="Prioridade")
+
+    recebidos = models.PositiveIntegerField(default=0, verbose_name="Recebidos")
+    atribuidos = models.PositiveIntegerField(default=0, verbose_name="Atribuídos")
+    respondidos = models.PositiveIntegerField(default=0, verbose_name="Respondidos")
+    respondidos_com_atraso = models.PositiveIntegerField(default=0, verbose_name="Respondidos após o prazo")
+    finalizados = models.PositiveIntegerField(default=0, verbose_name="Finalizados")
+    # Retrato do fim do dia: atribuídos, sem resposta e com a data limite vencida
+    em_atraso = models.PositiveIntegerField(default=0, verbose_name="Em atraso no fim do dia")
+
+    tempo_resposta_total_horas = models.FloatField(default=0, verbose_name="Soma dos tempos de resposta (horas)")
+    histograma_resposta = models.JSONField(default=list, blank=True, verbose_name="Histograma do tempo de resposta (dias)")
+
+    class Meta:
+        verbose_name = "Resumo Diário de Produtividade"
+        verbose_name_plural = "Resumos Diários de Produtividade"
+        constraints = [
+            models.UniqueConstraint(fields=['data', 'procurador', 'tipo_documento', 'prioridade'], name='resumo_diario_unico'),
+        ]
+        indexes = [
+            models.Index(fields=['data', 'procurador'], name='resumo_diario_data_proc_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.data} - {self.procurador_id} / {self.tipo_documento_id} / {self.prioridade_id}"
+
+
+class IntervaloStatusQuerySet(models.QuerySet):
+
+    def no_periodo(self, inicio, fim):
+        """ Intervalos que se sobrepõem a [inicio, fim) (os abertos contam até agora). """
+        return self.filter(inicio__lt=fim).filter(Q(fim__isnull=True) | Q(fim__gt=inicio))
+
+    def resumo_por_status(self):
+        """ Quantidade, duração média e máxima (em segundos) dos intervalos encerrados, por status. """
+        return self.filter(fim__isnull=False).values('status').annotate(
+            quantidade=models.Count('id'),
+            duracao_media=models.Avg('duracao_segundos'),
+            duracao_maxima=models.Max('duracao_segundos'),
+        ).order_by('status')
+
+
+class IntervaloStatus(models.Model):
+    """
+    Tempo em cada status: uma linha por período em que o documento ficou num status (com o
+    procurador de então). Só recebe inserções; a única alteração é o fechamento do intervalo
+    corrente (`fim` e `duracao_segundos`) na transição seguinte. Devoluções, rejeições,
+    reativações e diligências deixam de apagar o passado, e os relatórios de SLA viram GROUP BY.
+    """
+    documento = models.ForeignKey(Documento, on_delete=models.CASCADE, related_name='intervalos_status', verbose_name="Documento")
+    status = models.CharField(max_length=50, verbose_name="Status")
+    procurador = models.ForeignKey(User, on_delete=models.SET_NULL, related_name='+', blank=True, null=True, verbose_name="Procurador")
+    inicio = models.DateTimeField(verbose_name="Início")
+    fim = models.DateTimeField(blank=True, null=True, verbose_name="Fim")
+    duracao_segundos = models.PositiveBigIntegerField(blank=True, null=True, verbose_name="Duração (segundos)")
+
+    objects = IntervaloStatusQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "Intervalo de Status"
+        verbose_name_plural = "Intervalos de Status"
+        ordering = ['documento', 'inicio']
+        indexes = [
+            # Relatórios por status e período
+            models.Index(fields=['status', 'inicio'], name='intervalo_status_inicio_idx'),
+            models.Index(fields=['status', 'fim'], name='intervalo_status_fim_idx'),
+            # Intervalo aberto de cada documento (fechado na próxima transição)
+            models.Index(fields=['documento', 'fim'], name='intervalo_documento_fim_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.documento_id} - {self.status} ({self.inicio:%d/%m/%Y %H:%M})"
+
+    @classmethod
+    def registrar_transicoes(cls, transicoes, momento=None):
+        """
+        Fecha o intervalo aberto e abre um novo para cada documento.
+        `transicoes`: iterável de (documento_id, novo_status, procurador_id). Consultas fixas, qualquer que seja o volume.
+        """
+        transicoes = list(transicoes)
+        if not transicoes:
+            return
+        momento = momento or timezone.now()
+
+        abertos = list(cls.objects.filter(
+            documento_id__in=[documento_id for documento_id, _, _ in transicoes], fim__isnull=True
+        ).only('id', 'inicio'))
+        for intervalo in abertos:
+            intervalo.fim = momento
+            intervalo.duracao_segundos = max(int((momento - intervalo.inicio).total_seconds()), 0)
+        cls.objects.bulk_update(abertos, ['fim', 'duracao_segundos'], batch_size=500)
+
+        cls.objects.bulk_create([
+            cls(documento_id=documento_id, status=status, procurador_id=procurador_id, inicio=momento)
+            for documento_id, status, procurador_id in transicoes
+        ], batch_size=500)
+        # Contadores do painel e listas derivadas dos documentos (gestao/cache.py)
+        invalidar('painel')
+
+
+
+class TravaExecucao(models.Model):
+    """
+    Trava com prazo (lease) para comandos agendados: no Cloud Run o mesmo job pode disparar mais de
+    uma vez ou em várias instâncias. Quem tem a trava grava o seu `dono`; uma trava vencida
+    (instância que morreu no meio) pode ser tomada por outra execução. Ver gestao/travas.py.
+    """
+    nome = models.CharField(max_length=100, unique=True, verbose_name="Nome")
+    dono = models.CharField(max_length=64, verbose_name="Dono")
+    adquirida_em = models.DateTimeField(verbose_name="Adquirida em")
+    expira_em = models.DateTimeField(verbose_name="Expira em")
+
+    class Meta:
+        verbose_name = "Trava de Execução"
+        verbose_name_plural = "Travas de Execução"
+
+    def __str__(self):
+        return f"{self.nome} (até {self.expira_em:%d/%m/%Y %H:%M})"
+
+
+class NotificacaoEnviada(models.Model):
+    """
+    Registro dos alertas já enviados: uma linha por (tipo, dia, destinatário, documento).
+    Nos alertas de prazo próximo o "dia" é a data limite do documento (um lembrete por prazo).
+    Os comandos de notificação consultam o registro antes de enviar e gravam logo após cada
+    envio bem-sucedido; uma nova execução no mesmo dia só reenvia o que faltou.
+    """
+    TIPO_CHOICES = [
+        ('atraso_procurador', 'Atraso (procurador)'),
+        ('atraso_chefia', 'Atraso (chefia)'),
+        ('prazo_proximo', 'Prazo próximo (procurador)'),
+    ]
+
+    tipo = models.CharField(max_length=30, choices=TIPO_CHOICES, verbose_name="Tipo")
+    data = models.DateField(verbose_name="Dia de referência")
+    destinatario = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+', verbose_name="Destinatário")
+    documento = models.ForeignKey(Documento, on_delete=models.CASCADE, related_name='+', verbose_name="Documento")
+    enviada_em = models.DateTimeField(auto_now_add=True, verbose_name="Enviada em")
+
+    class Meta:
+        verbose_name = "Notificação Enviada"
+        verbose_name_plural = "Notificações Enviadas"
+        constraints = [
+            models.UniqueConstraint(fields=['tipo', 'data', 'destinatario', 'documento'], name='notificacao_enviada_unica'),
+        ]
+        indexes = [
+            models.Index(fields=['data'], name='notificacao_enviada_data_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.tipo} - {self.destinatario_id} / {self.documento_id} ({self.data:%d/%m/%Y})"
+
+    @classmethod
+    def ja_enviadas(cls, tipo, data):
+        """ Pares (destinatario_id, documento_id) já notificados no dia. """
+        return set(cls.objects.filter(tipo=tipo, data=data).values_list('destinatario_id', 'documento_id'))
+
+    @classmethod
+    def registrar(cls, tipo, data, destinatario_id, documento_ids):
+        cls.objects.bulk_create(
+            [cls(tipo=tipo, data=data, destinatario_id=destinatario_id, documento_id=documento_id) for documento_id in documento_ids],
+            batch_size=1000,
+            ignore_conflicts=True,
+        )
+
+
+class RespostaRemetentePendente(models.Model):
+    """
+    Fila das respostas aos remetentes (ver gestao/respostas.py): a linha é gravada na mesma transação
+    que finaliza o documento e apagada quando o e-mail sai. O que não saiu (falha no SMTP, instância
+    encerrada antes do envio) continua aqui até o comando `enviar_respostas_pendentes` reenviar.
+    """
+    documento = models.OneToOneField(Documento, on_delete=models.CASCADE, related_name='+', verbose_name="Documento")
+    criada_em = models.DateTimeField(auto_now_add=True, verbose_name="Criada em")
+    tentativas = models.PositiveSmallIntegerField(default=0, verbose_name="Tentativas")
+    ultima_tentativa = models.DateTimeField(blank=True, null=True, verbose_name="Última tentativa")
+
+    class Meta:
+        verbose_name = "Resposta ao Remetente Pendente"
+        verbose_name_plural = "Respostas aos Remetentes Pendentes"
+
+    def __str__(self):
+        return f"{self.documento_id} ({self.tentativas} tentativa(s))"
@@ -0,0 +1,94 @@
+"""
+Grupos (papéis) do usuário e resumo do seu PIN guardados na sessão
+
+As checagens de permissão das views e dos templates consultavam `user.groups` a cada uso
+(várias vezes por página). Aqui os grupos são lidos uma vez e guardados na sessão por
+GESTAO_PAPEIS_VALIDADE_SEGUNDOS; dentro da requisição ficam memorizados no próprio request.
+
+    if 'Procurador-Chefe' in papeis_usuario(request): ...
+    {% if 'Protocolo' in papeis_usuario %} (context processor gestao.context_processors.papeis)
+
+Invalidação: o login troca a sessão; `invalidar_papeis(request)` descarta a cópia da sessão atual.
+Cada usuário tem ainda uma versão no cache compartilhado (namespace `papeis:<id>`, gestao/cache.py),
+trocada pelos signals quando seus grupos ou seu PIN mudam (inclusive pelo admin, em outra sessão):
+a cópia guardada com outra versão é recarregada na requisição seguinte de todas as sessões dele.
+"""
+import time
+
+from django.conf import settings
+
+from .cache import invalidar, versao
+from .models import Profile
+
+SESSAO_PAPEIS = 'gestao_papeis'
+
+
+def _namespace_usuario(user_id):
+    return f'papeis:{user_id}'
+
+
+def _dados_usuario(request):
+    dados = getattr(request, '_gestao_papeis', None)
+    if dados is not None:
+        return dados
+
+    user = request.user
+    if not user.is_authenticated:
+        dados = {'grupos': [], 'impressao_pin': None}
+    else:
+        dados = request.session.get(SESSAO_PAPEIS)
+        validade = settings.GESTAO_PAPEIS_VALIDADE_SEGUNDOS
+        versao_atual = versao(_namespace_usuario(user.pk)) if validade > 0 else None
+        if (
+            not dados
+            or dados.get('u') != user.pk
+            or dados.get('v') != versao_atual
+            or time.time() - dados.get('t', 0) > validade
+        ):
+            pin_hash = Profile.objects.filter(user=user).values_list('pin_autorizacao', flat=True).first()
+            dados = {
+                'u': user.pk,
+                'v': versao_atual,
+                't': time.time(),
+                'grupos': sorted(user.groups.values_list('name', flat=True)),
+                'impressao_pin': Profile.impressao_pin(pin_hash),
+            }
+            if validade > 0:
+                request.session[SESSAO_PAPEIS] = dados
+    request._gestao_papeis = dados
+    return dados
+
+
+def papeis_usuario(request):
+    """ Nomes dos grupos do usuário logado (frozenset). """
+    papeis = getattr(request, '_gestao_papeis_nomes', None)
+    if papeis is None:
+        papeis = request._gestao_papeis_nomes = frozenset(_dados_usuario(request)['grupos'])
+    return papeis
+
+
+def assinatura_papeis(request):
+    """
+    Texto que identifica o conjunto de papéis (grupos + superusuário), para as chaves dos fragmentos
+    de template em cache: usuários com os mesmos papéis veem o mesmo menu e compartilham o fragmento.
+    """
+    prefixo = 'su:' if request.user.is_superuser else ''
+    return prefixo + ','.join(sorted(papeis_usuario(request)))
+
+
+def impressao_pin_usuario(request):
+    """ Profile.impressao_pin() do PIN atual do usuário (None se não houver PIN definido). """
+    return _dados_usuario(request)['impressao_pin']
+
+
+def invalidar_papeis_usuario(user_id):
+    """ Faz todas as sessões do usuário recarregarem grupos e PIN na próxima requisição. """
+    invalidar(_namespace_usuario(user_id))
+
+
+def invalidar_papeis(request):
+    """ Descarta a cópia da sessão atual (as demais sessões do usuário seguem a versão, acima). """
+    request.session.pop(SESSAO_PAPEIS, None)
+    for atributo in ('_gestao_papeis', '_gestao_papeis_nomes'):
+        if hasattr(request, atributo):
+            delattr(request, atributo)
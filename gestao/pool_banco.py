@@ -0,0 +1,207 @@
+"""
+Reaproveitamento de conexões com o banco (conexões persistentes e pool) e métricas de uso
+
+Sem isso cada requisição abre uma conexão nova com o Cloud SQL (handshake e autenticação no socket).
+Os modos são escolhidos por variáveis de ambiente (DB_CONN_MAX_AGE, DB_POOL... em config/settings.py):
+
+- conexões persistentes (padrão): cada thread do gunicorn reaproveita a sua conexão por CONN_MAX_AGE
+  segundos, e CONN_HEALTH_CHECKS a verifica no início de cada requisição;
+- DB_POOL com PostgreSQL: pool nativo do Django (psycopg 3 + psycopg_pool);
+- DB_POOL com MySQL: ENGINE 'gestao.pool_mysql', o backend do mysqlclient devolvendo as conexões a um
+  PoolConexoes deste módulo em vez de fechá-las.
+
+`estatisticas_conexoes()` reúne os contadores de todos os aliases no mesmo formato (checkouts, esperas,
+reconexões...); o MetricasConexoesMiddleware os registra periodicamente no logger 'gestao.desempenho'.
+Os contadores são por processo (cada worker do gunicorn tem os seus).
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from collections import Counter
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.db.utils import OperationalError
+from django.dispatch import receiver
+
+logger = logging.getLogger('gestao.desempenho')
+
+# Intervalo de espera entre tentativas quando o pool está cheio (uma conexão descartada libera vaga sem voltar à fila)
+ESPERA_INTERVALO = 0.1
+
+# connect() por alias: nos modos sem pool, cada um é uma conexão nova (handshake) com o banco
+_conexoes_abertas = Counter()
+
+_pools = {}
+_pools_trava = threading.Lock()
+
+
+@receiver(connection_created)
+def contar_conexao_aberta(sender, connection, **kwargs):
+    _conexoes_abertas[connection.alias] += 1
+
+
+class PoolEsgotado(OperationalError):
+    """ Nenhuma conexão do pool ficou livre dentro do tempo limite. """
+
+
+class PoolConexoes:
+    """
+    Pool de conexões DB-API de um alias, seguro entre threads.
+    As conexões livres ficam numa pilha (a mais recente é reaproveitada primeiro); no máximo `max_size`
+    existem ao mesmo tempo, e quem pede além disso espera até `timeout` segundos por uma devolução.
+    Conexões mais velhas que `max_lifetime` segundos são fechadas em vez de reaproveitadas.
+    """
+
+    def __init__(self, alias, max_size=5, timeout=10, max_lifetime=1800, **opcoes_ignoradas):
+        self.alias = alias
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.pid = os.getpid()
+        self.contadores = Counter()
+        self._livres = queue.LifoQueue()
+        self._total = 0
+        self._trava = threading.Lock()
+
+    def _contar(self, **incrementos):
+        with self._trava:
+            self.contadores.update(incrementos)
+
+    def _descartar(self, conexao, motivo):
+        with self._trava:
+            self._total -= 1
+            self.contadores[motivo] += 1
+        try:
+            conexao.close()
+        except Exception:
+            pass
+
+    def obter(self, criar, verificar=None):
+        """
+        Devolve (conexao, criada_em). `criar()` abre uma conexão nova; `verificar(conexao)`, se informada,
+        deve levantar uma exceção quando a conexão livre não serve mais (ela é descartada e outra é usada).
+        """
+        inicio = time.monotonic()
+        esperou = False
+        while True:
+            try:
+                conexao, criada_em = self._livres.get_nowait()
+            except queue.Empty:
+                with self._trava:
+                    if self._total < self.max_size:
+                        self._total += 1
+                        break
+                esperou = True
+                restante = self.timeout - (time.monotonic() - inicio)
+                if restante <= 0:
+                    self._contar(esgotado=1)
+                    logger.warning(
+                        "Pool de conexões '%s' esgotado: as %s conexões seguiram em uso por %ss", self.alias, self.max_size, self.timeout
+                    )
+                    raise PoolEsgotado(f"Nenhuma conexão livre no pool '{self.alias}' após {self.timeout}s.")
+                try:
+                    conexao, criada_em = self._livres.get(timeout=min(restante, ESPERA_INTERVALO))
+                except queue.Empty:
+                    continue
+
+            if self.max_lifetime and time.time() - criada_em > self.max_lifetime:
+                self._descartar(conexao, 'descartadas_idade')
+                continue
+            if verificar is not None:
+                try:
+                    verificar(conexao)
+                except Exception:
+                    # Conexão derrubada pelo servidor (wait_timeout, reinício, failover): abre ou pega outra
+                    self._descartar(conexao, 'reconexoes')
+                    continue
+            self._registrar_checkout(inicio, esperou, reaproveitada=True)
+            return conexao, criada_em
+
+        try:
+            conexao = criar()
+        except Exception:
+            with self._trava:
+                self._total -= 1
+            raise
+        self._registrar_checkout(inicio, esperou, reaproveitada=False)
+        return conexao, time.time()
+
+    def _registrar_checkout(self, inicio, esperou, reaproveitada):
+        espera_ms = (time.monotonic() - inicio) * 1000 if esperou else 0
+        self._contar(
+            checkouts=1,
+            reaproveitadas=1 if reaproveitada else 0,
+            criadas=0 if reaproveitada else 1,
+            esperas=1 if esperou else 0,
+            espera_total_ms=round(espera_ms),
+        )
+
+    def devolver(self, conexao, criada_em, descartar=False):
+        """ Devolve a conexão ao pool (ou a fecha, se `descartar`). """
+        if os.getpid() != self.pid:
+            # Conexão herdada num fork: o socket é do processo pai, não pode ser fechado nem reaproveitado aqui
+            return
+        if descartar:
+            self._descartar(conexao, 'descartadas_erro')
+            return
+        self._livres.put((conexao, criada_em))
+
+    def estatisticas(self):
+        with self._trava:
+            dados = dict(self.contadores)
+            total = self._total
+        livres = self._livres.qsize()
+        dados.update({'modo': 'pool', 'max_size': self.max_size, 'abertas': total, 'livres': livres, 'em_uso': total - livres})
+        return dados
+
+
+def obter_pool(alias, **opcoes):
+    """ Pool do alias neste processo (criado na primeira chamada; um processo filho de fork ganha um pool novo). """
+    pool = _pools.get(alias)
+    if pool is None or pool.pid != os.getpid():
+        with _pools_trava:
+            pool = _pools.get(alias)
+            if pool is None or pool.pid != os.getpid():
+                # As conexões herdadas do processo pai não são fechadas: o socket ainda é dele
+                pool = _pools[alias] = PoolConexoes(alias, **opcoes)
+    return pool
+
+
+def _estatisticas_pool_psycopg(pool):
+    """ Contadores do psycopg_pool (get_stats) com os nomes usados por PoolConexoes. """
+    stats = pool.get_stats()
+    abertas = stats.get('pool_size', 0)
+    livres = stats.get('pool_available', 0)
+    return {
+        'modo': 'pool',
+        'max_size': stats.get('pool_max'),
+        'abertas': abertas,
+        'livres': livres,
+        'em_uso': abertas - livres,
+        'checkouts': stats.get('requests_num', 0),
+        'criadas': stats.get('connections_num', 0),
+        'esperas': stats.get('requests_queued', 0),
+        'espera_total_ms': stats.get('requests_wait_ms', 0),
+        'reconexoes': stats.get('connections_lost', 0) + stats.get('returns_bad', 0),
+        'esgotado': stats.get('requests_errors', 0),
+    }
+
+
+def estatisticas_conexoes():
+    """ { alias: {contadores} } deste processo, para monitoramento. """
+    dados = {}
+    for alias in connections:
+        settings_dict = connections.settings[alias]
+        if alias in _pools and _pools[alias].pid == os.getpid():
+            dados[alias] = _pools[alias].estatisticas()
+        elif settings_dict.get('OPTIONS', {}).get('pool') and hasattr(connections[alias], 'pool'):
+            dados[alias] = _estatisticas_pool_psycopg(connections[alias].pool)
+        else:
+            dados[alias] = {
+                'modo': 'persistente' if settings_dict.get('CONN_MAX_AGE') else 'por_requisicao',
+                'conexoes_abertas': _conexoes_abertas[alias],
+            }
+    return dados
@@ -0,0 +1,42 @@
+"""
+Backend MySQL (mysqlclient) com pool de conexões: ENGINE = 'gestao.pool_mysql'
+
+Igual ao django.db.backends.mysql, mas connect() pega uma conexão do PoolConexoes do alias
+(gestao/pool_banco.py) e close() a devolve, em vez de abrir e fechar uma conexão por requisição.
+Configurado em OPTIONS['pool'] com as chaves do pool nativo do PostgreSQL (max_size, timeout,
+max_lifetime; min_size é ignorado: as conexões são abertas sob demanda). Exige CONN_MAX_AGE = 0:
+o Django fecha (devolve) a conexão no fim de cada requisição. Com CONN_HEALTH_CHECKS a conexão
+livre é testada com ping() antes de ser entregue.
+"""
+from functools import partial
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.mysql import base as mysql
+
+from gestao.metricas import medir
+from gestao.pool_banco import obter_pool
+
+
+class DatabaseWrapper(mysql.DatabaseWrapper):
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params.pop('pool', None)
+        return params
+
+    def get_new_connection(self, conn_params):
+        if self.settings_dict['CONN_MAX_AGE'] != 0:
+            raise ImproperlyConfigured("gestao.pool_mysql exige CONN_MAX_AGE = 0 (o pool substitui as conexões persistentes).")
+        verificar = (lambda conexao: conexao.ping()) if self.settings_dict['CONN_HEALTH_CHECKS'] else None
+        with medir('conexao'):
+            self._pool_origem = obter_pool(self.alias, **(self.settings_dict['OPTIONS'].get('pool') or {}))
+            conexao, self._pool_criada_em = self._pool_origem.obter(partial(super().get_new_connection, conn_params), verificar)
+        return conexao
+
+    def _close(self):
+        if self.connection is None:
+            return
+        # Conexão no meio de uma transação ou que teve erro não volta para o pool
+        descartar = self.in_atomic_block or not self.autocommit or self.errors_occurred
+        with self.wrap_database_errors:
+            self._pool_origem.devolver(self.connection, self._pool_criada_em, descartar=descartar)
@@ -0,0 +1,185 @@
+"""
+Indicadores de produtividade e prazo (SLA) consolidados por dia
+
+`consolidar_periodo()` recalcula a tabela ResumoProdutividadeDiaria para um intervalo de datas
+(é idempotente: apaga e regrava os dias do intervalo). As telas de indicadores leem apenas a
+tabela consolidada, nunca varrem Documento.
+"""
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import FAIXAS_TEMPO_RESPOSTA, Documento, IntervaloStatus, ResumoProdutividadeDiaria
+
+CAMPOS_GRUPO = ('procurador_atribuido', 'tipo_documento', 'prioridade')
+
+# Evento contado -> campo de data do Documento
+EVENTOS = {
+    'recebidos': 'data_recebimento',
+    'atribuidos': 'data_atribuicao',
+    'finalizados': 'data_finalizacao',
+}
+
+# Documentos por consulta ao carregar os intervalos (limite de parâmetros do IN)
+LOTE_INTERVALOS = 1000
+
+
+def _novo_resumo():
+    return {
+        'recebidos': 0, 'atribuidos': 0, 'respondidos': 0, 'respondidos_com_atraso': 0, 'finalizados': 0,
+        'em_atraso': 0, 'tempo_resposta_total_horas': 0.0, 'histograma_resposta': [0] * FAIXAS_TEMPO_RESPOSTA,
+    }
+
+
+def _data_local(momento):
+    return timezone.localtime(momento).date() if timezone.is_aware(momento) else momento.date()
+
+
+class ProcuradoresPorIntervalo:
+    """
+    Procurador de cada documento ao longo do tempo, segundo os IntervaloStatus: uma redistribuição
+    não transfere ao novo procurador o que o anterior fez. Documentos sem intervalos (anteriores
+    ao histórico) ficam com o procurador atualmente atribuído.
+    """
+
+    def __init__(self, documento_ids):
+        self.intervalos = {}
+        documento_ids = sorted(documento_ids)
+        for posicao in range(0, len(documento_ids), LOTE_INTERVALOS):
+            linhas = IntervaloStatus.objects.filter(
+                documento_id__in=documento_ids[posicao:posicao + LOTE_INTERVALOS]
+            ).order_by('documento_id', 'inicio').values_list('documento_id', 'inicio', 'procurador_id')
+            for documento_id, inicio, procurador_id in linhas.iterator():
+                inicios, procuradores = self.intervalos.setdefault(documento_id, ([], []))
+                inicios.append(inicio)
+                procuradores.append(procurador_id)
+
+    def no_evento(self, documento_id, momento, atual):
+        """
+        Procurador do intervalo aberto pelo evento (recebimento, atribuição, resposta, finalização):
+        o primeiro que começa a partir dele, já que a data do documento é gravada antes da transição.
+        Sem intervalo posterior (histórico migrado), vale o que estava em vigor.
+        """
+        if documento_id not in self.intervalos:
+            return atual
+        inicios, procuradores = self.intervalos[documento_id]
+        posicao = bisect_left(inicios, momento)
+        return procuradores[posicao] if posicao < len(inicios) else procuradores[-1]
+
+    def ao_fim_do_dia(self, documento_id, dia, atual):
+        """ Procurador com o documento no fim do dia (o do primeiro intervalo, se o dia é anterior a todos). """
+        if documento_id not in self.intervalos:
+            return atual
+        inicios, procuradores = self.intervalos[documento_id]
+        fim_do_dia = timezone.make_aware(datetime.combine(dia + timedelta(days=1), time.min))
+        return procuradores[max(bisect_right(inicios, fim_do_dia) - 1, 0)]
+
+
+def calcular_periodo(inicio, fim):
+    """
+    Calcula os resumos de [inicio, fim] (datas locais, inclusivas).
+    Retorna { (data, procurador_id, tipo_documento_id, prioridade_id): {campo: valor} }.
+    Cada evento conta para o procurador do intervalo de status em que ocorreu (ProcuradoresPorIntervalo).
+    """
+    resumos = defaultdict(_novo_resumo)
+
+    # 1. Documentos com eventos no período (os intervalos deles são lidos de uma vez, em seguida)
+    eventos = {
+        campo_resumo: list(Documento.objects.filter(
+            **{f'{campo_data}__date__range': (inicio, fim)}
+        ).values_list('id', campo_data, *CAMPOS_GRUPO).iterator())
+        for campo_resumo, campo_data in EVENTOS.items()
+    }
+    respostas = list(Documento.objects.filter(
+        data_resposta_procurador__date__range=(inicio, fim), data_atribuicao__isnull=False
+    ).values_list('id', 'data_resposta_procurador', 'data_atribuicao', 'data_limite', *CAMPOS_GRUPO).iterator())
+    # Atraso no fim de cada dia: o documento fica atrasado do dia seguinte à data limite
+    # até a véspera da resposta (ou da finalização)
+    atrasados = list(Documento.objects.filter(
+        data_limite__lt=fim, data_atribuicao__isnull=False
+    ).exclude(
+        data_resposta_procurador__date__lte=inicio
+    ).exclude(
+        data_finalizacao__date__lte=inicio
+    ).values_list('id', 'data_limite', 'data_resposta_procurador', 'data_finalizacao', *CAMPOS_GRUPO).iterator())
+
+    procuradores = ProcuradoresPorIntervalo(
+        {linha[0] for linhas in (*eventos.values(), respostas, atrasados) for linha in linhas}
+    )
+
+    # 2. Contagens simples
+    for campo_resumo, linhas in eventos.items():
+        for documento_id, momento, atual, tipo_id, prioridade_id in linhas:
+            procurador_id = procuradores.no_evento(documento_id, momento, atual)
+            resumos[(_data_local(momento), procurador_id, tipo_id, prioridade_id)][campo_resumo] += 1
+
+    # 3. Respostas: o tempo de cada uma alimenta a média e o histograma
+    for documento_id, resposta, atribuicao, data_limite, atual, tipo_id, prioridade_id in respostas:
+        dia = _data_local(resposta)
+        resumo = resumos[(dia, procuradores.no_evento(documento_id, resposta, atual), tipo_id, prioridade_id)]
+        duracao = max(resposta - atribuicao, timedelta(0))
+        resumo['respondidos'] += 1
+        resumo['tempo_resposta_total_horas'] += duracao.total_seconds() / 3600
+        resumo['histograma_resposta'][min(duracao.days, FAIXAS_TEMPO_RESPOSTA - 1)] += 1
+        if data_limite and dia > data_limite:
+            resumo['respondidos_com_atraso'] += 1
+
+    # 4. Atraso: conta-se cada dia do intervalo, para quem estava com o documento naquele dia
+    for documento_id, data_limite, resposta, finalizacao, atual, tipo_id, prioridade_id in atrasados:
+        primeiro_dia = max(data_limite + timedelta(days=1), inicio)
+        ultimo_dia = fim
+        for encerramento in (resposta, finalizacao):
+            if encerramento:
+                ultimo_dia = min(ultimo_dia, _data_local(encerramento) - timedelta(days=1))
+        dia = primeiro_dia
+        while dia <= ultimo_dia:
+            procurador_id = procuradores.ao_fim_do_dia(documento_id, dia, atual)
+            resumos[(dia, procurador_id, tipo_id, prioridade_id)]['em_atraso'] += 1
+            dia += timedelta(days=1)
+
+    return resumos
+
+
+def consolidar_periodo(inicio, fim):
+    """ Regrava os resumos diários de [inicio, fim]. Retorna a quantidade de linhas gravadas. """
+    resumos = calcular_periodo(inicio, fim)
+    linhas = [
+        ResumoProdutividadeDiaria(
+            data=dia, procurador_id=procurador_id, tipo_documento_id=tipo_id, prioridade_id=prioridade_id, **valores
+        )
+        for (dia, procurador_id, tipo_id, prioridade_id), valores in resumos.items()
+    ]
+    with transaction.atomic():
+        ResumoProdutividadeDiaria.objects.filter(data__range=(inicio, fim)).delete()
+        ResumoProdutividadeDiaria.objects.bulk_create(linhas, batch_size=1000)
+    return len(linhas)
+
+
+# --- Leitura (telas de indicadores) ---
+
+def somar_histogramas(histogramas):
+    total = [0] * FAIXAS_TEMPO_RESPOSTA
+    for histograma in histogramas:
+        for faixa, quantidade in enumerate(histograma):
+            total[faixa] += quantidade
+    return total
+
+
+def percentil_histograma(histograma, percentil):
+    """
+    Percentil (0-100) do tempo de resposta em dias a partir do histograma consolidado.
+    A última faixa significa "mais de FAIXAS_TEMPO_RESPOSTA - 2 dias". Retorna None sem respostas.
+    """
+    total = sum(histograma)
+    if not total:
+        return None
+    alvo = total * percentil / 100
+    acumulado = 0
+    for faixa, quantidade in enumerate(histograma):
+        acumulado += quantidade
+        if acumulado >= alvo:
+            return faixa
+    return len(histograma) - 1
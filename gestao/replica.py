@@ -0,0 +1,142 @@
+"""
+Leituras na réplica do banco (alias 'replica'), lendo as próprias escritas no primário
+
+As telas de consulta sobre o acervo inteiro (busca, monitoramento, exportações, indicadores) e os
+relatórios dos comandos agendados não precisam disputar o primário com o protocolo. Quando o alias
+'replica' existe em DATABASES (DB_REPLICA_HOST / DB_REPLICA_NAME em config/settings.py), o
+RoteadorReplica manda para ele as leituras feitas dentro de:
+
+    @login_required
+    @leitura_em_replica
+    def busca_view(request): ...
+
+    with ler_da_replica():  # comandos de gerenciamento
+        ...
+
+Todo o resto continua no primário, e também continuam lá, mesmo nesses escopos:
+- as leituras dentro de transaction.atomic() (select_for_update, leituras seguidas de escrita);
+- as leituras de uma requisição depois que ela mesma escreveu algo (qualquer uso do banco de escrita:
+  gravações, validações de unicidade, select_for_update);
+- as requisições de um usuário que escreveu há menos de GESTAO_REPLICA_JANELA_SEGUNDOS (o
+  RoteamentoReplicaMiddleware grava o momento da última escrita num cookie), para que ele veja o
+  que acabou de gravar mesmo com atraso na replicação;
+- sessões e a tabela do cache (gestao/cache.py), que precisam ser lidas logo após gravadas.
+
+Localmente, DB_REPLICA_NAME pode apontar para um segundo arquivo SQLite (uma cópia do banco principal).
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+ALIAS_REPLICA = 'replica'
+# Cookie (e não sessão, para não regravar a sessão a cada escrita) com o momento da última escrita do usuário
+COOKIE_ULTIMA_ESCRITA = 'gestao_ultima_escrita'
+# Apps sempre lidas do primário, cujas gravações não contam como escrita do usuário
+APPS_SOMENTE_PRIMARIO = {'sessions', 'django_cache'}
+
+# Escopo corrente: {'replica': lê da réplica?, 'escrita': já escreveu?, 'ler_escritas': volta ao primário após escrever?}
+_escopo = ContextVar('gestao_replica_escopo', default=None)
+
+
+def replica_configurada():
+    return ALIAS_REPLICA in settings.DATABASES
+
+
+@contextmanager
+def escopo_requisicao():
+    """ Abre o escopo de uma requisição (RoteamentoReplicaMiddleware); devolve o dict do escopo. """
+    escopo = {'replica': False, 'escrita': False, 'ler_escritas': True}
+    token = _escopo.set(escopo)
+    try:
+        yield escopo
+    finally:
+        _escopo.reset(token)
+
+
+@contextmanager
+def ler_da_replica(ler_escritas=False):
+    """
+    Manda para a réplica as leituras do bloco (fora de transações). Nos comandos o padrão é não voltar
+    ao primário depois de uma escrita (trava, registro de envios), já que eles não releem o que gravam.
+    """
+    escopo_atual = _escopo.get()
+    if escopo_atual is not None:
+        # Dentro de uma requisição: mantém a marcação de escrita do escopo dela
+        anterior = escopo_atual['replica']
+        escopo_atual['replica'] = True
+        try:
+            yield
+        finally:
+            escopo_atual['replica'] = anterior
+        return
+    token = _escopo.set({'replica': True, 'escrita': False, 'ler_escritas': ler_escritas})
+    try:
+        yield
+    finally:
+        _escopo.reset(token)
+
+
+def escrita_recente(request):
+    """ O usuário gravou algo há menos de GESTAO_REPLICA_JANELA_SEGUNDOS (deve ler do primário). """
+    try:
+        ultima = float(request.COOKIES[COOKIE_ULTIMA_ESCRITA])
+    except (KeyError, ValueError):
+        return False
+    return time.time() - ultima < settings.GESTAO_REPLICA_JANELA_SEGUNDOS
+
+
+def leitura_em_replica(view):
+    """ Decorator das views somente leitura: as consultas vão para a réplica, se houver e se o usuário não escreveu há pouco. """
+    @wraps(view)
+    def _view(request, *args, **kwargs):
+        if not replica_configurada() or escrita_recente(request):
+            return view(request, *args, **kwargs)
+        with ler_da_replica(ler_escritas=True):
+            return view(request, *args, **kwargs)
+    return _view
+
+
+def alias_leitura(queryset):
+    """
+    Fixa no queryset o banco escolhido agora. Necessário quando ele só é avaliado depois que a view
+    retorna (StreamingHttpResponse), já fora do escopo de leitura em réplica.
+    """
+    return queryset.using(queryset.db)
+
+
+class RoteadorReplica:
+    """ DATABASE_ROUTERS: leituras na réplica nos escopos acima; escritas e migrações sempre no primário. """
+
+    def db_for_read(self, model, **hints):
+        escopo = _escopo.get()
+        if escopo is None or not escopo['replica'] or not replica_configurada():
+            return None
+        if model._meta.app_label in APPS_SOMENTE_PRIMARIO:
+            return None
+        if escopo['escrita'] and escopo['ler_escritas']:
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return ALIAS_REPLICA
+
+    def db_for_write(self, model, **hints):
+        escopo = _escopo.get()
+        if escopo is not None and model._meta.app_label not in APPS_SOMENTE_PRIMARIO:
+            escopo['escrita'] = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # A réplica é cópia do primário: objetos lidos de um e de outro podem se relacionar
+        if {obj1._state.db, obj2._state.db} <= {DEFAULT_DB_ALIAS, ALIAS_REPLICA}:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # A réplica de produção recebe o esquema pela replicação; localmente a cópia do SQLite já o tem
+        if db == ALIAS_REPLICA:
+            return False
+        return None
@@ -0,0 +1,93 @@
+"""
+Respostas aos remetentes na finalização dos documentos
+
+Confirmar documentos (um a um ou em lote) grava, na mesma transação, uma RespostaRemetentePendente
+para cada documento que pediu a notificação (notificar_remetente) e cujo remetente tem e-mail:
+
+    with transaction.atomic():
+        ...  # finaliza os documentos
+        if enfileirar_respostas(documento_ids):
+            enviar_apos_commit(enviar_respostas_remetentes, documento_ids)
+
+`enviar_respostas_remetentes()` envia as pendentes e apaga as que saíram; nas que falharam fica
+registrada a tentativa. O comando `enviar_respostas_pendentes` (agendado) reenvia o que ficou na
+fila, inclusive quando a instância foi encerrada antes de enviar.
+"""
+import logging
+from collections import defaultdict
+
+from django.db.models import F
+from django.utils import timezone
+
+from .email_utils import enviar_emails_em_paralelo
+from .models import Anexo, Documento, RespostaRemetentePendente
+
+logger = logging.getLogger('gestao')
+
+
+def enfileirar_respostas(documento_ids):
+    """ Registra as respostas devidas dos documentos informados. Retorna os ids enfileirados. """
+    ids = list(Documento.objects.filter(
+        pk__in=documento_ids, notificar_remetente=True
+    ).exclude(remetente__email='').exclude(remetente__email__isnull=True).values_list('id', flat=True))
+    RespostaRemetentePendente.objects.bulk_create(
+        [RespostaRemetentePendente(documento_id=documento_id) for documento_id in ids], batch_size=1000, ignore_conflicts=True
+    )
+    return ids
+
+
+def enviar_respostas_remetentes(documento_ids, max_threads=8):
+    """
+    Envia aos remetentes o e-mail de resposta (com os anexos INICIAL e RESPOSTA) dos documentos informados
+    que estão na fila. Documentos e anexos vêm em duas consultas; os envios saem em paralelo reaproveitando
+    as conexões SMTP. Retorna (enviados, protocolos com falha).
+    """
+    pendentes = RespostaRemetentePendente.objects.filter(documento_id__in=documento_ids).values('documento_id')
+    documentos = list(Documento.objects.filter(pk__in=pendentes).values_list(
+        'id', 'protocolo', 'num_doc_origem', 'data_finalizacao', 'obs_finalizacao', 'remetente__nome_razao_social', 'remetente__email'
+    ))
+    if not documentos:
+        return 0, []
+
+    anexos_por_documento = defaultdict(list)
+    anexos = Anexo.objects.filter(
+        documento_id__in=[doc_id for doc_id, *_ in documentos], tipo_anexo__in=['INICIAL', 'RESPOSTA'], ativo=True
+    ).only('documento_id', 'arquivo').order_by('pk')
+    for anexo in anexos:
+        if anexo.arquivo:
+            anexos_por_documento[anexo.documento_id].append(anexo.arquivo)
+
+    envios = [
+        ((doc_id, protocolo), {
+            'assunto': f"Resposta ao Documento Protocolo {protocolo} - Procuradoria",
+            'template_name': 'emails/resposta_remetente.html',
+            'contexto': {
+                'remetente_nome': remetente_nome,
+                'protocolo': protocolo,
+                'num_doc_origem': num_doc_origem,
+                'data_finalizacao': timezone.localtime(data_finalizacao).strftime('%d/%m/%Y %H:%M'),
+                'observacoes_finalizacao': obs_finalizacao,
+            },
+            'destinatarios': [email_remetente],
+            'anexos': anexos_por_documento[doc_id],
+        })
+        for doc_id, protocolo, num_doc_origem, data_finalizacao, obs_finalizacao, remetente_nome, email_remetente in documentos
+    ]
+
+    enviados = []
+    falhas = {}
+    for (doc_id, protocolo), enviado in enviar_emails_em_paralelo(envios, max_threads=max_threads):
+        if enviado:
+            enviados.append(doc_id)
+        else:
+            falhas[doc_id] = protocolo
+
+    RespostaRemetentePendente.objects.filter(documento_id__in=enviados).delete()
+    if falhas:
+        RespostaRemetentePendente.objects.filter(documento_id__in=falhas).update(
+            tentativas=F('tentativas') + 1, ultima_tentativa=timezone.now()
+        )
+    logger.info(f"Respostas aos remetentes: {len(enviados)} enviada(s), {len(falhas)} falha(s)")
+    if falhas:
+        logger.error(f"Falha ao enviar a resposta aos remetentes dos protocolos: {', '.join(sorted(falhas.values()))}")
+    return len(enviados), sorted(falhas.values())
@@ -1,7 +1,9 @@
-from django.db.models.signals import post_save
-from django.contrib.auth.models import User
+from django.db.models.signals import post_save, pre_save, m2m_changed, pre_delete, post_delete
+from django.contrib.auth.models import Group, User
 from django.dispatch import receiver
-from .models import Profile
+from .cache import invalidar
+from .papeis import invalidar_papeis_usuario
+from .models import Profile, Documento, Remetente, Anexo, IntervaloStatus, NivelPrioridade, TipoDocumento, SolicitacaoDocumento
 
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
@@ -10,10 +12,164 @@ def create_user_profile(sender, instance, created, **kwargs):
         Profile.objects.create(user=instance)
 
 @receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
-    """ Salva o Profile automaticamente sempre que um User é salvo. """
-    try:
-        instance.profile.save()
-    except Profile.DoesNotExist:
+def save_user_profile(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Salva o Profile junto com o User, mas só quando há o que gravar. O login grava apenas
+    `last_login` e não toca no Profile; um Profile carregado e inalterado também não é regravado.
+    """
+    if created or (update_fields is not None and set(update_fields) <= {'last_login'}):
+        return
+    if User.profile.is_cached(instance):
+        if instance.profile.alterado():
+            instance.profile.save()
+    else:
         # Caso o usuário tenha sido criado antes do signal existir
-        Profile.objects.create(user=instance)
\ No newline at end of file
+        Profile.objects.get_or_create(user=instance)
+
+
+@receiver(m2m_changed, sender=Documento.interessados.through)
+def sincronizar_interessados_resumo(sender, instance, action, reverse, pk_set, **kwargs):
+    """ Mantém Documento.interessados_resumo em dia com a tabela M2M de interessados. """
+    if action == 'pre_clear' and reverse:
+        # No clear() pelo lado do Remetente o pk_set não é informado: guardamos os documentos antes
+        instance._documentos_interessados = list(instance.processos_interessados.values_list('pk', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    invalidar('painel')  # lista de interessados com processos (filtro do monitoramento)
+    if not reverse:
+        Documento.atualizar_interessados_resumo([instance.pk])
+    elif action == 'post_clear':
+        Documento.atualizar_interessados_resumo(getattr(instance, '_documentos_interessados', []))
+    else:
+        Documento.atualizar_interessados_resumo(pk_set or [])
+
+
+@receiver(pre_save, sender=Remetente)
+def guardar_nome_anterior(sender, instance, **kwargs):
+    if instance.pk:
+        instance._nome_anterior = Remetente.objects.filter(pk=instance.pk).values_list('nome_razao_social', flat=True).first()
+
+
+@receiver(post_save, sender=Remetente)
+def atualizar_nome_interessado(sender, instance, created, **kwargs):
+    """ Propaga a alteração do nome de um Remetente para os resumos dos documentos em que é interessado. """
+    if created or getattr(instance, '_nome_anterior', None) == instance.nome_razao_social:
+        return
+    documento_ids = list(instance.processos_interessados.values_list('pk', flat=True))
+    Documento.atualizar_interessados_resumo(documento_ids)
+
+
+@receiver(pre_delete, sender=Remetente)
+def guardar_documentos_do_interessado(sender, instance, **kwargs):
+    instance._documentos_interessados = list(instance.processos_interessados.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Remetente)
+def remover_interessado_dos_resumos(sender, instance, **kwargs):
+    """ A exclusão remove as linhas da M2M sem disparar o m2m_changed. """
+    Documento.atualizar_interessados_resumo(getattr(instance, '_documentos_interessados', []))
+
+
+@receiver(post_save, sender=Anexo)
+@receiver(post_delete, sender=Anexo)
+def sincronizar_anexo_inicial_principal(sender, instance, **kwargs):
+    """ Mantém Documento.anexo_inicial_principal ao incluir, inativar ou excluir anexos iniciais. """
+    documento = instance.documento
+    if instance.tipo_anexo == 'INICIAL' or instance.pk == documento.anexo_inicial_principal_id:
+        # Atualiza também a instância em memória, para que um save() posterior do documento não grave um valor antigo
+        documento.atualizar_anexo_inicial_principal()
+
+
+@receiver(post_save, sender=Documento)
+def registrar_intervalo_status(sender, instance, created, update_fields=None, **kwargs):
+    """ Abre um novo IntervaloStatus quando o status (ou o procurador) do documento muda. """
+    if update_fields is not None and not {'status', 'procurador_atribuido'} & set(update_fields):
+        return
+    if not created:
+        if hasattr(instance, '_status_carregado') and hasattr(instance, '_procurador_carregado'):
+            anterior = (instance._status_carregado, instance._procurador_carregado)
+        else:
+            # Documento carregado sem esses campos (only/defer): compara com o intervalo aberto
+            anterior = IntervaloStatus.objects.filter(
+                documento_id=instance.pk, fim__isnull=True
+            ).values_list('status', 'procurador_id').first()
+        if anterior == (instance.status, instance.procurador_atribuido_id):
+            return
+
+    IntervaloStatus.registrar_transicoes([(instance.pk, instance.status, instance.procurador_atribuido_id)])
+    instance._status_carregado = instance.status
+    instance._procurador_carregado = instance.procurador_atribuido_id
+
+
+# --- Cache compartilhado (gestao/cache.py) ---
+
+@receiver(post_save, sender=Remetente)
+@receiver(post_delete, sender=Remetente)
+@receiver(post_save, sender=TipoDocumento)
+@receiver(post_delete, sender=TipoDocumento)
+@receiver(post_save, sender=NivelPrioridade)
+@receiver(post_delete, sender=NivelPrioridade)
+def invalidar_referencias(sender, **kwargs):
+    """ Listas dos filtros e do autocomplete de remetentes. """
+    invalidar('referencias')
+    if sender is Remetente:
+        invalidar('remetentes')
+        invalidar('painel')  # nomes dos interessados no filtro do monitoramento
+
+
+@receiver(post_save, sender=SolicitacaoDocumento)
+@receiver(post_delete, sender=SolicitacaoDocumento)
+@receiver(post_delete, sender=Documento)
+def invalidar_painel(sender, **kwargs):
+    """ Mudanças de status de documentos já invalidam o painel em IntervaloStatus.registrar_transicoes. """
+    invalidar('painel')
+
+
+# --- Papéis guardados na sessão (gestao/papeis.py) ---
+
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidar_papeis_grupos_usuario(sender, instance, action, reverse, pk_set, **kwargs):
+    """ Grupos incluídos ou retirados (pelo usuário ou pelo grupo): as sessões recarregam os papéis. """
+    if action == 'pre_clear' and reverse:
+        # No clear() pelo lado do Group o pk_set não é informado: guardamos os usuários antes
+        instance._usuarios_do_grupo = list(instance.user_set.values_list('pk', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if not reverse:
+        usuario_ids = [instance.pk]
+    elif action == 'post_clear':
+        usuario_ids = getattr(instance, '_usuarios_do_grupo', [])
+    else:
+        usuario_ids = pk_set or []
+    for usuario_id in usuario_ids:
+        invalidar_papeis_usuario(usuario_id)
+
+
+@receiver(pre_delete, sender=Group)
+def guardar_usuarios_do_grupo(sender, instance, **kwargs):
+    instance._usuarios_do_grupo = list(instance.user_set.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidar_papeis_grupo(sender, instance, created=False, **kwargs):
+    """ Grupo renomeado ou excluído (a exclusão remove as linhas da M2M sem disparar o m2m_changed). """
+    if created:
+        return
+    usuario_ids = getattr(instance, '_usuarios_do_grupo', None)
+    if usuario_ids is None:
+        usuario_ids = instance.user_set.values_list('pk', flat=True)
+    for usuario_id in usuario_ids:
+        invalidar_papeis_usuario(usuario_id)
+
+
+@receiver(post_save, sender=Profile)
+def invalidar_papeis_pin(sender, instance, created, update_fields=None, **kwargs):
+    """ PIN redefinido: a impressão do PIN guardada nas sessões (e as autorizações amarradas a ela) deixa de valer. """
+    if created or (update_fields is not None and 'pin_autorizacao' not in update_fields):
+        return
+    invalidar_papeis_usuario(instance.user_id)
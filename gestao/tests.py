@@ -1,3 +1,1786 @@
-from django.test import TestCase
+"""
+Testes de gestao
 
-# Create your tests here.
+DesempenhoViewsTests (tag 'desempenho') popula o banco de teste com documentos sintéticos
+(GeradorDadosSinteticos) e compara, para cada view principal, o número de consultas com o orçamento
+versionado em `orcamentos_desempenho.json`: uma mudança que acrescente consultas faz o teste falhar.
+A contagem não depende da máquina e roda sempre, com um volume pequeno. As latências (mediana de
+algumas execuções) só são comparadas com os orçamentos quando pedido, num volume realista:
+
+    python manage.py test gestao                              # inclui a contagem de consultas
+    python manage.py test gestao --exclude-tag desempenho     # sem a suíte de desempenho
+    GESTAO_BENCH_DOCUMENTOS=20000 GESTAO_BENCH_LATENCIA=1 python manage.py test gestao --tag desempenho
+
+Variáveis de ambiente:
+    GESTAO_BENCH_DOCUMENTOS       volume de documentos gerados (padrão 500)
+    GESTAO_BENCH_LATENCIA         1 para comparar também as latências com os orçamentos
+    GESTAO_BENCH_REPETICOES       execuções medidas por view (padrão 3)
+    GESTAO_BENCH_FATOR_LATENCIA   multiplica os orçamentos de latência (ex.: 2 em máquinas de CI lentas)
+    GESTAO_BENCH_RELATORIO        caminho de um JSON onde gravar as medições (para revisar os orçamentos)
+"""
+import atexit
+import csv
+import importlib.util
+import json
+import os
+import re
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, timedelta
+from io import StringIO
+from pathlib import Path
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.contrib.auth.models import Group, User
+from django.contrib.messages import get_messages
+from django.contrib.sessions.models import Session
+from django.core import mail, signing
+from django.core.cache import cache, caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.core.management import CommandError, call_command
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, connection, connections, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings, tag
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .cache import invalidar, obter_ou_calcular, versao
+from .dados_sinteticos import ARQUIVO_PLACEHOLDER, GeradorDadosSinteticos
+from .middleware import InstrumentacaoConsultasMiddleware, RoteamentoReplicaMiddleware, ServerTimingMiddleware, forma_sql
+from .models import (
+    Anexo, Documento, IntervaloStatus, NivelPrioridade, NotificacaoEnviada, PinBloqueado, Profile, Remetente,
+    RespostaRemetentePendente, ResumoProdutividadeDiaria, TipoDocumento, TravaExecucao,
+)
+from .papeis import SESSAO_PAPEIS
+from .pool_banco import PoolConexoes, PoolEsgotado, _estatisticas_pool_psycopg, estatisticas_conexoes, obter_pool
+from .replica import (
+    ALIAS_REPLICA, COOKIE_ULTIMA_ESCRITA, RoteadorReplica, escopo_requisicao, escrita_recente, ler_da_replica,
+    leitura_em_replica,
+)
+from .travas import adquirir_trava, liberar_trava, trava_execucao
+from .views import SESSAO_AUTORIZACAO_PIN, pin_autorizado
+
+ARQUIVO_ORCAMENTOS = Path(__file__).with_name('orcamentos_desempenho.json')
+VOLUME_DOCUMENTOS = int(os.environ.get('GESTAO_BENCH_DOCUMENTOS', 500))
+# Período gerado proporcional ao volume (20000 documentos em um ano), para que as filas recentes não fiquem vazias
+DIAS_GERADOS = max(30, VOLUME_DOCUMENTOS * 365 // 20000)
+MEDIR_LATENCIA = os.environ.get('GESTAO_BENCH_LATENCIA') == '1'
+REPETICOES = int(os.environ.get('GESTAO_BENCH_REPETICOES', 3))
+FATOR_LATENCIA = float(os.environ.get('GESTAO_BENCH_FATOR_LATENCIA', 1.0))
+ARQUIVO_RELATORIO = os.environ.get('GESTAO_BENCH_RELATORIO')
+
+# Anexos e e-mails ficam locais: diretório temporário no lugar do bucket e backend locmem no lugar do SMTP
+MEDIA_TEMPORARIA = tempfile.mkdtemp(prefix='gestao-desempenho-')
+atexit.register(shutil.rmtree, MEDIA_TEMPORARIA, ignore_errors=True)
+
+medicoes = {}
+
+configuracao_testes = override_settings(
+    STORAGES={
+        'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+        'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    },
+    MEDIA_ROOT=MEDIA_TEMPORARIA,
+    EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+    SECURE_SSL_REDIRECT=False,
+    GESTAO_INSTRUMENTACAO_AMOSTRAGEM=0,
+    GESTAO_ENVIOS_EM_SEGUNDO_PLANO=False,
+    # Senhas e PINs com um hasher rápido: o PBKDF2 padrão dominaria o tempo da suíte
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+)
+
+
+@configuracao_testes
+@tag('desempenho')
+class DesempenhoViewsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        with open(ARQUIVO_ORCAMENTOS, encoding='utf-8') as arquivo:
+            cls.orcamentos = json.load(arquivo)
+
+        GeradorDadosSinteticos(dias=DIAS_GERADOS, semente=2024).gerar(VOLUME_DOCUMENTOS)
+
+        cls.admin = User.objects.create_superuser('admin.desempenho', 'admin@sintetico.local', 'senha')
+        cls.procurador = User.objects.get(username='procurador.sintetico1')
+        documentos = Documento.objects.order_by('pk')
+        cls.doc_em_analise = documentos.filter(status='Em Análise', procurador_atribuido=cls.procurador).first()
+        cls.doc_concluido = documentos.filter(status='Análise Concluída').first()
+        cls.doc_aguardando_confirmacao = documentos.filter(status='Aguardando Confirmação').first()
+        cls.doc_finalizado = documentos.filter(status='Finalizado').first()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        if ARQUIVO_RELATORIO:
+            with open(ARQUIVO_RELATORIO, 'w', encoding='utf-8') as arquivo:
+                json.dump(medicoes, arquivo, indent=2, ensure_ascii=False, sort_keys=True)
+
+    def medir(self, nome, usuario, url, metodo='get', dados=None, aquecer=True):
+        """
+        Executa a requisição REPETICOES vezes e compara o número de consultas da última execução
+        (e, com GESTAO_BENCH_LATENCIA, a mediana da latência) com o orçamento `nome`.
+        `dados` pode ser uma função que recebe o índice da execução (POSTs que consomem dados).
+        """
+        self.client.force_login(usuario)
+        montar_dados = dados if callable(dados) else (lambda indice: dados or {})
+
+        if aquecer:
+            getattr(self.client, metodo)(url, montar_dados(-1))
+
+        latencias = []
+        for indice in range(REPETICOES):
+            with CaptureQueriesContext(connection) as consultas:
+                inicio = time.perf_counter()
+                response = getattr(self.client, metodo)(url, montar_dados(indice))
+                latencias.append((time.perf_counter() - inicio) * 1000)
+            self.assertIn(response.status_code, (200, 302), f"{nome}: status {response.status_code}")
+
+        latencia_ms = statistics.median(latencias)
+        num_consultas = len(consultas.captured_queries)
+        medicoes[nome] = {'consultas': num_consultas, 'latencia_ms': round(latencia_ms, 1)}
+
+        orcamento = self.orcamentos[nome]
+        self.assertLessEqual(
+            num_consultas, orcamento['consultas'],
+            f"{nome}: {num_consultas} consultas (orçamento {orcamento['consultas']}). "
+            f"Consultas executadas:\n" + '\n'.join(q['sql'][:200] for q in consultas.captured_queries)
+        )
+        if MEDIR_LATENCIA:
+            limite_ms = orcamento['latencia_ms'] * FATOR_LATENCIA
+            self.assertLessEqual(
+                latencia_ms, limite_ms,
+                f"{nome}: mediana de {latencia_ms:.0f} ms (orçamento {limite_ms:.0f} ms)"
+            )
+        return response
+
+    def test_dashboard(self):
+        self.medir('dashboard', self.admin, reverse('gestao:dashboard'))
+
+    def test_busca_sem_filtros(self):
+        self.medir('busca', self.admin, reverse('gestao:busca'))
+
+    def test_busca_com_filtros(self):
+        self.medir('busca_filtrada', self.admin, reverse('gestao:busca'), dados={
+            'status': 'Em Análise', 'prazo': 'atrasado', 'ordenar_por': 'dias_restantes',
+        })
+
+    def test_monitoramento(self):
+        self.medir('monitoramento', self.admin, reverse('gestao:monitoramento_analises'))
+
+    def test_procurador_dashboard(self):
+        self.medir('procurador_dashboard', self.procurador, reverse('gestao:procurador_dashboard'))
+
+    def test_confirmacao_lista(self):
+        self.medir('confirmacao_lista', self.admin, reverse('gestao:confirmacao_lista'))
+
+    def test_distribuicao_get(self):
+        self.medir('distribuicao', self.admin, reverse('gestao:distribuicao'))
+
+    def test_distribuicao_post(self):
+        fila = list(
+            Documento.objects.filter(status='Aguardando Distribuição').order_by('pk').values_list('pk', flat=True)[:5 * REPETICOES]
+        )
+        self.assertEqual(len(fila), 5 * REPETICOES, "Volume insuficiente na fila de distribuição")
+
+        def selecao(indice):
+            return {'documento_selecionado': fila[indice * 5:(indice + 1) * 5], 'procurador_id': self.procurador.pk}
+
+        # Os avisos aos procuradores saem depois do commit (um e-mail por distribuição), fora da medição
+        with self.captureOnCommitCallbacks(execute=True):
+            self.medir('distribuicao_post', self.admin, reverse('gestao:distribuicao'), metodo='post', dados=selecao, aquecer=False)
+        self.assertEqual(len(mail.outbox), REPETICOES)
+
+    def test_documento_detail(self):
+        self.medir('documento_detail', self.procurador, reverse('gestao:documento_detail', args=[self.doc_em_analise.pk]))
+
+    def test_documento_consulta(self):
+        self.medir('documento_consulta', self.admin, reverse('gestao:documento_consulta', args=[self.doc_finalizado.pk]))
+
+    def test_finalizacao_detail(self):
+        self.medir('finalizacao_detail', self.admin, reverse('gestao:finalizacao_detail', args=[self.doc_concluido.pk]))
+
+    def test_confirmacao_detail(self):
+        self.medir('confirmacao_detail', self.admin, reverse('gestao:confirmacao_detail', args=[self.doc_aguardando_confirmacao.pk]))
+
+
+@configuracao_testes
+class PapeisSessaoTests(TestCase):
+    """ Grupos e PIN guardados na sessão (gestao/papeis.py) seguem as mudanças feitas em outras sessões. """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.grupo_chefe = Group.objects.create(name='Procurador-Chefe')
+        cls.usuario = User.objects.create_user('chefe.papeis', 'chefe@sintetico.local', 'senha')
+        # Direto na tabela M2M (sem signal): a troca de versão agendada aqui ficaria na transação da classe,
+        # que nunca é confirmada, e a dos testes seria deduplicada com ela
+        User.groups.through.objects.create(user=cls.usuario, group=cls.grupo_chefe)
+        cls.url = reverse('gestao:confirmacao_lista')
+
+    def setUp(self):
+        self.client.force_login(self.usuario)
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    def test_remover_grupo_revoga_na_proxima_requisicao(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.usuario.groups.remove(self.grupo_chefe)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+    def test_esvaziar_grupo_pelo_lado_do_grupo(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.grupo_chefe.user_set.clear()
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+    def test_excluir_grupo(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.grupo_chefe.delete()
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+    def test_incluir_grupo(self):
+        url_distribuicao = reverse('gestao:distribuicao')
+        self.assertEqual(self.client.get(url_distribuicao).status_code, 403)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.usuario.groups.add(Group.objects.create(name='Protocolo'))
+        self.assertEqual(self.client.get(url_distribuicao).status_code, 200)
+
+    def test_redefinir_pin_atualiza_a_impressao_na_sessao(self):
+        self.assertIsNone(self.client.session[SESSAO_PAPEIS]['impressao_pin'])
+        profile = Profile.objects.get(user=self.usuario)
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.definir_pin('1234')
+        self.client.get(self.url)
+        self.assertEqual(self.client.session[SESSAO_PAPEIS]['impressao_pin'], Profile.impressao_pin(profile.pin_autorizacao))
+
+    def test_sem_mudancas_usa_a_copia_da_sessao(self):
+        with CaptureQueriesContext(connection) as consultas:
+            self.client.get(self.url)
+        self.assertFalse(any('auth_user_groups' in consulta['sql'] for consulta in consultas.captured_queries))
+
+
+@configuracao_testes
+class GestaoTestCase(TestCase):
+    """ Base dos testes de comportamento: referências mínimas e atalhos para criar usuários e documentos. """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tipo = TipoDocumento.objects.create(descricao='Ofício')
+        cls.prioridade = NivelPrioridade.objects.create(descricao='Normal', prazo_dias=15)
+        cls.remetente = Remetente.objects.create(
+            tipo_remetente='Órgão Público', nome_razao_social='Secretaria de Teste', cpf_cnpj='00000000000191',
+            email='secretaria@sintetico.local',
+        )
+        cls.protocolista = cls.criar_usuario('protocolo.teste', 'Protocolo')
+        cls.procurador = cls.criar_usuario('procurador.teste', 'Procuradores')
+        # As invalidações agendadas para o commit nunca rodariam (a transação da classe é desfeita) e,
+        # pendentes, fariam `invalidar` deixar de agendar (e os testes de capturar) as dos testes
+        transaction.get_connection().run_on_commit.clear()
+
+    @contextmanager
+    def commit(self):
+        """ Como um commit: executa as funções agendadas com on_commit e esvazia a fila delas. """
+        with self.captureOnCommitCallbacks(execute=True):
+            yield
+        # captureOnCommitCallbacks mantém as funções na fila, e `invalidar` não agendaria de novo o namespace
+        transaction.get_connection().run_on_commit.clear()
+
+    @classmethod
+    def criar_usuario(cls, username, *grupos, email=None):
+        usuario = User.objects.create_user(username, f'{username}@sintetico.local' if email is None else email, 'senha')
+        for nome in grupos:
+            usuario.groups.add(Group.objects.get_or_create(name=nome)[0])
+        return usuario
+
+    @classmethod
+    def criar_documento(cls, status='Aguardando Distribuição', procurador=None, **campos):
+        """ Documento com as referências da classe; com `procurador`, atribuído a ele hoje. """
+        campos.setdefault('remetente', cls.remetente)
+        campos.setdefault('prioridade', cls.prioridade)
+        if procurador is not None:
+            campos.setdefault('data_atribuicao', timezone.now())
+        return Documento.objects.create(
+            status=status, procurador_atribuido=procurador, tipo_documento=cls.tipo,
+            num_doc_origem='OF-1', data_doc_origem=timezone.localdate(), protocolado_por=cls.protocolista, **campos
+        )
+
+
+class LembretesLoteTests(GestaoTestCase):
+    """ enviar_lembretes_lote_view: um e-mail por procurador com todos os seus documentos marcados. """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.outro_procurador = cls.criar_usuario('procurador.outro', 'Procuradores')
+        cls.sem_email = cls.criar_usuario('procurador.sem.email', 'Procuradores', email='')
+        cls.url = reverse('gestao:enviar_lembretes_lote')
+
+    def setUp(self):
+        self.client.force_login(self.protocolista)
+
+    def test_agrupa_por_procurador(self):
+        documentos = [self.criar_documento('Em Análise', self.procurador) for _ in range(3)]
+        documentos.append(self.criar_documento('Em Análise', self.outro_procurador))
+        ignorado = self.criar_documento('Aguardando Distribuição')
+
+        with self.assertLogs('gestao', 'INFO'):
+            response = self.client.post(self.url, {
+                'documentos': [documento.pk for documento in documentos + [ignorado]], 'custom_message': 'Prazo final',
+            })
+
+        self.assertRedirects(response, reverse('gestao:monitoramento_analises'), fetch_redirect_response=False)
+        self.assertEqual(sorted(email.to[0] for email in mail.outbox), sorted([self.procurador.email, self.outro_procurador.email]))
+        email_procurador = next(email for email in mail.outbox if email.to == [self.procurador.email])
+        self.assertIn('3 documento(s)', email_procurador.subject)
+        corpo = email_procurador.alternatives[0][0]
+        self.assertIn('Prazo final', corpo)
+        for documento in documentos[:3]:
+            self.assertIn(documento.protocolo, corpo)
+        mensagens = [str(mensagem) for mensagem in get_messages(response.wsgi_request)]
+        self.assertIn('Lembretes de 4 documento(s) enviados a 2 procurador(es).', mensagens)
+        self.assertTrue(any('1 documento(s) ignorado(s)' in mensagem for mensagem in mensagens))
+
+    def test_procurador_sem_email(self):
+        documento = self.criar_documento('Em Análise', self.sem_email)
+        with self.assertLogs('gestao', 'INFO'):
+            response = self.client.post(self.url, {'documentos': [documento.pk]})
+        self.assertEqual(mail.outbox, [])
+        mensagens = [str(mensagem) for mensagem in get_messages(response.wsgi_request)]
+        self.assertIn('Procurador(es) sem e-mail cadastrado: procurador.sem.email.', mensagens)
+
+    def test_exige_protocolo(self):
+        documento = self.criar_documento('Em Análise', self.procurador)
+        self.client.force_login(self.procurador)
+        with self.assertLogs('django.request', 'WARNING'):
+            response = self.client.post(self.url, {'documentos': [documento.pk]})
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(mail.outbox, [])
+
+
+class ConfirmacaoLoteTests(GestaoTestCase):
+    """ confirmacao_lote_view: finaliza os documentos marcados e deixa as respostas para depois do commit. """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.chefe = cls.criar_usuario('chefe.teste', 'Procurador-Chefe')
+        cls.chefe.profile.definir_pin('1234')
+        cls.url = reverse('gestao:confirmacao_lote')
+        cls.lista = reverse('gestao:confirmacao_lista')
+
+    def setUp(self):
+        self.client.force_login(self.chefe)
+        self.notificar = self.criar_documento('Aguardando Confirmação', self.procurador, notificar_remetente=True)
+        self.sem_notificar = self.criar_documento('Aguardando Confirmação', self.procurador)
+        self.em_analise = self.criar_documento('Em Análise', self.procurador)
+
+    def confirmar(self, *documentos, pin='1234'):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            response = self.client.post(self.url, {'documentos': [documento.pk for documento in documentos], 'pin_digitado': pin})
+        self.assertRedirects(response, self.lista, fetch_redirect_response=False)
+        return response, callbacks
+
+    def test_finaliza_e_responde_apenas_quem_pediu_notificacao(self):
+        with self.assertLogs('gestao', 'INFO'):
+            response, callbacks = self.confirmar(self.notificar, self.sem_notificar, self.em_analise)
+
+        finalizados = Documento.objects.filter(status='Finalizado', finalizado_por=self.chefe)
+        self.assertQuerySetEqual(finalizados.order_by('pk'), [self.notificar, self.sem_notificar])
+        self.assertEqual(Documento.objects.get(pk=self.em_analise.pk).status, 'Em Análise')
+        self.assertEqual(
+            IntervaloStatus.objects.filter(documento=self.notificar, fim__isnull=True).get().status, 'Finalizado'
+        )
+        self.assertTrue(callbacks)
+        self.assertEqual([email.to for email in mail.outbox], [[self.remetente.email]])
+        self.assertIn(self.notificar.protocolo, mail.outbox[0].subject)
+        mensagens = [str(mensagem) for mensagem in get_messages(response.wsgi_request)]
+        self.assertTrue(any('1 documento(s) ignorado(s)' in mensagem for mensagem in mensagens))
+
+    def test_confirmacao_individual_segue_a_mesma_regra(self):
+        with self.assertLogs('gestao', 'INFO'):
+            for documento in (self.notificar, self.sem_notificar):
+                self.client.post(reverse('gestao:confirmacao_detail', args=[documento.pk]))
+        self.assertEqual(Documento.objects.filter(status='Finalizado').count(), 2)
+        self.assertEqual([email.to for email in mail.outbox], [[self.remetente.email]])
+        self.assertIn(self.notificar.protocolo, mail.outbox[0].subject)
+
+    def test_envio_so_depois_do_commit(self):
+        with self.captureOnCommitCallbacks(execute=False):
+            self.client.post(self.url, {'documentos': [self.notificar.pk], 'pin_digitado': '1234'})
+        self.assertEqual(mail.outbox, [])
+        # A resposta já está na fila, gravada com a finalização
+        self.assertQuerySetEqual(RespostaRemetentePendente.objects.values_list('documento_id', flat=True), [self.notificar.pk])
+
+    def test_fila_de_respostas(self):
+        with mock.patch('gestao.email_utils.EmailMultiAlternatives.send', side_effect=OSError('SMTP fora do ar')):
+            with self.assertLogs('gestao', 'INFO'):
+                self.confirmar(self.notificar, self.sem_notificar)
+        pendente = RespostaRemetentePendente.objects.get()
+        self.assertEqual((pendente.documento_id, pendente.tentativas), (self.notificar.pk, 1))
+
+        # Dentro da espera o comando não reenvia (a requisição pode estar enviando)
+        call_command('enviar_respostas_pendentes', stdout=StringIO())
+        self.assertEqual(mail.outbox, [])
+
+        RespostaRemetentePendente.objects.update(ultima_tentativa=timezone.now() - timedelta(minutes=15))
+        with self.assertLogs('gestao', 'INFO'):
+            call_command('enviar_respostas_pendentes', stdout=StringIO())
+        self.assertEqual([email.to for email in mail.outbox], [[self.remetente.email]])
+        self.assertFalse(RespostaRemetentePendente.objects.exists())
+
+    def test_fila_desiste_apos_o_maximo_de_tentativas(self):
+        RespostaRemetentePendente.objects.create(documento=self.notificar, tentativas=5)
+        saida = StringIO()
+        call_command('enviar_respostas_pendentes', '--espera', '0', stdout=saida)
+        self.assertEqual(mail.outbox, [])
+        self.assertIn('1 resposta(s) atingiram 5 tentativas', saida.getvalue())
+
+    def test_autorizacao_da_sessao_dispensa_o_pin(self):
+        with self.assertLogs('gestao', 'INFO'):
+            self.confirmar(self.notificar)
+            self.confirmar(self.sem_notificar, pin='')
+        self.assertEqual(Documento.objects.filter(status='Finalizado').count(), 2)
+
+    def test_pin_vazio_sem_autorizacao_nao_conta_tentativa(self):
+        response, _ = self.confirmar(self.notificar, pin='')
+        self.assertEqual(Documento.objects.filter(status='Finalizado').count(), 0)
+        self.assertIsNone(cache.get(self.chefe.profile._chave_tentativas_pin()))
+        mensagens = [str(mensagem) for mensagem in get_messages(response.wsgi_request)]
+        self.assertTrue(any('autorização de PIN expirou' in mensagem for mensagem in mensagens))
+
+    def test_pin_incorreto_nao_confirma(self):
+        self.confirmar(self.notificar, pin='9999')
+        self.assertEqual(Documento.objects.filter(status='Finalizado').count(), 0)
+        self.assertEqual(cache.get(self.chefe.profile._chave_tentativas_pin()), 1)
+        self.assertEqual(mail.outbox, [])
+
+
+class ProtocoloTests(GestaoTestCase):
+
+    def test_sequencial_do_dia_passa_de_999(self):
+        primeiro = self.criar_documento()
+        prefixo = timezone.localdate().strftime('%Y-%m-%d')
+        self.assertEqual(primeiro.protocolo, f'{prefixo}-001')
+        Documento.objects.filter(pk=primeiro.pk).update(protocolo=f'{prefixo}-999')
+
+        self.assertEqual(self.criar_documento().protocolo, f'{prefixo}-1000')
+        self.assertEqual(self.criar_documento().protocolo, f'{prefixo}-1001')
+
+
+class DistribuicaoFilaTests(GestaoTestCase):
+    """ distribuicao_view: fila paginada e "selecionar todos" pelo token assinado da fila. """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.url = reverse('gestao:distribuicao')
+
+    def setUp(self):
+        self.client.force_login(self.protocolista)
+
+    def distribuir_todos(self, filtro_token):
+        return self.client.post(self.url, {
+            'selecionar_todos': '1', 'filtro_token': filtro_token, 'procurador_id': self.procurador.pk,
+        })
+
+    def test_pagina_a_fila(self):
+        fila = [self.criar_documento() for _ in range(30)]
+        self.criar_documento('Em Análise', self.procurador)
+
+        response = self.client.get(self.url, {'page': 2})
+        self.assertEqual(response.context['total_documentos'], 30)
+        self.assertEqual([documento.pk for documento in response.context['documentos']], [documento.pk for documento in fila[25:]])
+
+        response = self.client.get(self.url, {'page_size': 50})
+        self.assertEqual(len(response.context['documentos']), 30)
+        self.assertFalse(response.context['is_paginated'])
+
+    def test_selecionar_todos_distribui_a_fila_da_pagina(self):
+        fila = [self.criar_documento() for _ in range(3)]
+        filtro_token = self.client.get(self.url).context['filtro_token']
+        novo = self.criar_documento()
+
+        with self.assertLogs('gestao', 'INFO'), self.captureOnCommitCallbacks(execute=True):
+            self.distribuir_todos(filtro_token)
+
+        distribuidos = Documento.objects.filter(status='Em Análise', procurador_atribuido=self.procurador)
+        self.assertQuerySetEqual(distribuidos.order_by('pk'), fila)
+        self.assertEqual(Documento.objects.get(pk=novo.pk).status, 'Aguardando Distribuição')
+        # Um único aviso ao procurador, com a lista dos documentos
+        self.assertEqual(len(mail.outbox), 1)
+        corpo = mail.outbox[0].alternatives[0][0]
+        self.assertTrue(all(documento.protocolo in corpo for documento in fila))
+
+    def test_atribuicao_em_lote(self):
+        urgente = NivelPrioridade.objects.create(descricao='Urgente', prazo_dias=3)
+        normais = [self.criar_documento() for _ in range(2)]
+        prioritario = self.criar_documento(prioridade=urgente)
+        ids = [documento.pk for documento in normais + [prioritario]]
+
+        with self.assertLogs('gestao', 'INFO'), self.captureOnCommitCallbacks(execute=True) as callbacks:
+            response = self.client.post(self.url, {'documento_selecionado': ids, 'procurador_id': self.procurador.pk})
+
+        self.assertRedirects(response, self.url, fetch_redirect_response=False)
+        self.assertEqual(len(callbacks), 1)
+        hoje = timezone.now().date()
+        for documento in Documento.objects.filter(pk__in=ids):
+            prazo = 3 if documento.pk == prioritario.pk else 15
+            self.assertEqual((documento.status, documento.procurador_atribuido_id), ('Em Análise', self.procurador.pk))
+            self.assertEqual(documento.data_limite, hoje + timedelta(days=prazo))
+            self.assertTrue(IntervaloStatus.objects.filter(documento=documento, status='Em Análise', fim__isnull=True).exists())
+
+    def test_consultas_nao_crescem_com_a_fila(self):
+        def consultas_para_distribuir(quantidade):
+            ids = [self.criar_documento().pk for _ in range(quantidade)]
+            with CaptureQueriesContext(connection) as consultas:
+                self.client.post(self.url, {'documento_selecionado': ids, 'procurador_id': self.procurador.pk})
+            return len(consultas.captured_queries)
+
+        consultas_para_distribuir(1)  # sessão e papéis do usuário já em cache nas seguintes
+        self.assertEqual(consultas_para_distribuir(2), consultas_para_distribuir(20))
+
+    def test_um_documento_vai_com_os_anexos(self):
+        documento = self.criar_documento()
+        Anexo.objects.create(
+            documento=documento, arquivo=ContentFile(b'%PDF-1.4', name='oficio.pdf'), usuario_upload=self.protocolista,
+        )
+
+        with self.assertLogs('gestao', 'INFO'), self.captureOnCommitCallbacks(execute=True):
+            self.client.post(self.url, {'documento_selecionado': [documento.pk], 'procurador_id': self.procurador.pk})
+
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn(documento.protocolo, mail.outbox[0].subject)
+        self.assertEqual(len(mail.outbox[0].attachments), 1)
+
+    def test_documento_sem_anexo_vai_sem_link(self):
+        documento = self.criar_documento()
+
+        with self.assertLogs('gestao', 'INFO'), self.captureOnCommitCallbacks(execute=True):
+            self.client.post(self.url, {'documento_selecionado': [documento.pk], 'procurador_id': self.procurador.pk})
+
+        corpo = mail.outbox[0].alternatives[0][0]
+        self.assertIn(documento.protocolo, corpo)
+        self.assertNotIn('href="None"', corpo)
+
+    def test_selecionar_todos_ignora_quem_voltou_a_fila_depois(self):
+        devolvido = self.criar_documento('Em Análise', self.procurador)
+        na_fila = self.criar_documento()
+        filtro_token = self.client.get(self.url).context['filtro_token']
+
+        devolvido.status = 'Devolvido pela Análise'
+        devolvido.procurador_atribuido = None
+        devolvido.save()
+        outro_procurador = self.criar_usuario('procurador.fila', 'Procuradores')
+        self.client.post(self.url, {
+                'selecionar_todos': '1', 'filtro_token': filtro_token, 'procurador_id': outro_procurador.pk,
+            })
+
+        self.assertEqual(Documento.objects.get(pk=na_fila.pk).procurador_atribuido, outro_procurador)
+        self.assertEqual(Documento.objects.get(pk=devolvido.pk).status, 'Devolvido pela Análise')
+
+    def test_token_adulterado(self):
+        self.criar_documento()
+        response = self.distribuir_todos(signing.dumps({'ate_id': 10 ** 9}, salt='outro'))
+        self.assertRedirects(response, self.url, fetch_redirect_response=False)
+        self.assertFalse(Documento.objects.filter(status='Em Análise').exists())
+
+
+class PrazosTests(GestaoTestCase):
+    """ com_prazos() e filtrar_prazo(): situação do prazo calculada no SQL contra uma data fixa. """
+
+    HOJE = date(2026, 3, 10)
+
+    def setUp(self):
+        hoje_fixo = mock.patch('django.utils.timezone.localdate', return_value=self.HOJE)
+        hoje_fixo.start()
+        self.addCleanup(hoje_fixo.stop)
+        self.documentos = {
+            nome: self.criar_com_limite(dias)
+            for nome, dias in (('atrasado', -1), ('hoje', 0), ('no_limite_do_alerta', 3), ('folgado', 4), ('sem_limite', None))
+        }
+        finalizado = self.criar_com_limite(-5)
+        Documento.objects.filter(pk=finalizado.pk).update(status='Finalizado', data_finalizacao=timezone.now())
+        self.documentos['finalizado'] = finalizado
+
+    def criar_com_limite(self, dias):
+        documento = self.criar_documento('Em Análise', self.procurador)
+        Documento.objects.filter(pk=documento.pk).update(data_limite=None if dias is None else self.HOJE + timedelta(days=dias))
+        return documento
+
+    def nomes(self, ids):
+        ids = set(ids)
+        return {nome for nome, documento in self.documentos.items() if documento.pk in ids}
+
+    def test_anotacoes(self):
+        anotados = {
+            documento.pk: (documento.dias_restantes, documento.atrasado, documento.prazo_proximo)
+            for documento in Documento.objects.com_prazos()
+        }
+        esperado = {
+            'atrasado': (-1, True, False),
+            'hoje': (0, False, True),
+            'no_limite_do_alerta': (3, False, True),
+            'folgado': (4, False, False),
+            'sem_limite': (None, False, False),
+            # Finalizado não fica atrasado, mas os dias restantes continuam calculados
+            'finalizado': (-5, False, False),
+        }
+        self.assertEqual({nome: anotados[documento.pk] for nome, documento in self.documentos.items()}, esperado)
+
+    def test_ordena_pelos_dias_restantes(self):
+        ordem = Documento.objects.com_prazos().filter(data_limite__isnull=False).order_by('dias_restantes')
+        self.assertEqual([documento.pk for documento in ordem][:2], [self.documentos['finalizado'].pk, self.documentos['atrasado'].pk])
+
+    def test_filtrar_prazo(self):
+        def filtrar(situacao):
+            return self.nomes(Documento.objects.filtrar_prazo(situacao).values_list('pk', flat=True))
+
+        self.assertEqual(filtrar('atrasado'), {'atrasado'})
+        self.assertEqual(filtrar('prazo_proximo'), {'hoje', 'no_limite_do_alerta'})
+        self.assertEqual(filtrar('no_prazo'), {'folgado'})
+        self.assertEqual(filtrar(''), set(self.documentos))
+
+    def test_filtro_de_prazo_do_monitoramento(self):
+        self.client.force_login(self.protocolista)
+        url = reverse('gestao:monitoramento_analises')
+
+        def listados(**parametros):
+            response = self.client.get(url, {'page_size': 50, **parametros})
+            return self.nomes(documento.pk for documento in response.context['documentos'])
+
+        self.assertEqual(listados(prazo='atrasado'), {'atrasado'})
+        self.assertEqual(listados(prazo='prazo_proximo'), {'hoje', 'no_limite_do_alerta'})
+        self.assertEqual(listados(prazo='no_prazo'), {'folgado'})
+        # Situação desconhecida é ignorada (o finalizado não entra no monitoramento)
+        self.assertEqual(listados(prazo='qualquer'), set(self.documentos) - {'finalizado'})
+
+
+class ListasPaginadasTests(GestaoTestCase):
+    """ Mesa do procurador e lista de confirmação: paginadas e ordenáveis por urgência no SQL. """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.urgente = NivelPrioridade.objects.create(descricao='Urgente', prazo_dias=3)
+        cls.analista = cls.criar_usuario('analista.listas', 'Procurador-Analista')
+
+    def criar_com_prazo(self, status, dias, prioridade=None, **campos):
+        """ Documento do procurador com data limite daqui a `dias` dias (negativo: vencida). """
+        documento = self.criar_documento(status, self.procurador, **campos)
+        Documento.objects.filter(pk=documento.pk).update(
+            data_limite=timezone.localdate() + timedelta(days=dias), prioridade=prioridade or self.prioridade,
+        )
+        return documento
+
+    def ids(self, response):
+        return [documento.pk for documento in response.context['documentos']]
+
+    def test_mesa_do_procurador_paginada(self):
+        documentos = [self.criar_com_prazo('Em Análise', dias) for dias in range(30)]
+        self.criar_documento('Em Análise', self.criar_usuario('procurador.alheio', 'Procuradores'))
+        self.client.force_login(self.procurador)
+        url = reverse('gestao:procurador_dashboard')
+
+        response = self.client.get(url, {'page': 2})
+        self.assertEqual(response.context['total_documentos'], 30)
+        self.assertEqual(self.ids(response), [documento.pk for documento in documentos[25:]])
+
+        # Tamanho fora das opções volta ao padrão
+        self.assertEqual(len(self.client.get(url, {'page_size': 7}).context['documentos']), 25)
+        self.assertEqual(len(self.client.get(url, {'page_size': 50}).context['documentos']), 30)
+
+    def test_mesa_do_procurador_por_urgencia(self):
+        folgado = self.criar_com_prazo('Em Análise', 10)
+        atrasado = self.criar_com_prazo('Rejeitado', -1)
+        prioritario = self.criar_com_prazo('Em Diligência', 20, prioridade=self.urgente)
+        self.client.force_login(self.procurador)
+        url = reverse('gestao:procurador_dashboard')
+
+        response = self.client.get(url)
+        self.assertEqual(response.context['ordenacao'], 'prazo')
+        self.assertEqual(self.ids(response), [atrasado.pk, folgado.pk, prioritario.pk])
+
+        response = self.client.get(url, {'ordenar': 'urgencia'})
+        self.assertEqual(response.context['ordenacao'], 'urgencia')
+        self.assertEqual(self.ids(response), [atrasado.pk, prioritario.pk, folgado.pk])
+        self.assertTrue(response.context['documentos'][0].atrasado)
+
+    def test_lista_de_confirmacao(self):
+        agora = timezone.now()
+        recente = self.criar_com_prazo('Aguardando Confirmação', 10, data_resposta_procurador=agora)
+        antigo = self.criar_com_prazo('Aguardando Confirmação', 5, data_resposta_procurador=agora - timedelta(days=2))
+        prioritario = self.criar_com_prazo(
+            'Aguardando Confirmação', 8, prioridade=self.urgente, data_resposta_procurador=agora - timedelta(days=1),
+        )
+        self.client.force_login(self.analista)
+        url = reverse('gestao:confirmacao_lista')
+
+        self.assertEqual(self.ids(self.client.get(url)), [antigo.pk, prioritario.pk, recente.pk])
+        self.assertEqual(self.ids(self.client.get(url, {'ordenar': 'urgencia'})), [prioritario.pk, antigo.pk, recente.pk])
+        # Ordenação desconhecida volta à padrão
+        self.assertEqual(self.client.get(url, {'ordenar': 'id'}).context['ordenacao'], 'resposta')
+
+
+class ConexaoFalsa:
+    """ Conexão DB-API de mentira para os testes do pool. """
+
+    def __init__(self):
+        self.fechada = False
+
+    def close(self):
+        self.fechada = True
+
+
+@mock.patch('gestao.pool_banco.ESPERA_INTERVALO', 0.01)
+class PoolConexoesTests(SimpleTestCase):
+    """ PoolConexoes (backend gestao.pool_mysql) com conexões falsas. """
+
+    def obter(self, pool, verificar=None):
+        return pool.obter(ConexaoFalsa, verificar)
+
+    def test_devolvida_e_reaproveitada(self):
+        pool = PoolConexoes('teste', max_size=2)
+        conexao, criada_em = self.obter(pool)
+        pool.devolver(conexao, criada_em)
+
+        self.assertIs(self.obter(pool)[0], conexao)
+        estatisticas = pool.estatisticas()
+        self.assertEqual(
+            {chave: estatisticas[chave] for chave in ('checkouts', 'criadas', 'reaproveitadas', 'abertas', 'livres', 'em_uso')},
+            {'checkouts': 2, 'criadas': 1, 'reaproveitadas': 1, 'abertas': 1, 'livres': 0, 'em_uso': 1},
+        )
+
+    def test_espera_uma_devolucao(self):
+        pool = PoolConexoes('teste', max_size=1, timeout=5)
+        conexao, criada_em = self.obter(pool)
+        devolucao = threading.Timer(0.05, pool.devolver, (conexao, criada_em))
+        devolucao.start()
+
+        self.assertIs(self.obter(pool)[0], conexao)
+        devolucao.join()
+        self.assertEqual(pool.estatisticas()['esperas'], 1)
+        self.assertGreater(pool.estatisticas()['espera_total_ms'], 0)
+
+    def test_esgotado_apos_o_timeout(self):
+        pool = PoolConexoes('teste', max_size=1, timeout=0.05)
+        self.obter(pool)
+        with self.assertLogs('gestao.desempenho', 'WARNING'), self.assertRaises(PoolEsgotado):
+            self.obter(pool)
+        self.assertEqual(pool.estatisticas()['esgotado'], 1)
+
+    def test_conexao_velha_e_fechada(self):
+        pool = PoolConexoes('teste', max_lifetime=60)
+        conexao, criada_em = self.obter(pool)
+        pool.devolver(conexao, criada_em - 120)
+
+        nova = self.obter(pool)[0]
+        self.assertIsNot(nova, conexao)
+        self.assertTrue(conexao.fechada)
+        self.assertEqual(pool.estatisticas()['descartadas_idade'], 1)
+        self.assertEqual(pool.estatisticas()['abertas'], 1)
+
+    def test_conexao_derrubada_e_trocada(self):
+        pool = PoolConexoes('teste')
+        conexao, criada_em = self.obter(pool)
+        pool.devolver(conexao, criada_em)
+
+        def verificar(conexao):
+            raise OSError('MySQL server has gone away')
+
+        self.assertIsNot(self.obter(pool, verificar)[0], conexao)
+        self.assertTrue(conexao.fechada)
+        self.assertEqual(pool.estatisticas()['reconexoes'], 1)
+
+    def test_conexao_com_erro_nao_volta(self):
+        pool = PoolConexoes('teste', max_size=1)
+        conexao, criada_em = self.obter(pool)
+        pool.devolver(conexao, criada_em, descartar=True)
+
+        self.assertTrue(conexao.fechada)
+        self.assertEqual(pool.estatisticas()['descartadas_erro'], 1)
+        # A vaga foi liberada: uma nova conexão pode ser aberta
+        self.assertIsNot(self.obter(pool)[0], conexao)
+
+    def test_falha_ao_conectar_libera_a_vaga(self):
+        pool = PoolConexoes('teste', max_size=1)
+        with self.assertRaises(OSError):
+            pool.obter(mock.Mock(side_effect=OSError('recusada')))
+        self.assertEqual(pool.estatisticas()['abertas'], 0)
+        self.obter(pool)
+
+    def test_processo_filho_ganha_pool_novo(self):
+        with mock.patch.dict('gestao.pool_banco._pools', clear=True):
+            pool = obter_pool('teste', max_size=3)
+            self.assertIs(obter_pool('teste'), pool)
+            conexao, criada_em = self.obter(pool)
+
+            with mock.patch('gestao.pool_banco.os.getpid', return_value=pool.pid + 1):
+                # No filho a conexão herdada não é fechada nem reaproveitada (o socket é do processo pai)
+                pool.devolver(conexao, criada_em)
+                novo = obter_pool('teste', max_size=3)
+            self.assertIsNot(novo, pool)
+            self.assertFalse(conexao.fechada)
+            self.assertEqual(pool.estatisticas()['livres'], 0)
+
+    def test_estatisticas_do_pool_psycopg(self):
+        pool = mock.Mock()
+        pool.get_stats.return_value = {
+            'pool_max': 4, 'pool_size': 3, 'pool_available': 1, 'requests_num': 10, 'connections_num': 3,
+            'requests_queued': 2, 'requests_wait_ms': 40, 'connections_lost': 1, 'returns_bad': 1, 'requests_errors': 0,
+        }
+        self.assertEqual(_estatisticas_pool_psycopg(pool), {
+            'modo': 'pool', 'max_size': 4, 'abertas': 3, 'livres': 1, 'em_uso': 2, 'checkouts': 10, 'criadas': 3,
+            'esperas': 2, 'espera_total_ms': 40, 'reconexoes': 2, 'esgotado': 0,
+        })
+
+    def test_estatisticas_por_alias(self):
+        with mock.patch.dict('gestao.pool_banco._pools', clear=True):
+            pool = obter_pool(DEFAULT_DB_ALIAS)
+            self.obter(pool)
+            self.assertEqual(estatisticas_conexoes()[DEFAULT_DB_ALIAS]['modo'], 'pool')
+        self.assertIn(estatisticas_conexoes()[DEFAULT_DB_ALIAS]['modo'], ('persistente', 'por_requisicao'))
+
+
+@skipUnless(importlib.util.find_spec('MySQLdb'), 'mysqlclient não instalado')
+class PoolMysqlBackendTests(SimpleTestCase):
+    """ gestao.pool_mysql: connect() pega do pool e close() devolve (ou descarta, após erro). """
+
+    def criar_wrapper(self, **configuracao):
+        from .pool_mysql.base import DatabaseWrapper
+        settings_dict = {
+            **connections.settings[DEFAULT_DB_ALIAS], 'ENGINE': 'gestao.pool_mysql',
+            'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False, 'OPTIONS': {'pool': {'max_size': 2}}, **configuracao,
+        }
+        return DatabaseWrapper(settings_dict, alias='pool_mysql_teste')
+
+    def conectar(self, wrapper):
+        with mock.patch('django.db.backends.mysql.base.DatabaseWrapper.get_new_connection', side_effect=lambda params: ConexaoFalsa()):
+            wrapper.connection = wrapper.get_new_connection({})
+        return wrapper.connection
+
+    def test_close_devolve_ao_pool(self):
+        with mock.patch.dict('gestao.pool_banco._pools', clear=True):
+            wrapper = self.criar_wrapper()
+            conexao = self.conectar(wrapper)
+            wrapper._close()
+            self.assertFalse(conexao.fechada)
+            self.assertIs(self.conectar(wrapper), conexao)
+
+            wrapper.errors_occurred = True
+            wrapper._close()
+            self.assertTrue(conexao.fechada)
+            self.assertEqual(obter_pool('pool_mysql_teste').estatisticas()['descartadas_erro'], 1)
+
+    def test_exige_conn_max_age_zero(self):
+        with self.assertRaises(ImproperlyConfigured):
+            self.criar_wrapper(CONN_MAX_AGE=60).get_new_connection({})
+
+
+@mock.patch('gestao.replica.replica_configurada', return_value=True)
+class RoteamentoReplicaTests(SimpleTestCase):
+    """ RoteadorReplica e RoteamentoReplicaMiddleware com uma réplica configurada (sem acessar o banco). """
+
+    roteador = RoteadorReplica()
+
+    def test_fora_dos_escopos_le_do_primario(self, _):
+        self.assertIsNone(self.roteador.db_for_read(Documento))
+        with escopo_requisicao():
+            self.assertIsNone(self.roteador.db_for_read(Documento))
+
+    def test_escopo_de_leitura_usa_a_replica(self, _):
+        with ler_da_replica():
+            self.assertEqual(self.roteador.db_for_read(Documento), ALIAS_REPLICA)
+            self.assertIsNone(self.roteador.db_for_read(Session))
+            self.assertEqual(self.roteador.db_for_write(Documento), DEFAULT_DB_ALIAS)
+            # Nos comandos a escrita (trava, registro de envios) não devolve as leituras ao primário
+            self.assertEqual(self.roteador.db_for_read(Documento), ALIAS_REPLICA)
+
+    def test_requisicao_le_as_proprias_escritas(self, _):
+        with escopo_requisicao(), ler_da_replica(ler_escritas=True):
+            self.roteador.db_for_write(Session)
+            self.assertEqual(self.roteador.db_for_read(Documento), ALIAS_REPLICA)
+            self.roteador.db_for_write(Documento)
+            self.assertIsNone(self.roteador.db_for_read(Documento))
+
+    def test_migracoes_so_no_primario(self, _):
+        self.assertFalse(self.roteador.allow_migrate(ALIAS_REPLICA, 'gestao'))
+        self.assertIsNone(self.roteador.allow_migrate(DEFAULT_DB_ALIAS, 'gestao'))
+
+    def test_view_de_leitura_respeita_o_cookie_da_ultima_escrita(self, _):
+        @leitura_em_replica
+        def view(request):
+            return self.roteador.db_for_read(Documento)
+
+        fabrica = RequestFactory()
+        request = fabrica.get('/')
+        self.assertEqual(view(request), ALIAS_REPLICA)
+
+        request.COOKIES[COOKIE_ULTIMA_ESCRITA] = str(time.time())
+        self.assertIsNone(view(request))
+        self.assertTrue(escrita_recente(request))
+
+        request.COOKIES[COOKIE_ULTIMA_ESCRITA] = str(time.time() - settings.GESTAO_REPLICA_JANELA_SEGUNDOS - 1)
+        self.assertEqual(view(request), ALIAS_REPLICA)
+        request.COOKIES[COOKIE_ULTIMA_ESCRITA] = 'invalido'
+        self.assertFalse(escrita_recente(request))
+
+    @mock.patch('gestao.middleware.replica_configurada', return_value=True)
+    def test_middleware_marca_a_escrita_no_cookie(self, *_):
+        def gravar(request):
+            self.roteador.db_for_write(Documento)
+            return HttpResponse()
+
+        def ler(request):
+            self.roteador.db_for_read(Documento)
+            self.roteador.db_for_write(Session)  # gravar a sessão não conta como escrita do usuário
+            return HttpResponse()
+
+        response = RoteamentoReplicaMiddleware(gravar)(RequestFactory().post('/'))
+        self.assertIn(COOKIE_ULTIMA_ESCRITA, response.cookies)
+        self.assertEqual(response.cookies[COOKIE_ULTIMA_ESCRITA]['max-age'], settings.GESTAO_REPLICA_JANELA_SEGUNDOS)
+
+        response = RoteamentoReplicaMiddleware(ler)(RequestFactory().get('/'))
+        self.assertNotIn(COOKIE_ULTIMA_ESCRITA, response.cookies)
+
+
+class TravaExecucaoTests(TestCase):
+    """ gestao/travas.py: uma execução por vez; trava vencida pode ser tomada. """
+
+    def test_segunda_execucao_nao_obtem_a_trava(self):
+        dono = adquirir_trava('comando')
+        self.assertIsNotNone(dono)
+        self.assertIsNone(adquirir_trava('comando'))
+        self.assertIsNotNone(adquirir_trava('outro_comando'))
+
+        liberar_trava('comando', dono)
+        self.assertIsNotNone(adquirir_trava('comando'))
+
+    def test_trava_vencida_pode_ser_tomada(self):
+        dono = adquirir_trava('comando')
+        TravaExecucao.objects.filter(nome='comando').update(expira_em=timezone.now() - timedelta(seconds=1))
+        novo_dono = adquirir_trava('comando')
+        self.assertIsNotNone(novo_dono)
+
+        # A execução antiga, ao terminar, não libera a trava que já não é dela
+        liberar_trava('comando', dono)
+        self.assertEqual(TravaExecucao.objects.get(nome='comando').dono, novo_dono)
+
+    def test_contexto_libera_ao_sair(self):
+        with trava_execucao('comando') as obtida:
+            self.assertTrue(obtida)
+            with trava_execucao('comando') as obtida_em_paralelo:
+                self.assertFalse(obtida_em_paralelo)
+            self.assertTrue(TravaExecucao.objects.filter(nome='comando').exists())
+        self.assertFalse(TravaExecucao.objects.exists())
+
+
+class NotificarAtrasosTests(GestaoTestCase):
+    """ notificar_atrasos: cada alerta sai uma vez por dia (registro em NotificacaoEnviada). """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.chefe = cls.criar_usuario('chefe.atrasos', 'Procurador-Chefe')
+
+    def criar_atrasado(self, dias_atraso=5):
+        documento = self.criar_documento('Em Análise', self.procurador)
+        Documento.objects.filter(pk=documento.pk).update(data_limite=timezone.localdate() - timedelta(days=dias_atraso))
+        return documento
+
+    def executar(self):
+        saida = StringIO()
+        call_command('notificar_atrasos', stdout=saida)
+        return saida.getvalue()
+
+    def destinatarios(self):
+        return sorted(email.to[0] for email in mail.outbox)
+
+    def test_alertas_saem_uma_vez_por_dia(self):
+        primeiro = self.criar_atrasado()
+        self.criar_documento('Em Análise', self.procurador)  # no prazo
+
+        self.executar()
+        self.assertEqual(self.destinatarios(), sorted([self.procurador.email, self.chefe.email]))
+        self.assertEqual(
+            set(NotificacaoEnviada.objects.values_list('tipo', 'destinatario_id', 'documento_id')),
+            {('atraso_procurador', self.procurador.pk, primeiro.pk), ('atraso_chefia', self.chefe.pk, primeiro.pk)},
+        )
+
+        mail.outbox.clear()
+        self.executar()
+        self.assertEqual(mail.outbox, [])
+
+        # Um novo atraso no mesmo dia: o procurador recebe só ele, a chefia o relatório completo
+        segundo = self.criar_atrasado(dias_atraso=1)
+        self.executar()
+        self.assertEqual(self.destinatarios(), sorted([self.procurador.email, self.chefe.email]))
+        email_procurador = next(email for email in mail.outbox if email.to == [self.procurador.email])
+        self.assertIn(segundo.protocolo, email_procurador.alternatives[0][0])
+        self.assertNotIn(primeiro.protocolo, email_procurador.alternatives[0][0])
+        email_chefe = next(email for email in mail.outbox if email.to == [self.chefe.email])
+        self.assertIn(primeiro.protocolo, email_chefe.alternatives[0][0])
+
+    def test_registro_antigo_e_descartado(self):
+        documento = self.criar_atrasado()
+        antigo = timezone.localdate() - timedelta(days=31)
+        NotificacaoEnviada.registrar('atraso_procurador', antigo, self.procurador.pk, [documento.pk])
+        self.executar()
+        self.assertFalse(NotificacaoEnviada.objects.filter(data=antigo).exists())
+
+    def test_outra_execucao_em_andamento(self):
+        self.criar_atrasado()
+        adquirir_trava('notificar_atrasos')
+        self.assertIn('Outra execução', self.executar())
+        self.assertEqual(mail.outbox, [])
+
+
+class NotificarPrazosProximosTests(GestaoTestCase):
+    """ notificar_prazos_proximos: um lembrete consolidado por procurador, uma vez por prazo. """
+
+    def criar_com_prazo(self, dias, procurador=None, status='Em Análise'):
+        documento = self.criar_documento(status, procurador or self.procurador)
+        Documento.objects.filter(pk=documento.pk).update(data_limite=timezone.localdate() + timedelta(days=dias))
+        return documento
+
+    def executar(self, *argumentos):
+        call_command('notificar_prazos_proximos', *argumentos, stdout=StringIO())
+
+    def test_um_lembrete_por_prazo(self):
+        amanha = self.criar_com_prazo(1)
+        depois = self.criar_com_prazo(3)
+        self.criar_com_prazo(10)  # fora da janela
+        self.criar_com_prazo(1, status='Análise Concluída')  # já respondido
+
+        self.executar('--dias', '3')
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, [self.procurador.email])
+        self.assertIn('2 processo(s)', mail.outbox[0].subject)
+        self.assertEqual(
+            set(NotificacaoEnviada.objects.values_list('tipo', 'data', 'documento_id')),
+            {('prazo_proximo', timezone.localdate() + timedelta(days=1), amanha.pk),
+             ('prazo_proximo', timezone.localdate() + timedelta(days=3), depois.pk)},
+        )
+
+        mail.outbox.clear()
+        self.executar('--dias', '3')
+        self.assertEqual(mail.outbox, [])
+
+        # Prazo alterado (ex.: reatribuição): é um prazo novo, com lembrete novo
+        Documento.objects.filter(pk=amanha.pk).update(data_limite=timezone.localdate() + timedelta(days=2))
+        self.executar('--dias', '3')
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn('1 processo(s)', mail.outbox[0].subject)
+
+    def test_procurador_sem_email_e_ignorado(self):
+        sem_email = self.criar_usuario('procurador.prazo.sem.email', 'Procuradores', email='')
+        self.criar_com_prazo(1, procurador=sem_email)
+        self.executar()
+        self.assertEqual(mail.outbox, [])
+        self.assertFalse(NotificacaoEnviada.objects.exists())
+
+    def test_outra_execucao_em_andamento(self):
+        self.criar_com_prazo(1)
+        adquirir_trava('notificar_prazos_proximos')
+        self.executar()
+        self.assertEqual(mail.outbox, [])
+
+
+class ProfileSignalTests(GestaoTestCase):
+    """ save_user_profile: o login não toca no Profile; um user.save() comum grava o que mudou. """
+
+    def consultas_profile(self, consultas):
+        return [consulta['sql'] for consulta in consultas.captured_queries if Profile._meta.db_table in consulta['sql']]
+
+    def test_login_nao_grava_o_profile(self):
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertTrue(self.client.login(username=self.procurador.username, password='senha'))
+        self.assertTrue(any('last_login' in consulta['sql'] for consulta in consultas.captured_queries))
+        self.assertEqual(self.consultas_profile(consultas), [])
+
+    def test_save_grava_o_profile_alterado(self):
+        usuario = User.objects.get(pk=self.procurador.pk)
+        usuario.first_name = 'Ana'
+        usuario.profile.pin_autorizacao = 'hash-do-pin'
+        usuario.save()
+        self.assertEqual(Profile.objects.get(user=usuario).pin_autorizacao, 'hash-do-pin')
+
+    def test_save_nao_regrava_o_profile_inalterado(self):
+        usuario = User.objects.select_related('profile').get(pk=self.procurador.pk)
+        with CaptureQueriesContext(connection) as consultas:
+            usuario.save()
+        self.assertEqual(self.consultas_profile(consultas), [])
+
+    def test_save_cria_o_profile_ausente(self):
+        Profile.objects.filter(user=self.procurador).delete()
+        usuario = User.objects.get(pk=self.procurador.pk)
+        usuario.save()
+        self.assertTrue(Profile.objects.filter(user=usuario).exists())
+
+
+@override_settings(GESTAO_PIN_MAX_TENTATIVAS=3)
+class PinAutorizacaoTests(GestaoTestCase):
+    """ PIN conferido uma vez e trocado por uma autorização assinada; erros demais bloqueiam a conferência. """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.chefe = cls.criar_usuario('chefe.pin', 'Procurador-Chefe')
+        cls.chefe.profile.definir_pin('1234')
+        cls.url = reverse('gestao:verificar_pin_ajax')
+
+    def setUp(self):
+        self.profile = Profile.objects.get(user=self.chefe)
+        self.client.force_login(self.chefe)
+
+    def verificar(self, pin):
+        return self.client.post(self.url, {'pin_digitado': pin})
+
+    def test_erros_acumulam_ate_o_bloqueio(self):
+        self.assertFalse(self.profile.verificar_pin('0000'))
+        self.assertFalse(self.profile.verificar_pin('1111'))
+        self.assertFalse(self.profile.verificar_pin('2222'))
+        with self.assertRaises(PinBloqueado):
+            self.profile.verificar_pin('1234')
+
+    def test_formato_invalido_nao_conta_como_tentativa(self):
+        self.assertFalse(self.profile.verificar_pin('0000'))
+        self.assertFalse(self.profile.verificar_pin('1111'))
+        for pin in ('', '12', '12345', 'abcd', '１２３４'):
+            self.assertFalse(self.profile.verificar_pin(pin))
+        self.assertTrue(self.profile.verificar_pin('1234'))
+
+    def test_pin_correto_zera_as_tentativas(self):
+        self.profile.verificar_pin('0000')
+        self.profile.verificar_pin('0000')
+        self.assertTrue(self.profile.verificar_pin('1234'))
+        self.assertFalse(self.profile.verificar_pin('0000'))
+        self.assertFalse(self.profile.verificar_pin('0000'))
+        self.assertTrue(self.profile.verificar_pin('1234'))
+
+    def test_view_responde_erro_e_bloqueio(self):
+        with self.assertLogs('django.request', 'WARNING'):
+            self.assertEqual(self.verificar('9999').json(), {'success': False, 'error': 'PIN incorreto.'})
+            self.assertEqual(self.verificar('12').json(), {'success': False, 'error': 'PIN inválido. Deve conter 4 números.'})
+            self.assertEqual(self.verificar('9999').status_code, 400)
+            self.assertEqual(self.verificar('9999').status_code, 400)
+            response = self.verificar('1234')
+        self.assertEqual(response.status_code, 429)
+        self.assertNotIn(SESSAO_AUTORIZACAO_PIN, self.client.session)
+
+    def test_autorizacao_dispensa_nova_conferencia(self):
+        self.assertEqual(self.verificar('1234').json(), {'success': True})
+        autorizacao = self.client.session[SESSAO_AUTORIZACAO_PIN]
+        self.assertTrue(self.profile.autorizacao_pin_valida(autorizacao))
+
+        request = RequestFactory().get('/')
+        request.user = self.chefe
+        request.session = self.client.session
+        with mock.patch.object(Profile, 'verificar_pin') as verificar_pin:
+            self.assertTrue(pin_autorizado(request))
+        verificar_pin.assert_not_called()
+
+    def test_trocar_o_pin_invalida_a_autorizacao(self):
+        autorizacao = self.profile.emitir_autorizacao_pin()
+        self.profile.definir_pin('4321')
+        self.assertFalse(self.profile.autorizacao_pin_valida(autorizacao))
+        self.assertFalse(self.profile.autorizacao_pin_valida(autorizacao + 'x'))
+
+    @override_settings(GESTAO_PIN_VALIDADE_SEGUNDOS=-1)
+    def test_autorizacao_expira(self):
+        autorizacao = self.profile.emitir_autorizacao_pin()
+        self.assertFalse(self.profile.autorizacao_pin_valida(autorizacao))
+
+
+class VisibilidadeDocumentosTests(GestaoTestCase):
+    """ DocumentoQuerySet.visible_to / actionable_by e as views que dependem deles. """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.outro_procurador = cls.criar_usuario('procurador.visibilidade', 'Procuradores')
+        cls.chefe = cls.criar_usuario('chefe.visibilidade', 'Procurador-Chefe')
+        cls.sem_grupo = cls.criar_usuario('sem.grupo')
+        cls.admin = User.objects.create_superuser('admin.visibilidade', 'admin@sintetico.local', 'senha')
+        cls.meu = cls.criar_documento('Em Análise', cls.procurador)
+        cls.alheio = cls.criar_documento('Em Análise', cls.outro_procurador)
+        cls.na_fila = cls.criar_documento()
+
+    def ids(self, queryset):
+        return set(queryset.values_list('pk', flat=True))
+
+    def test_visible_to(self):
+        todos = {self.meu.pk, self.alheio.pk, self.na_fila.pk}
+        for usuario in (self.admin, self.protocolista, self.chefe):
+            self.assertEqual(self.ids(Documento.objects.visible_to(usuario)), todos, usuario.username)
+        self.assertEqual(self.ids(Documento.objects.visible_to(self.procurador)), {self.meu.pk})
+        self.assertEqual(self.ids(Documento.objects.visible_to(self.sem_grupo)), set())
+        # Com os papéis informados (da sessão), o filtro não consulta os grupos
+        with self.assertNumQueries(1):
+            self.assertEqual(self.ids(Documento.objects.visible_to(self.procurador, {'Procuradores'})), {self.meu.pk})
+
+    def test_actionable_by(self):
+        self.assertEqual(self.ids(Documento.objects.actionable_by(self.chefe)), {self.meu.pk, self.alheio.pk, self.na_fila.pk})
+        self.assertEqual(self.ids(Documento.objects.actionable_by(self.chefe, somente_atribuidos=True)), set())
+        self.assertEqual(self.ids(Documento.objects.actionable_by(self.procurador)), {self.meu.pk})
+        self.assertEqual(self.ids(Documento.objects.actionable_by(self.protocolista)), set())
+
+    def test_views_usam_os_filtros(self):
+        self.client.force_login(self.procurador)
+        self.assertEqual(self.client.get(reverse('gestao:documento_consulta', args=[self.meu.pk])).status_code, 200)
+        with self.assertLogs('django.request', 'WARNING'):
+            self.assertEqual(self.client.get(reverse('gestao:documento_consulta', args=[self.alheio.pk])).status_code, 404)
+            self.assertEqual(self.client.get(reverse('gestao:documento_detail', args=[self.alheio.pk])).status_code, 404)
+
+        self.client.force_login(self.chefe)
+        self.assertEqual(self.client.get(reverse('gestao:documento_detail', args=[self.alheio.pk])).status_code, 200)
+
+
+class CacheNamespacesTests(TestCase):
+    """ gestao/cache.py: valores por namespace versionado, invalidados no commit. """
+
+    def setUp(self):
+        self.calculos = 0
+
+    def calcular(self):
+        self.calculos += 1
+        return {'calculo': self.calculos}
+
+    def obter(self):
+        return obter_ou_calcular('teste', 'valor', self.calcular)
+
+    def test_valor_calculado_uma_vez(self):
+        self.assertEqual(self.obter(), {'calculo': 1})
+        self.assertEqual(self.obter(), {'calculo': 1})
+        self.assertEqual(self.calculos, 1)
+
+    def test_invalidar_so_vale_no_commit(self):
+        self.obter()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            invalidar('teste')
+            invalidar('teste')
+            # Antes do commit as leituras ainda usam a versão antiga
+            self.assertEqual(self.obter(), {'calculo': 1})
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(self.obter(), {'calculo': 2})
+
+    def test_invalidar_outro_namespace_nao_afeta(self):
+        self.obter()
+        versao_anterior = versao('teste')
+        with self.captureOnCommitCallbacks(execute=True):
+            invalidar('outro')
+        self.assertEqual(versao('teste'), versao_anterior)
+        self.assertEqual(self.obter(), {'calculo': 1})
+
+    def test_savepoint_desfeito_nao_perde_a_invalidacao(self):
+        self.obter()
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    invalidar('teste')
+                    raise IntegrityError
+            except IntegrityError:
+                pass
+            invalidar('teste')
+        self.assertEqual(self.obter(), {'calculo': 2})
+
+    @mock.patch('gestao.cache.ESPERA_MAXIMA', 0.1)
+    def test_calculo_em_andamento_em_outra_requisicao(self):
+        versao('teste')
+        cache.add('gestao:teste:valor:calculando', 1)
+        # Sem o resultado da outra requisição dentro da espera, calcula sem guardar
+        self.assertEqual(self.obter(), {'calculo': 1})
+        self.assertIsNone(cache.get('gestao:teste:valor'))
+
+
+class PainelFragmentosTests(GestaoTestCase):
+    """ Cards do painel em {% cache using="fragmentos" %}: chave por papéis e pelos contadores. """
+
+    def setUp(self):
+        caches['fragmentos'].clear()
+
+    def total_card(self, response, titulo):
+        html = response.content.decode()
+        return int(re.search(r'display-4">(\d+)</h1>\s*<p class="card-text fs-5">' + titulo, html).group(1))
+
+    def test_fragmento_varia_com_os_papeis(self):
+        # Mesmos contadores (nenhum documento) para os dois usuários: só os papéis distinguem a chave
+        self.client.force_login(self.protocolista)
+        response = self.client.get(reverse('gestao:dashboard'))
+        self.assertContains(response, '<p class="card-text fs-5">Aguardando Distribuição</p>', html=False)
+        self.assertNotContains(response, '<p class="card-text fs-5">Processos Pendentes</p>', html=False)
+
+        self.client.force_login(self.procurador)
+        response = self.client.get(reverse('gestao:dashboard'))
+        self.assertContains(response, '<p class="card-text fs-5">Processos Pendentes</p>', html=False)
+        self.assertNotContains(response, '<p class="card-text fs-5">Aguardando Distribuição</p>', html=False)
+
+    def test_salvar_documento_renova_o_fragmento(self):
+        self.client.force_login(self.protocolista)
+        with self.commit():
+            documento = self.criar_documento()
+        self.assertEqual(self.total_card(self.client.get(reverse('gestao:dashboard')), 'Aguardando Distribuição'), 1)
+
+        with self.commit():
+            self.criar_documento()
+        self.assertEqual(self.total_card(self.client.get(reverse('gestao:dashboard')), 'Aguardando Distribuição'), 2)
+
+        with self.commit():
+            documento.status = 'Em Análise'
+            documento.procurador_atribuido = self.procurador
+            documento.save()
+        self.assertEqual(self.total_card(self.client.get(reverse('gestao:dashboard')), 'Aguardando Distribuição'), 1)
+
+
+class InteressadosResumoTests(GestaoTestCase):
+    """ Documento.interessados_resumo acompanha a M2M pelos dois lados, renomeações e exclusões. """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.ana = Remetente.objects.create(tipo_remetente='Pessoa Física', nome_razao_social='Ana', cpf_cnpj='11111111111')
+        cls.bruno = Remetente.objects.create(tipo_remetente='Pessoa Física', nome_razao_social='Bruno', cpf_cnpj='22222222222')
+
+    def setUp(self):
+        self.documento = self.criar_documento()
+        self.outro = self.criar_documento()
+
+    def resumo(self, documento):
+        return Documento.objects.values_list('interessados_resumo', flat=True).get(pk=documento.pk)
+
+    def test_lado_do_documento(self):
+        self.documento.interessados.add(self.bruno, self.ana)
+        self.assertEqual(self.resumo(self.documento), [{'id': self.ana.pk, 'nome': 'Ana'}, {'id': self.bruno.pk, 'nome': 'Bruno'}])
+        self.documento.interessados.remove(self.ana)
+        self.assertEqual(self.resumo(self.documento), [{'id': self.bruno.pk, 'nome': 'Bruno'}])
+        self.documento.interessados.clear()
+        self.assertEqual(self.resumo(self.documento), [])
+
+    def test_lado_do_remetente(self):
+        self.ana.processos_interessados.add(self.documento, self.outro)
+        self.assertEqual(self.resumo(self.outro), [{'id': self.ana.pk, 'nome': 'Ana'}])
+        self.ana.processos_interessados.clear()
+        self.assertEqual(self.resumo(self.documento), [])
+        self.assertEqual(self.resumo(self.outro), [])
+
+    def test_renomear_e_excluir_remetente(self):
+        self.documento.interessados.add(self.ana, self.bruno)
+        self.ana.nome_razao_social = 'Ana Maria'
+        self.ana.save()
+        self.assertEqual(self.resumo(self.documento)[0], {'id': self.ana.pk, 'nome': 'Ana Maria'})
+
+        self.bruno.delete()
+        self.assertEqual(self.resumo(self.documento), [{'id': self.ana.pk, 'nome': 'Ana Maria'}])
+
+
+class AnexoInicialPrincipalTests(GestaoTestCase):
+    """ Documento.anexo_inicial_principal aponta sempre para o primeiro anexo INICIAL ativo. """
+
+    def setUp(self):
+        self.documento = self.criar_documento()
+
+    def anexar(self, tipo_anexo='INICIAL'):
+        return Anexo.objects.create(
+            documento=self.documento, arquivo=ContentFile(b'%PDF-1.4', name='anexo.pdf'), tipo_anexo=tipo_anexo,
+            usuario_upload=self.protocolista,
+        )
+
+    def principal_id(self):
+        return Documento.objects.values_list('anexo_inicial_principal', flat=True).get(pk=self.documento.pk)
+
+    def test_acompanha_inclusao_inativacao_e_exclusao(self):
+        self.anexar('RESPOSTA')
+        self.assertIsNone(self.principal_id())
+
+        primeiro = self.anexar()
+        segundo = self.anexar()
+        self.assertEqual(self.principal_id(), primeiro.pk)
+        self.assertEqual(self.documento.anexo_inicial_principal_id, primeiro.pk)
+
+        primeiro.ativo = False
+        primeiro.save()
+        self.assertEqual(self.principal_id(), segundo.pk)
+
+        segundo.delete()
+        self.assertIsNone(self.principal_id())
+
+    def test_save_do_documento_nao_regrava_valor_antigo(self):
+        anexo = self.anexar()
+        self.documento.observacoes_protocolo = 'Alterado depois do anexo'
+        self.documento.save()
+        self.assertEqual(self.principal_id(), anexo.pk)
+        self.assertEqual(self.documento.url_anexo_inicial, anexo.arquivo.url)
+
+    def test_anexos_sinteticos_no_armazenamento_dos_anexos(self):
+        GeradorDadosSinteticos(dias=30, semente=1, num_procuradores=1, num_remetentes=5).gerar(3)
+
+        armazenamento = Anexo._meta.get_field('arquivo').storage
+        self.assertTrue(armazenamento.exists(ARQUIVO_PLACEHOLDER))
+        sinteticos = Documento.objects.select_related('anexo_inicial_principal').exclude(pk=self.documento.pk)
+        self.assertEqual({documento.url_anexo_inicial for documento in sinteticos}, {armazenamento.url(ARQUIVO_PLACEHOLDER)})
+
+
+class IntervaloStatusTests(GestaoTestCase):
+    """ IntervaloStatus: uma linha por período em cada status, fechada na transição seguinte. """
+
+    def intervalos(self, documento):
+        intervalos = IntervaloStatus.objects.filter(documento=documento).order_by('inicio', 'id')
+        return [(intervalo.status, intervalo.procurador_id, intervalo.fim is None) for intervalo in intervalos]
+
+    def test_registrar_transicoes_fecha_o_aberto(self):
+        documentos = [self.criar_documento() for _ in range(3)]
+        inicio = IntervaloStatus.objects.get(documento=documentos[0]).inicio
+        momento = inicio + timedelta(hours=2)
+
+        with self.assertNumQueries(3):
+            IntervaloStatus.registrar_transicoes(
+                [(documento.pk, 'Em Análise', self.procurador.pk) for documento in documentos], momento=momento
+            )
+
+        fechado = IntervaloStatus.objects.get(documento=documentos[0], status='Aguardando Distribuição')
+        self.assertEqual(fechado.fim, momento)
+        self.assertEqual(fechado.duracao_segundos, 7200)
+        for documento in documentos:
+            self.assertEqual(
+                self.intervalos(documento), [('Aguardando Distribuição', None, False), ('Em Análise', self.procurador.pk, True)]
+            )
+
+    def test_save_registra_mudanca_de_status_ou_procurador(self):
+        documento = self.criar_documento()
+        documento.observacoes_protocolo = 'Sem mudança de status'
+        documento.save()
+        self.assertEqual(len(self.intervalos(documento)), 1)
+
+        documento.status = 'Em Análise'
+        documento.procurador_atribuido = self.procurador
+        documento.save()
+        outro = self.criar_usuario('procurador.intervalo', 'Procuradores')
+        documento.procurador_atribuido = outro
+        documento.save()
+
+        self.assertEqual(self.intervalos(documento), [
+            ('Aguardando Distribuição', None, False),
+            ('Em Análise', self.procurador.pk, False),
+            ('Em Análise', outro.pk, True),
+        ])
+
+    def test_resumo_por_status(self):
+        documento = self.criar_documento()
+        inicio = IntervaloStatus.objects.get(documento=documento).inicio
+        IntervaloStatus.registrar_transicoes([(documento.pk, 'Em Análise', None)], momento=inicio + timedelta(seconds=60))
+        resumo = list(IntervaloStatus.objects.resumo_por_status())
+        self.assertEqual(resumo, [
+            {'status': 'Aguardando Distribuição', 'quantidade': 1, 'duracao_media': 60, 'duracao_maxima': 60},
+        ])
+
+
+class ResumosDiariosTests(GestaoTestCase):
+    """ atualizar_resumos_diarios e a tela de indicadores, que lê apenas os resumos consolidados. """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.chefe = cls.criar_usuario('chefe.indicadores', 'Procurador-Chefe')
+        cls.inicio = (timezone.localtime() - timedelta(days=10)).replace(hour=10, minute=0, second=0, microsecond=0)
+
+    def criar_respondido(self, dias_resposta, dias_prazo=2):
+        """ Recebido e atribuído em `self.inicio`, com prazo de `dias_prazo` dias, respondido `dias_resposta` dias depois. """
+        documento = self.criar_documento('Análise Concluída', self.procurador)
+        # update() direto: data_recebimento é auto_now_add e o save() recalcularia a data limite
+        Documento.objects.filter(pk=documento.pk).update(
+            data_recebimento=self.inicio, data_atribuicao=self.inicio,
+            data_limite=self.inicio.date() + timedelta(days=dias_prazo),
+            data_resposta_procurador=self.inicio + timedelta(days=dias_resposta),
+        )
+        return documento
+
+    def atualizar(self, *argumentos):
+        saida = StringIO()
+        call_command('atualizar_resumos_diarios', *argumentos, stdout=saida)
+        return saida.getvalue()
+
+    def resumo(self, dias, procurador=None):
+        return ResumoProdutividadeDiaria.objects.get(
+            data=self.inicio.date() + timedelta(days=dias), procurador=procurador or self.procurador,
+        )
+
+    def test_sem_documentos(self):
+        self.assertIn('Nenhum documento para consolidar.', self.atualizar())
+        self.assertFalse(ResumoProdutividadeDiaria.objects.exists())
+
+    def test_consolida_eventos_respostas_e_atraso(self):
+        self.criar_respondido(dias_resposta=1)
+        self.criar_respondido(dias_resposta=4)
+
+        self.atualizar()
+
+        dia_recebimento = self.resumo(0)
+        self.assertEqual((dia_recebimento.recebidos, dia_recebimento.atribuidos, dia_recebimento.respondidos), (2, 2, 0))
+        no_prazo = self.resumo(1)
+        self.assertEqual((no_prazo.respondidos, no_prazo.respondidos_com_atraso), (1, 0))
+        self.assertEqual(no_prazo.tempo_resposta_total_horas, 24)
+        self.assertEqual(no_prazo.histograma_resposta[1], 1)
+        # O segundo fica atrasado do dia seguinte à data limite até a véspera da resposta
+        self.assertEqual(self.resumo(3).em_atraso, 1)
+        atrasado = self.resumo(4)
+        self.assertEqual((atrasado.respondidos, atrasado.respondidos_com_atraso, atrasado.em_atraso), (1, 1, 0))
+        self.assertEqual(atrasado.histograma_resposta[4], 1)
+
+    def test_redistribuicao_conta_para_o_procurador_de_cada_intervalo(self):
+        substituto = self.criar_usuario('procurador.substituto', 'Procuradores')
+        def momento(dias):
+            return self.inicio + timedelta(days=dias)
+
+        documento = self.criar_documento('Análise Concluída', substituto)
+        Documento.objects.filter(pk=documento.pk).update(
+            data_recebimento=momento(-0.1), data_atribuicao=momento(2), data_limite=self.inicio.date(),
+            data_resposta_procurador=momento(4),
+        )
+        # Recebido sem procurador, atribuído a self.procurador, redistribuído no dia 2 e respondido no dia 4
+        IntervaloStatus.objects.filter(documento=documento).delete()
+        IntervaloStatus.objects.bulk_create([
+            IntervaloStatus(documento=documento, status=status, procurador=procurador, inicio=momento(dias))
+            for dias, status, procurador in [
+                (-0.1, 'Aguardando Distribuição', None), (0, 'Em Análise', self.procurador),
+                (2, 'Em Análise', substituto), (4, 'Análise Concluída', substituto),
+            ]
+        ])
+
+        self.atualizar()
+
+        recebimento = ResumoProdutividadeDiaria.objects.get(procurador=None)
+        self.assertEqual((recebimento.data, recebimento.recebidos), (self.inicio.date(), 1))
+        self.assertEqual(self.resumo(1).em_atraso, 1)
+        self.assertEqual((self.resumo(2, substituto).atribuidos, self.resumo(2, substituto).em_atraso), (1, 1))
+        self.assertEqual(self.resumo(3, substituto).em_atraso, 1)
+        self.assertEqual((self.resumo(4, substituto).respondidos, self.resumo(4, substituto).respondidos_com_atraso), (1, 1))
+        self.assertFalse(ResumoProdutividadeDiaria.objects.filter(procurador=self.procurador, respondidos__gt=0).exists())
+
+    def test_incremental_reprocessa_apenas_a_janela(self):
+        self.criar_respondido(dias_resposta=1)
+        self.atualizar()
+        # Linha fora da janela de reprocessamento: preservada mesmo sem documentos que a justifiquem
+        antiga = ResumoProdutividadeDiaria.objects.create(
+            data=self.inicio.date() - timedelta(days=30), procurador=self.procurador, tipo_documento=self.tipo,
+            prioridade=self.prioridade, recebidos=7,
+        )
+        self.criar_respondido(dias_resposta=1)
+
+        self.atualizar('--reprocessar-dias', '15')
+
+        self.assertTrue(ResumoProdutividadeDiaria.objects.filter(pk=antiga.pk).exists())
+        self.assertEqual(self.resumo(0).recebidos, 2)
+        self.assertEqual(self.resumo(1).respondidos, 2)
+
+    def test_desde_invalida(self):
+        with self.assertRaisesMessage(CommandError, 'Data inválida em --desde'):
+            self.atualizar('--desde', '31/12/2024')
+
+    def test_indicadores(self):
+        self.criar_respondido(dias_resposta=1)
+        self.criar_respondido(dias_resposta=4)
+        self.atualizar()
+        self.client.force_login(self.chefe)
+
+        response = self.client.get(reverse('gestao:produtividade'))
+
+        totais = response.context['totais']
+        self.assertEqual((totais['recebidos'], totais['respondidos'], totais['respondidos_com_atraso']), (2, 2, 1))
+        self.assertEqual(totais['percentual_no_prazo'], 50)
+        self.assertEqual(totais['tempo_medio_dias'], 2.5)
+        self.assertEqual((totais['p50_dias'], totais['p90_dias']), (1, 4))
+        self.assertEqual([linha['procurador'] for linha in response.context['por_procurador']], [self.procurador.pk])
+
+    def test_indicadores_leem_apenas_os_resumos(self):
+        self.criar_respondido(dias_resposta=1)
+        self.atualizar()
+        self.client.force_login(self.chefe)
+        self.client.get(reverse('gestao:produtividade'))  # a primeira requisição guarda os papéis na sessão
+
+        # Sessão, usuário e versão dos papéis; seis leituras dos resumos; as três listas dos filtros
+        with self.assertNumQueries(12), CaptureQueriesContext(connection) as consultas:
+            self.client.get(reverse('gestao:produtividade'))
+
+        tabelas_operacionais = [
+            consulta['sql'] for consulta in consultas.captured_queries
+            if Documento._meta.db_table in consulta['sql'] or IntervaloStatus._meta.db_table in consulta['sql']
+        ]
+        self.assertEqual(tabelas_operacionais, [])
+
+    def test_periodo_sem_resumos(self):
+        self.criar_respondido(dias_resposta=1)
+        self.atualizar()
+        self.client.force_login(self.chefe)
+        vazio = self.inicio.date() - timedelta(days=60)
+
+        response = self.client.get(reverse('gestao:produtividade'), {
+            'data_inicio': vazio.isoformat(), 'data_fim': (vazio + timedelta(days=7)).isoformat(),
+        })
+
+        totais = response.context['totais']
+        self.assertEqual((totais['em_atraso'], totais['tempo_medio_dias'], totais['percentual_no_prazo']), (0, None, None))
+        self.assertEqual((totais['p50_dias'], totais['p90_dias']), (None, None))
+        self.assertEqual((response.context['por_procurador'], response.context['serie_mensal']), ([], []))
+        self.assertIsNone(response.context['ultimo_dia'])
+        self.assertContains(response, '<h2 class="card-title">0</h2>', count=3)
+        self.assertContains(response, '<h2 class="card-title text-danger">0</h2>')
+
+    def test_indicadores_restritos_a_chefia(self):
+        self.client.force_login(self.procurador)
+        with self.assertLogs('django.request', 'WARNING'):
+            response = self.client.get(reverse('gestao:produtividade'))
+        self.assertEqual(response.status_code, 403)
+
+
+class ExportacaoCsvTests(GestaoTestCase):
+    """ Exportações CSV da busca e do monitoramento: streaming, mesmos filtros e visibilidade das páginas. """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.sem_nome = cls.criar_usuario('procurador.sem.nome', 'Procuradores')
+        User.objects.filter(pk=cls.procurador.pk).update(first_name='Maria', last_name='Souza')
+        cls.interessado = Remetente.objects.create(
+            tipo_remetente='Pessoa Física', nome_razao_social='Ana; Filha', cpf_cnpj='11111111111',
+        )
+
+    def linhas(self, response):
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        conteudo = b''.join(response.streaming_content).decode('utf-8')
+        self.assertTrue(conteudo.startswith('\ufeff'))
+        return list(csv.reader(StringIO(conteudo[1:]), delimiter=';'))
+
+    def test_busca_exporta_apenas_os_visiveis(self):
+        proprio = self.criar_documento('Em Análise', self.procurador)
+        proprio.interessados.add(self.interessado)
+        self.criar_documento('Em Análise', self.sem_nome)
+        self.client.force_login(self.procurador)
+
+        response = self.client.get(reverse('gestao:busca_exportar'))
+
+        self.assertIn('attachment; filename="busca_documentos_', response['Content-Disposition'])
+        cabecalho, *linhas = self.linhas(response)
+        self.assertEqual(cabecalho[:3], ['Protocolo', 'Status', 'Nº Doc. Origem'])
+        self.assertEqual(len(linhas), 1)
+        linha = dict(zip(cabecalho, linhas[0]))
+        self.assertEqual(linha['Protocolo'], proprio.protocolo)
+        self.assertEqual(linha['Interessados'], 'Ana; Filha')
+        self.assertEqual(linha['Procurador'], 'Maria Souza')
+        self.assertEqual(linha['Data de Recebimento'], timezone.localtime(proprio.data_recebimento).strftime('%d/%m/%Y %H:%M'))
+        self.assertEqual(linha['Data de Finalização'], '')
+
+    def test_busca_segue_filtros_e_ordenacao_da_pagina(self):
+        documentos = [self.criar_documento('Em Análise', self.sem_nome) for _ in range(3)]
+        self.criar_documento()
+        chefe = self.criar_usuario('chefe.exportacao', 'Procurador-Chefe')
+        self.client.force_login(chefe)
+
+        response = self.client.get(reverse('gestao:busca_exportar'), {'status': 'Em Análise', 'ordenar_por': 'protocolo', 'ordem': 'asc'})
+
+        cabecalho, *linhas = self.linhas(response)
+        self.assertEqual([linha[0] for linha in linhas], sorted(documento.protocolo for documento in documentos))
+        self.assertEqual({dict(zip(cabecalho, linha))['Procurador'] for linha in linhas}, {'procurador.sem.nome'})
+
+    def test_monitoramento(self):
+        com_filtro = self.criar_documento('Em Análise', self.procurador)
+        self.criar_documento('Em Análise', self.sem_nome)
+        self.criar_documento()
+        url = reverse('gestao:monitoramento_exportar')
+
+        self.client.force_login(self.procurador)
+        with self.assertLogs('django.request', 'WARNING'):
+            self.assertEqual(self.client.get(url).status_code, 403)
+
+        self.client.force_login(self.protocolista)
+        self.assertEqual(len(self.linhas(self.client.get(url))), 3)
+        _, *linhas = self.linhas(self.client.get(url, {'procurador': self.procurador.pk}))
+        self.assertEqual([linha[0] for linha in linhas], [com_filtro.protocolo])
+
+
+class InstrumentacaoTests(GestaoTestCase):
+    """ forma_sql, cabeçalho Server-Timing e amostragem da InstrumentacaoConsultasMiddleware. """
+
+    def test_forma_sql_agrupa_literais_e_listas(self):
+        formas = {
+            forma_sql('SELECT "id" FROM "gestao_documento" WHERE "id" IN (%s, %s, %s) LIMIT 21'),
+            forma_sql('SELECT "id" FROM "gestao_documento" WHERE "id" IN (%s) LIMIT 5'),
+            forma_sql('SELECT "id" FROM "gestao_documento" WHERE "id" IN (1, 2) LIMIT 51'),
+        }
+        self.assertEqual(formas, {'SELECT "id" FROM "gestao_documento" WHERE "id" IN (...) LIMIT %s'})
+        self.assertEqual(
+            forma_sql("SELECT * FROM \"T3\" WHERE \"status\" = 'Em Análise' AND \"nome\" = 'D''Ávila' AND \"x\" > 1.5"),
+            'SELECT * FROM "T3" WHERE "status" = %s AND "nome" = %s AND "x" > %s',
+        )
+
+    def test_server_timing_com_a_fase_db(self):
+        def view(request):
+            User.objects.count()
+            return HttpResponse()
+
+        with self.assertLogs('gestao.desempenho', 'DEBUG') as logs:
+            response = ServerTimingMiddleware(view)(RequestFactory().get('/'))
+
+        fases = dict(parte.split(';', 1) for parte in response['Server-Timing'].split(', '))
+        self.assertIn('desc="1x"', fases['db'])
+        self.assertIn('total', fases)
+        self.assertIn('db', logs.records[0].fases)
+
+    def test_server_timing_nas_views(self):
+        self.client.force_login(self.protocolista)
+        response = self.client.get(reverse('gestao:dashboard'))
+        self.assertRegex(response['Server-Timing'], r'(^|, )db;dur=[\d.]+;desc="\d+x"')
+
+    @override_settings(GESTAO_INSTRUMENTACAO_AMOSTRAGEM=0)
+    def test_instrumentacao_desligada_nao_interfere(self):
+        def view(request):
+            self.assertEqual(connection.execute_wrappers, [])
+            User.objects.count()
+            return HttpResponse()
+
+        request = RequestFactory().get('/')
+        with self.assertNoLogs('gestao.desempenho'):
+            InstrumentacaoConsultasMiddleware(view)(request)
+        self.assertFalse(hasattr(request, 'monitor_consultas'))
+
+    @override_settings(GESTAO_INSTRUMENTACAO_AMOSTRAGEM=1, GESTAO_ORCAMENTO_CONSULTAS=3)
+    def test_requisicao_acima_do_orcamento_gera_aviso(self):
+        self.client.force_login(self.protocolista)
+        with self.assertLogs('gestao.desempenho', 'WARNING') as logs:
+            self.client.get(reverse('gestao:dashboard'))
+
+        registro, = [r for r in logs.records if r.levelname == 'WARNING']
+        self.assertEqual(registro.view, 'gestao:dashboard')
+        self.assertGreater(registro.consultas, 3)
+        self.assertIn('"view": "gestao:dashboard"', registro.getMessage())
+        self.assertIn(f'"consultas": {registro.consultas}', registro.getMessage())
+
+    @override_settings(GESTAO_INSTRUMENTACAO_AMOSTRAGEM=1, GESTAO_LIMITE_REPETICOES=2)
+    def test_instrucao_repetida_gera_aviso(self):
+        def view(request):
+            for pk in range(4):
+                User.objects.filter(pk=pk).exists()
+            return HttpResponse()
+
+        with self.assertLogs('gestao.desempenho', 'WARNING') as logs:
+            InstrumentacaoConsultasMiddleware(view)(RequestFactory().get('/'))
+
+        repetida, = logs.records[0].repetidas
+        self.assertEqual(repetida['vezes'], 4)
+
+    @override_settings(GESTAO_INSTRUMENTACAO_AMOSTRAGEM=1)
+    def test_requisicao_dentro_do_orcamento_nao_gera_aviso(self):
+        def view(request):
+            User.objects.count()
+            return HttpResponse()
+
+        request = RequestFactory().get('/')
+        with self.assertLogs('gestao.desempenho', 'DEBUG') as logs:
+            InstrumentacaoConsultasMiddleware(view)(request)
+
+        self.assertEqual([r.levelname for r in logs.records], ['DEBUG'])
+        self.assertEqual(request.monitor_consultas.total, 1)
@@ -0,0 +1,52 @@
+"""
+Trava de execução com prazo (lease) gravada no banco
+
+    with trava_execucao('notificar_atrasos', timedelta(minutes=30)) as obtida:
+        if not obtida:
+            return  # outra instância já está rodando
+
+A aquisição é atômica nos três bancos suportados: ou o UPDATE toma uma trava vencida, ou o INSERT
+cria a primeira (a restrição unique em `nome` barra a corrida). Na saída, a trava só é liberada se
+ainda pertencer a esta execução.
+"""
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import TravaExecucao
+
+DURACAO_PADRAO = timedelta(minutes=30)
+
+
+def adquirir_trava(nome, duracao=DURACAO_PADRAO):
+    """ Retorna o identificador do dono se a trava foi obtida, ou None se outra execução a detém. """
+    dono = uuid.uuid4().hex
+    agora = timezone.now()
+    tomada = TravaExecucao.objects.filter(nome=nome, expira_em__lte=agora).update(
+        dono=dono, adquirida_em=agora, expira_em=agora + duracao
+    )
+    if tomada:
+        return dono
+    try:
+        with transaction.atomic():
+            TravaExecucao.objects.create(nome=nome, dono=dono, adquirida_em=agora, expira_em=agora + duracao)
+    except IntegrityError:
+        return None
+    return dono
+
+
+def liberar_trava(nome, dono):
+    TravaExecucao.objects.filter(nome=nome, dono=dono).delete()
+
+
+@contextmanager
+def trava_execucao(nome, duracao=DURACAO_PADRAO):
+    dono = adquirir_trava(nome, duracao)
+    try:
+        yield dono is not None
+    finally:
+        if dono:
+            liberar_trava(nome, dono)
@@ -7,11 +7,15 @@ urlpatterns = [
     path('', views.dashboard_view, name='dashboard'),
     path('cadastrar/', views.documento_create_view, name='documento_create'),
     path('distribuir/', views.distribuicao_view, name='distribuicao'),
+    path('distribuir/<int:pk>/anexos/', views.distribuicao_anexos_ajax_view, name='distribuicao_anexos'),
     path('meus-documentos/', views.procurador_dashboard_view, name='procurador_dashboard'),
     path('documento/<int:pk>/', views.documento_detail_view, name='documento_detail'),
     path('monitorar/', views.monitoramento_analises_view, name='monitoramento_analises'),
+    path('monitorar/exportar/', views.monitoramento_exportar_view, name='monitoramento_exportar'),
+    path('monitorar/lembretes/', views.enviar_lembretes_lote_view, name='enviar_lembretes_lote'),
     path('finalizar/<int:pk>/', views.finalizacao_detail_view, name='finalizacao_detail'),
     path('busca/', views.busca_view, name='busca'),
+    path('busca/exportar/', views.busca_exportar_view, name='busca_exportar'),
     path('consulta/<int:pk>/', views.documento_consulta_view, name='documento_consulta'),
     path('documento/<int:pk>/devolver/', views.devolver_documento_view, name='devolver_documento'),
     path('reativar/<int:pk>/', views.reativar_documento_view, name='reativar_documento'),
@@ -20,6 +24,7 @@ urlpatterns = [
     path('remetente/autocomplete/', views.remetente_autocomplete_view, name='remetente_autocomplete'),
     path('lembrete/<int:pk>/', views.enviar_lembrete_view, name='enviar_lembrete'),
     path('confirmar/', views.confirmacao_lista_view, name='confirmacao_lista'),
+    path('confirmar/lote/', views.confirmacao_lote_view, name='confirmacao_lote'),
     path('confirmar/<int:pk>/', views.confirmacao_detail_view, name='confirmacao_detail'),
     path('definir-pin/', views.definir_pin_view, name='definir_pin'),
     path('verificar-pin/ajax/', views.verificar_pin_ajax_view, name='verificar_pin_ajax'),
@@ -30,6 +35,7 @@ urlpatterns = [
     path('diligencia/decidir/<int:diligencia_id>/', views.decidir_diligencia_view, name='decidir_diligencia'),
     path('documento/atribuir/<int:pk>/', views.atribuir_procurador_direto_view, name='atribuir_procurador_direto'),
     path('redistribuir-ferias/', views.redistribuir_ferias_view, name='redistribuir_ferias'),
+    path('indicadores/', views.produtividade_view, name='produtividade'),
     path('ajax/get-process-count/', views.get_process_count_ajax, name='get_process_count'),
 ]
 
@@ -1,18 +1,21 @@
+import hashlib
 import itertools
 import logging
 import os
+from collections import defaultdict
 from urllib import request
 
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User, Group
-from django.contrib.auth.hashers import make_password, check_password
 from django.contrib.auth.views import PasswordResetView
 from django.core.mail import EmailMessage, send_mail, EmailMultiAlternatives
 from django.conf import settings
+from django.core import signing
 from django.core.paginator import Paginator
 from django.contrib import messages
 from django.core.exceptions import PermissionDenied
-from django.db.models import Max, Q
+from django.db.models import Count, Exists, Max, OuterRef, Q, Sum
+from django.db.models.functions import TruncMonth
 from django.db import transaction
 from django.http import JsonResponse
 from django.utils import timezone
@@ -21,61 +24,129 @@ from django.utils.html import strip_tags
 from django.template.loader import render_to_string
 from django.shortcuts import render, redirect, get_object_or_404
 
-from datetime import datetime
-from .models import Documento, Anexo, HistoricoEdicao, Remetente, SolicitacaoDocumento, Profile, NivelPrioridade
+from datetime import datetime, timedelta, timezone as dt_timezone
+from .models import Documento, Anexo, HistoricoEdicao, Remetente, SolicitacaoDocumento, Profile, PinBloqueado, NivelPrioridade, TipoDocumento, ResumoProdutividadeDiaria, IntervaloStatus, SITUACAO_PRAZO_CHOICES, STATUS_PENDENTES_PROCURADOR
 from .forms import DocumentoForm, AnexoFormSet, AnexoForm, FinalizacaoForm, DocumentoFilterForm, RemetenteForm, PinForm, DocumentoUpdateForm, AnexoUpdateFormSet, RedistribuicaoFeriasForm
-from .email_utils import enviar_email_html, build_absolute_system_url
+from .cache import obter_ou_calcular
+from .email_utils import enviar_apos_commit, enviar_email_html, enviar_emails_em_paralelo, build_absolute_system_url
+from .exportacao import exportar_csv
+from .metricas import medir
+from .papeis import impressao_pin_usuario, invalidar_papeis, papeis_usuario
+from .produtividade import percentil_histograma, somar_histogramas
+from .replica import leitura_em_replica
+from .respostas import enfileirar_respostas, enviar_respostas_remetentes
 
 logger = logging.getLogger('gestao')
 
+# Segundos que os contadores do painel e as listas de referência (filtros) ficam no cache compartilhado;
+# as alterações invalidam os namespaces antes disso (signals e IntervaloStatus.registrar_transicoes)
+TTL_PAINEL = 60
+TTL_REFERENCIAS = 600
+
+
+def parse_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def build_page_window(paginator_obj, current_page):
+    """ Números de página exibidos na paginação (primeira, última e vizinhas da atual, com '...'). """
+    total_pages = paginator_obj.num_pages
+    if total_pages <= 7:
+        return list(range(1, total_pages + 1))
+    slots = {1, total_pages, current_page}
+    for offset in (1, 2):
+        slots.add(current_page - offset)
+        slots.add(current_page + offset)
+    ordered_slots = [page for page in sorted(slots) if 1 <= page <= total_pages]
+    window = []
+    previous = None
+    for page in ordered_slots:
+        if previous and page - previous > 1:
+            window.append('...')
+        window.append(page)
+        previous = page
+    return window
+
+
+def paginar(request, queryset, page_size_options=(10, 30, 50)):
+    """
+    Pagina o queryset conforme ?page= e ?page_size= e devolve o contexto usado
+    pelo template 'gestao/paginacao.html'.
+    """
+    page_size_value = parse_int(request.GET.get('page_size'))
+    page_size = page_size_value if page_size_value in page_size_options else page_size_options[0]
+
+    paginator = Paginator(queryset, page_size)
+    page_obj = paginator.get_page(request.GET.get('page'))
+
+    query_params = request.GET.copy()
+    query_params.pop('page', None)
+
+    return {
+        'documentos': page_obj,
+        'page_obj': page_obj,
+        'total_documentos': paginator.count,
+        'page_size': page_size,
+        'page_size_options': list(page_size_options),
+        'querystring': query_params.urlencode(),
+        'is_paginated': page_obj.has_other_pages(),
+        'page_window': build_page_window(paginator, page_obj.number),
+    }
+
+
+def calcular_contadores_painel():
+    """ Contadores globais dos cards do painel (iguais para todos os usuários). """
+    return {
+        # Total de docs na fila de distribuição
+        'total_para_distribuir': Documento.objects.filter(
+            status__in=['Aguardando Distribuição', 'Devolvido pela Análise']
+        ).count(),
+        # Total de docs que estão com procuradores (para monitorar)
+        'total_para_monitorar': Documento.objects.filter(
+            status__in=['Em Análise', 'Análise Concluída', 'Rejeitado', 'Em Diligência']
+        ).count(),
+        # Total de docs que aguardam a confirmação final do Analista/Chefe
+        'total_para_confirmar': Documento.objects.filter(status='Aguardando Confirmação').count(),
+        'total_diligencias_pendentes': SolicitacaoDocumento.objects.filter(
+            status='Pendente' # Ou o status que representa "aguardando gestão"
+        ).count(),
+    }
+
+
 @login_required
 def dashboard_view(request):
     
-    # 1. Lógica de Contagem ATUALIZADA
-    
-    # Total de docs na fila de distribuição
-    total_para_distribuir = Documento.objects.filter(
-        status__in=['Aguardando Distribuição', 'Devolvido pela Análise']
-    ).count()
-    
-    # Total de docs que estão com procuradores (para monitorar)
-    total_para_monitorar = Documento.objects.filter(
-        status__in=['Em Análise', 'Análise Concluída', 'Rejeitado', 'Em Diligência']
-    ).count()
-    
-    # Total de docs que aguardam a confirmação final do Analista/Chefe
-    total_para_confirmar = Documento.objects.filter(
-        status='Aguardando Confirmação'
-    ).count()
+    # 1. Contagens: guardadas no cache compartilhado (namespace 'painel', invalidado a cada mudança de status)
+    contadores = obter_ou_calcular('painel', 'contadores', calcular_contadores_painel, ttl=TTL_PAINEL)
     
     # Total de docs pendentes para o PROCURADOR logado (para o card dele)
-    total_pendente_procurador = Documento.objects.filter(
-        status__in=['Em Análise', 'Rejeitado', 'Em Diligência'],
-        procurador_atribuido=request.user
-    ).count()
-
-    total_diligencias_pendentes = SolicitacaoDocumento.objects.filter(
-        status='Pendente' # Ou o status que representa "aguardando gestão"
-    ).count()
+    total_pendente_procurador = obter_ou_calcular(
+        'painel', f'pendentes:{request.user.pk}',
+        lambda: Documento.objects.filter(
+            status__in=STATUS_PENDENTES_PROCURADOR, procurador_atribuido=request.user
+        ).count(),
+        ttl=TTL_PAINEL,
+    )
 
     # 2. Preparar os dados para enviar ao HTML
     context = {
-        'total_para_distribuir': total_para_distribuir,
-        'total_para_monitorar': total_para_monitorar,
-        'total_para_confirmar': total_para_confirmar,
+        **contadores,
         'total_pendente_procurador': total_pendente_procurador,
-        'total_diligencias_pendentes': total_diligencias_pendentes,
     }
 
     # 3. Renderizar a página
-    return render(request, 'gestao/dashboard.html', context)
+    with medir('render'):
+        return render(request, 'gestao/dashboard.html', context)
 
 
 @login_required
 def documento_create_view(request):
-    is_protocolo_chefe = request.user.groups.filter(name='Protocolador-Chefe').exists()
-    is_protocolo = request.user.groups.filter(name='Protocolo').exists()
-    is_cadastrante = request.user.groups.filter(name='Cadastrante').exists()
+    is_protocolo_chefe = 'Protocolador-Chefe' in papeis_usuario(request)
+    is_protocolo = 'Protocolo' in papeis_usuario(request)
+    is_cadastrante = 'Cadastrante' in papeis_usuario(request)
     if not request.user.is_superuser and not is_protocolo_chefe and not is_protocolo and not is_cadastrante:
         raise PermissionDenied("Você não tem permissão para cadastrar documentos.")
     
@@ -132,19 +203,90 @@ def documento_create_view(request):
     return render(request, 'gestao/documento_form.html', context)
 
 
+# Status que compõem a fila de distribuição
+STATUS_FILA_DISTRIBUICAO = ['Aguardando Distribuição', 'Devolvido pela Análise']
+
+# Token assinado que representa "todos os documentos da fila" no momento em que a página foi exibida
+SALT_FILA_DISTRIBUICAO = 'gestao.distribuicao.fila'
+VALIDADE_TOKEN_FILA = 60 * 60 # 1 hora
+
+
+def enviar_emails_distribuicao(procurador_id, documento_ids):
+    """
+    Avisa o procurador dos documentos que acabou de receber: um documento vai no e-mail detalhado, com os
+    anexos iniciais; vários vão num único e-mail com a lista e os links (sem ler os anexos do Storage).
+    """
+    procurador = User.objects.get(pk=procurador_id)
+    if not procurador.email:
+        logger.warning(f"Procurador {procurador.username} sem e-mail: aviso de distribuição não enviado")
+        return
+    procurador_nome = procurador.get_full_name() or procurador.username
+    documentos = Documento.objects.filter(pk__in=documento_ids).select_related(
+        'remetente', 'tipo_documento', 'prioridade', 'anexo_inicial_principal'
+    ).order_by('data_limite', 'id')
+
+    if len(documento_ids) == 1:
+        doc = documentos.get()
+        # Passamos o objeto 'anexo.arquivo' diretamente. A função enviar_email_html cuidará do resto.
+        lista_anexos = [anexo.arquivo for anexo in doc.anexos.filter(tipo_anexo='INICIAL', ativo=True)]
+        contexto = {
+            'procurador_nome': procurador_nome,
+            'protocolo': doc.protocolo,
+            'num_doc_origem': doc.num_doc_origem,
+            'remetente': doc.remetente.nome_razao_social,
+            'tipo_documento': doc.tipo_documento.descricao,
+            'prioridade': doc.prioridade.descricao,
+            'data_limite': doc.data_limite.strftime('%d/%m/%Y') if doc.data_limite else "Não definida",
+            'observacoes': doc.observacoes_protocolo,
+            # URL do primeiro anexo inicial ativo (FK mantida no próprio documento)
+            'url_documento': doc.url_anexo_inicial,
+        }
+        assunto = f"Novo Documento para Análise - Protocolo {doc.protocolo}"
+        template_name = 'emails/documento_distribuido.html'
+    else:
+        lista_anexos = None
+        contexto = {
+            'procurador_nome': procurador_nome,
+            'processos': [
+                {
+                    'protocolo': doc.protocolo,
+                    'num_doc_origem': doc.num_doc_origem,
+                    'remetente': doc.remetente.nome_razao_social,
+                    'tipo_documento': doc.tipo_documento.descricao,
+                    'prioridade': doc.prioridade.descricao,
+                    'data_limite': doc.data_limite,
+                    'url': build_absolute_system_url(reverse('gestao:documento_detail', args=[doc.pk])),
+                    'url_anexo': doc.url_anexo_inicial,
+                }
+                for doc in documentos
+            ],
+            'url_sistema': build_absolute_system_url(reverse('gestao:procurador_dashboard')),
+        }
+        assunto = f"{len(contexto['processos'])} Novos Documentos para Análise"
+        template_name = 'emails/documentos_distribuidos_lote.html'
+
+    if enviar_email_html(
+        assunto=assunto, template_name=template_name, contexto=contexto, destinatarios=[procurador.email], anexos=lista_anexos,
+    ):
+        logger.info(f"E-mail de distribuição enviado para {procurador.email} - {len(documento_ids)} documento(s)")
+    else:
+        logger.error(f"Erro no envio do e-mail de distribuição para {procurador.email} - {len(documento_ids)} documento(s)")
+
+
 @login_required
 def distribuicao_view(request):
-    is_protocolo_chefe = request.user.groups.filter(name='Protocolador-Chefe').exists()
-    is_protocolo = request.user.groups.filter(name='Protocolo').exists()
+    is_protocolo_chefe = 'Protocolador-Chefe' in papeis_usuario(request)
+    is_protocolo = 'Protocolo' in papeis_usuario(request)
     if not request.user.is_superuser and not is_protocolo_chefe and not is_protocolo:
         raise PermissionDenied("Você não tem permissão para distribuir documentos.")
     
     # --- LÓGICA DE ATRIBUIÇÃO (POST) ---
     if request.method == 'POST':
         documentos_ids = request.POST.getlist('documento_selecionado')
+        selecionar_todos = request.POST.get('selecionar_todos') == '1'
         procurador_id = request.POST.get('procurador_id')
 
-        if not documentos_ids:
+        if not documentos_ids and not selecionar_todos:
             messages.error(request, 'Nenhum documento foi selecionado.')
             return redirect('gestao:distribuicao')
 
@@ -154,65 +296,57 @@ def distribuicao_view(request):
 
         try:
             procurador = User.objects.get(id=procurador_id)
-            documentos_para_atribuir = Documento.objects.filter(id__in=documentos_ids, status__in=['Aguardando Distribuição', 'Devolvido pela Análise'])
-
-            if not documentos_para_atribuir.exists():
-                messages.warning(request, 'Os documentos selecionados já foram distribuídos por outro usuário.')
-                return redirect('gestao:distribuicao')
-
-            emails_enviados_count = 0
-
-            for doc in documentos_para_atribuir:
-                doc.procurador_atribuido = procurador
-                doc.status = 'Em Análise'
-                doc.data_atribuicao = timezone.now()
-                doc.motivo_ultima_devolucao = None
-                
-                doc.save() # Dispara o cálculo da data limite
+            documentos_para_atribuir = Documento.objects.filter(status__in=STATUS_FILA_DISTRIBUICAO)
 
+            if selecionar_todos:
+                # "Selecionar todos" envia apenas o token da fila, não a lista de ids
                 try:
-                    from .email_utils import enviar_email_html
-                    
-                    # Pegamos os anexos como objetos de arquivo, não como caminhos de texto
-                    anexos_iniciais = doc.anexos.filter(tipo_anexo='INICIAL', ativo=True)
-                    # Passamos o objeto 'anexo.arquivo' diretamente. A função enviar_email_html cuidará do resto.
-                    lista_anexos = [anexo.arquivo for anexo in anexos_iniciais]
-                    
-                    primeiro_inicial = anexos_iniciais.first()
-                    contexto = {
-                        'procurador_nome': procurador.get_full_name() or procurador.username,
-                        'protocolo': doc.protocolo,
-                        'num_doc_origem': doc.num_doc_origem,
-                        'remetente': doc.remetente.nome_razao_social,
-                        'tipo_documento': doc.tipo_documento.descricao,
-                        'prioridade': doc.prioridade.descricao,
-                        'data_limite': doc.data_limite.strftime('%d/%m/%Y') if doc.data_limite else "Não definida",
-                        'observacoes': doc.observacoes_protocolo,
-                        # Usa a URL do primeiro anexo inicial ativo, compatível com storage
-                        'url_documento': primeiro_inicial.arquivo.url if primeiro_inicial else None,
-                    }
-                    
-                    assunto = f"Novo Documento para Análise - Protocolo {doc.protocolo}"
-                    
-                    sucesso = enviar_email_html(
-                        assunto=assunto,
-                        template_name='emails/documento_distribuido.html',
-                        contexto=contexto,
-                        destinatarios=[procurador.email],
-                        anexos=lista_anexos # Passando a lista de objetos do Cloud Storage
+                    filtro_fila = signing.loads(
+                        request.POST.get('filtro_token', ''), salt=SALT_FILA_DISTRIBUICAO, max_age=VALIDADE_TOKEN_FILA
                     )
-                    
-                    if sucesso:
-                        emails_enviados_count += 1
-                        logger.info(f"E-mail de distribuição enviado para {procurador.email} - Documento {doc.protocolo}")
-
-                except Exception as e_mail:
-                    messages.error(request, f"Erro ao enviar e-mail para o documento {doc.protocolo}: {e_mail}")
-                    logger.error(f"Erro no envio de e-mail (Protocolo {doc.protocolo}): {str(e_mail)}")
-
+                except signing.BadSignature:
+                    messages.error(request, 'A seleção expirou. Atualize a página e selecione novamente.')
+                    return redirect('gestao:distribuicao')
+                documentos_para_atribuir = documentos_para_atribuir.filter(id__lte=filtro_fila['ate_id'])
+                if 'em' in filtro_fila:
+                    # Fora os que entraram na fila depois da página (ex.: devolvidos pela análise)
+                    momento_fila = datetime.fromtimestamp(filtro_fila['em'], tz=dt_timezone.utc)
+                    documentos_para_atribuir = documentos_para_atribuir.exclude(Exists(IntervaloStatus.objects.filter(
+                        documento=OuterRef('pk'), fim__isnull=True, inicio__gt=momento_fila
+                    )))
+            else:
+                documentos_para_atribuir = documentos_para_atribuir.filter(id__in=documentos_ids)
+
+            # Uma transação para a seleção inteira: UPDATE por prioridade (a data limite depende do prazo dela)
+            # e os intervalos de status em lote; o e-mail ao procurador sai depois do commit
+            agora = timezone.now()
+            with transaction.atomic():
+                selecionados = list(documentos_para_atribuir.select_for_update().values_list('id', 'prioridade_id'))
+                if not selecionados:
+                    messages.warning(request, 'Os documentos selecionados já foram distribuídos por outro usuário.')
+                    return redirect('gestao:distribuicao')
+
+                ids_por_prioridade = defaultdict(list)
+                for doc_id, prioridade_id in selecionados:
+                    ids_por_prioridade[prioridade_id].append(doc_id)
+                prazos = dict(NivelPrioridade.objects.filter(pk__in=ids_por_prioridade).values_list('id', 'prazo_dias'))
+                for prioridade_id, ids in ids_por_prioridade.items():
+                    # Mesma regra de Documento.save(): data de atribuição + prazo da prioridade
+                    Documento.objects.filter(pk__in=ids).update(
+                        procurador_atribuido=procurador,
+                        status='Em Análise',
+                        data_atribuicao=agora,
+                        data_limite=agora.date() + timedelta(days=prazos[prioridade_id]),
+                        motivo_ultima_devolucao=None,
+                    )
+                ids_atribuidos = [doc_id for doc_id, _ in selecionados]
+                IntervaloStatus.registrar_transicoes(
+                    [(doc_id, 'Em Análise', procurador.pk) for doc_id in ids_atribuidos], momento=agora
+                )
+                enviar_apos_commit(enviar_emails_distribuicao, procurador.pk, ids_atribuidos)
 
             nome_procurador = procurador.get_full_name() or procurador.username
-            messages.success(request, f'{len(documentos_para_atribuir)} documento(s) atribuído(s) com sucesso para {nome_procurador}.')
+            messages.success(request, f'{len(ids_atribuidos)} documento(s) atribuído(s) com sucesso para {nome_procurador}.')
         
         except User.DoesNotExist:
              messages.error(request, 'Procurador selecionado inválido.')
@@ -221,14 +355,19 @@ def distribuicao_view(request):
 
     # --- LÓGICA DE EXIBIÇÃO (GET) ---
     
-    # 1. Busca a lista de documentos para distribuir
-    lista_de_documentos = Documento.objects.filter(
-        status__in=['Aguardando Distribuição', 'Devolvido pela Análise']
-    ).select_related( # Otimização para ForeignKey
-        'remetente', 'procurador_atribuido', 'prioridade', 'tipo_documento' 
-    ).prefetch_related( # OTIMIZAÇÃO: Busca os anexos eficientemente
-        'anexos', 'interessados'
-    ).order_by('data_recebimento')
+    # 1. Busca a lista de documentos para distribuir (paginada; anexos são carregados sob demanda por linha)
+    fila = Documento.objects.filter(status__in=STATUS_FILA_DISTRIBUICAO)
+    lista_de_documentos = fila.para_listagem( # Apenas as colunas exibidas na tabela (sem os TextFields)
+        'distribuicao'
+    ).order_by('data_recebimento', 'id')
+    paginacao = paginar(request, lista_de_documentos, page_size_options=(25, 50, 100))
+
+    # Token para "selecionar todos da fila": congela a fila de agora, pelo maior id (documentos novos) e pelo
+    # momento (documentos antigos que voltem à fila depois, cujo intervalo de status começa após ele)
+    ultimo_id_fila = fila.aggregate(ultimo_id=Max('id'))['ultimo_id']
+    filtro_token = signing.dumps(
+        {'ate_id': ultimo_id_fila, 'em': timezone.now().timestamp()}, salt=SALT_FILA_DISTRIBUICAO
+    ) if ultimo_id_fila else ''
 
     # 2. Busca a lista de usuários que pertencem ao grupo "Procuradores" (ativos)
     procurador_recomendado = None
@@ -280,13 +419,39 @@ def distribuicao_view(request):
 
     # 3. O Contexto: Preparamos os dados para o HTML
     context = {
-        'documentos': lista_de_documentos,
+        **paginacao,
+        'filtro_token': filtro_token,
         'procuradores': lista_de_procuradores,
         'procurador_recomendado': procurador_recomendado, # <-- ENVIA A RECOMENDAÇÃO
     }
 
     # 4. Renderizar a página
-    return render(request, 'gestao/distribuicao.html', context)
+    with medir('render'):
+        return render(request, 'gestao/distribuicao.html', context)
+
+
+@login_required
+def distribuicao_anexos_ajax_view(request, pk):
+    """ Lista os anexos ativos de um documento da fila (carregados sob demanda ao expandir a linha). """
+    is_protocolo_chefe = 'Protocolador-Chefe' in papeis_usuario(request)
+    is_protocolo = 'Protocolo' in papeis_usuario(request)
+    if not request.user.is_superuser and not is_protocolo_chefe and not is_protocolo:
+        return JsonResponse({'success': False, 'error': 'Permissão negada'}, status=403)
+
+    anexos = Anexo.objects.filter(documento_id=pk, ativo=True).order_by('tipo_anexo', 'pk')
+    return JsonResponse({
+        'success': True,
+        'anexos': [
+            {
+                'id': anexo.pk,
+                'nome': os.path.basename(anexo.arquivo.name),
+                'tipo': anexo.get_tipo_anexo_display(),
+                'url': anexo.arquivo.url,
+                'descricao': anexo.descricao or '',
+            }
+            for anexo in anexos
+        ],
+    })
 
 
 @login_required
@@ -294,63 +459,43 @@ def procurador_dashboard_view(request):
     
     # --- OTIMIZAÇÃO PARA PERFORMANCE MÁXIMA ---
     # 1. Buscamos os documentos otimizando o acesso ao banco
+    # (índice em procurador_atribuido + status + data_limite)
     lista_de_documentos = Documento.objects.filter(
         status__in=['Em Análise', 'Rejeitado', 'Em Diligência'],
         procurador_atribuido=request.user
-    ).select_related(
-        'tipo_documento', 
-        'prioridade'
-    ).prefetch_related(
-        'interessados' # <--- OBRIGATÓRIO para a nova tabela com badges
-    ).order_by('data_limite')
-    
-    # 2. O Contexto
+    ).para_listagem(
+        'procurador_dashboard' # As badges de interessados vêm de interessados_resumo
+    ).com_prazos() # 'atrasado' calculado no SQL para destacar as linhas
+
+    ordenacao = request.GET.get('ordenar', 'prazo')
+    if ordenacao == 'urgencia':
+        lista_de_documentos = lista_de_documentos.ordenar_por_urgencia()
+    else:
+        ordenacao = 'prazo'
+        lista_de_documentos = lista_de_documentos.order_by('data_limite', 'id')
+
+    # 2. O Contexto (paginado)
     context = {
-        'documentos': lista_de_documentos
+        **paginar(request, lista_de_documentos, page_size_options=(25, 50, 100)),
+        'ordenacao': ordenacao,
+        'pin_autorizado': pin_autorizado(request),
     }
 
     # 3. Renderizar a página
-    return render(request, 'gestao/procurador_dashboard.html', context)
+    with medir('render'):
+        return render(request, 'gestao/procurador_dashboard.html', context)
 
 
 
 @login_required
 def documento_detail_view(request, pk):
-    # 1. Busca o documento
-    documento = get_object_or_404(Documento, pk=pk)
+    # 1. Busca o documento já com a permissão (chefia: todos; procurador/analista: os atribuídos a si)
+    #    Sem permissão, o documento simplesmente não é encontrado
+    #    (quem pode ver a página também pode enviar os formulários)
+    documento = get_object_or_404(Documento.objects.actionable_by(request.user, papeis_usuario(request)), pk=pk)
 
-    # 2. VERIFICAÇÃO DE PERMISSÃO (GET - Ver a Página)
-    # (Baseada na sua lógica anterior)
-    is_procurador_chefe = request.user.groups.filter(name='Procurador-Chefe').exists()
-    is_procurador = request.user.groups.filter(name='Procuradores').exists()
-    is_procurador_analista = request.user.groups.filter(name='Procurador-Analista').exists()
-    is_procurador_atribuido = (request.user == documento.procurador_atribuido)
-    
-    pode_ver = False
-    if request.user.is_superuser or is_procurador_chefe:
-        pode_ver = True
-    elif (is_procurador or is_procurador_analista) and is_procurador_atribuido:
-        pode_ver = True
-        
-    if not pode_ver:
-         raise PermissionDenied("Você não tem permissão para visualizar este documento.")
-    # --- FIM DA VERIFICAÇÃO GET ---
-
-    # 3. VERIFICAÇÃO DE PERMISSÃO (POST - Realizar Ações)
-    # (A mesma lógica, mas determina se o usuário pode enviar formulários)
-    pode_agir = False
-    if request.user.is_superuser or is_procurador_chefe:
-         pode_agir = True
-    elif (is_procurador or is_procurador_analista) and is_procurador_atribuido:
-         pode_agir = True
-         
     # --- LÓGICA DE PROCESSAMENTO (POST) ---
     if request.method == 'POST':
-        
-        # Garante que apenas usuários permitidos possam fazer POST
-        if not pode_agir:
-             messages.error(request, "Você não tem permissão para realizar esta ação.")
-             return redirect('gestao:documento_detail', pk=documento.pk)
 
         # 1. Lógica para SOLICITAR DILIGÊNCIA (Aba 5)
         if 'submit_diligencia' in request.POST:
@@ -437,33 +582,20 @@ def documento_detail_view(request, pk):
         'solicitacoes': documento.solicitacoes.all().order_by('-data_solicitacao'),
     }
     
-    return render(request, 'gestao/documento_detail.html', context)
-
-@login_required
-def monitoramento_analises_view(request):
-    # Verificação de permissões (Mantida como está, está correta)
-    is_protocolo_chefe = request.user.groups.filter(name='Protocolador-Chefe').exists()
-    is_protocolo = request.user.groups.filter(name='Protocolo').exists()
-    if not request.user.is_superuser and not is_protocolo_chefe and not is_protocolo:
-        raise PermissionDenied("Você não tem permissão para acessar esta página.")
+    with medir('render'):
+        return render(request, 'gestao/documento_detail.html', context)
 
-    monitoramento_statuses = ['Em Análise', 'Análise Concluída', 'Rejeitado', 'Em Diligência']
+# Status acompanhados pelo monitoramento de análises
+STATUS_MONITORAMENTO = ['Em Análise', 'Análise Concluída', 'Rejeitado', 'Em Diligência']
 
-    documentos_queryset = Documento.objects.filter(
-        status__in=monitoramento_statuses
-    ).select_related(
-        'tipo_documento',
-        'prioridade',
-        'procurador_atribuido'
-    ).prefetch_related(
-        'interessados'
-    ).order_by('data_limite')
 
-    def parse_int(value):
-        try:
-            return int(value)
-        except (TypeError, ValueError):
-            return None
+def filtrar_monitoramento(request, documentos_queryset):
+    """
+    Aplica os filtros do monitoramento (?status, ?prioridade, ?procurador, ?interessado, ?prazo)
+    sobre `documentos_queryset`. Usado pela página e pela exportação CSV.
+    Retorna o queryset ordenado por data limite e os filtros selecionados.
+    """
+    documentos_queryset = documentos_queryset.filter(status__in=STATUS_MONITORAMENTO).order_by('data_limite', 'id')
 
     status_filter = request.GET.get('status')
     if status_filter:
@@ -484,80 +616,97 @@ def monitoramento_analises_view(request):
     if interessado_id:
         documentos_queryset = documentos_queryset.filter(interessados__id=interessado_id)
 
-    documentos_queryset = documentos_queryset.distinct()
-
-    page_size_options = [10, 30, 50]
-    page_size_value = parse_int(request.GET.get('page_size'))
-    page_size = page_size_value if page_size_value in page_size_options else page_size_options[0]
-
-    paginator = Paginator(documentos_queryset, page_size)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-
-    def build_page_window(paginator_obj, current_page):
-        total_pages = paginator_obj.num_pages
-        if total_pages <= 7:
-            return list(range(1, total_pages + 1))
-        slots = {1, total_pages, current_page}
-        for offset in (1, 2):
-            slots.add(current_page - offset)
-            slots.add(current_page + offset)
-        ordered_slots = [page for page in sorted(slots) if 1 <= page <= total_pages]
-        window = []
-        previous = None
-        for page in ordered_slots:
-            if previous and page - previous > 1:
-                window.append('...')
-            window.append(page)
-            previous = page
-        return window
-
-    page_window = build_page_window(paginator, page_obj.number)
-
-    query_params = request.GET.copy()
-    query_params.pop('page', None)
-    preserved_querystring = query_params.urlencode()
+    prazo_filter = request.GET.get('prazo')
+    if prazo_filter in dict(SITUACAO_PRAZO_CHOICES):
+        documentos_queryset = documentos_queryset.filtrar_prazo(prazo_filter)
+    else:
+        prazo_filter = None
 
     selected_filters = {
         'status': status_filter or '',
         'prioridade': prioridade_filter or '',
         'procurador': procurador_filter or '',
         'interessado': interessado_filter or '',
-        'page_size': str(page_size),
+        'prazo': prazo_filter or '',
     }
+    return documentos_queryset.distinct(), selected_filters
 
-    active_filter_keys = ['status', 'prioridade', 'procurador', 'interessado']
-    filters_count = len([value for key, value in selected_filters.items() if key in active_filter_keys and value])
 
-    prioridades = NivelPrioridade.objects.order_by('descricao')
+def listar_procuradores_com_documentos():
     procuradores = User.objects.filter(documentos_atribuidos__isnull=False).distinct().order_by('first_name', 'last_name', 'username')
-    interessados = Remetente.objects.filter(processos_interessados__isnull=False).distinct().order_by('nome_razao_social')
+    return [{'id': procurador.id, 'nome': procurador.get_full_name() or procurador.username} for procurador in procuradores.only('id', 'username', 'first_name', 'last_name')]
+
+
+@login_required
+@leitura_em_replica
+def monitoramento_analises_view(request):
+    # Verificação de permissões (Mantida como está, está correta)
+    is_protocolo_chefe = 'Protocolador-Chefe' in papeis_usuario(request)
+    is_protocolo = 'Protocolo' in papeis_usuario(request)
+    if not request.user.is_superuser and not is_protocolo_chefe and not is_protocolo:
+        raise PermissionDenied("Você não tem permissão para acessar esta página.")
+
+    documentos_queryset, selected_filters = filtrar_monitoramento(
+        request,
+        Documento.objects.para_listagem('monitoramento').com_prazos(), # dias_restantes / atrasado / prazo_proximo calculados no SQL
+    )
+
+    paginacao = paginar(request, documentos_queryset)
+
+    selected_filters['page_size'] = str(paginacao['page_size'])
+
+    active_filter_keys = ['status', 'prioridade', 'procurador', 'interessado', 'prazo']
+    filters_count = len([value for key, value in selected_filters.items() if key in active_filter_keys and value])
+
+    # Opções dos filtros, do cache compartilhado (listas de dicts: o template usa .id / .descricao / .nome)
+    prioridades = obter_ou_calcular(
+        'referencias', 'prioridades',
+        lambda: list(NivelPrioridade.objects.order_by('descricao').values('id', 'descricao')),
+        ttl=TTL_REFERENCIAS,
+    )
+    procuradores = obter_ou_calcular('painel', 'procuradores_com_documentos', listar_procuradores_com_documentos, ttl=TTL_REFERENCIAS)
+    interessados = obter_ou_calcular(
+        'painel', 'interessados_com_processos',
+        lambda: list(
+            Remetente.objects.filter(processos_interessados__isnull=False).distinct().order_by('nome_razao_social').values('id', 'nome_razao_social')
+        ),
+        ttl=TTL_REFERENCIAS,
+    )
 
     context = {
-        'documentos': page_obj,
-        'page_obj': page_obj,
-        'total_documentos': paginator.count,
-        'status_options': monitoramento_statuses,
+        **paginacao,
+        'status_options': STATUS_MONITORAMENTO,
+        'prazo_options': SITUACAO_PRAZO_CHOICES,
         'prioridades': prioridades,
         'procuradores': procuradores,
         'interessados': interessados,
-        'page_size_options': page_size_options,
         'selected_filters': selected_filters,
         'filters_count': filters_count,
-        'querystring': preserved_querystring,
-        'is_paginated': page_obj.has_other_pages(),
-        'page_window': page_window,
     }
 
-    return render(request, 'gestao/monitoramento_analises.html', context)
+    with medir('render'):
+        return render(request, 'gestao/monitoramento_analises.html', context)
+
+
+@login_required
+@leitura_em_replica
+def monitoramento_exportar_view(request):
+    """ Exporta em CSV (streaming) todo o resultado dos filtros atuais do monitoramento. """
+    is_protocolo_chefe = 'Protocolador-Chefe' in papeis_usuario(request)
+    is_protocolo = 'Protocolo' in papeis_usuario(request)
+    if not request.user.is_superuser and not is_protocolo_chefe and not is_protocolo:
+        raise PermissionDenied("Você não tem permissão para acessar esta página.")
+
+    documentos_queryset, _ = filtrar_monitoramento(request, Documento.objects.com_prazos())
+    return exportar_csv(documentos_queryset, 'monitoramento', 'monitoramento_analises')
 
 
 
 @login_required
 def finalizacao_detail_view(request, pk):
     # Verificação de permissão de acesso (GET)
-    is_protocolo_chefe = request.user.groups.filter(name='Protocolador-Chefe').exists()
-    is_protocolo = request.user.groups.filter(name='Protocolo').exists()
+    is_protocolo_chefe = 'Protocolador-Chefe' in papeis_usuario(request)
+    is_protocolo = 'Protocolo' in papeis_usuario(request)
     if not request.user.is_superuser and not is_protocolo_chefe and not is_protocolo:
         raise PermissionDenied("Você não tem permissão para acessar esta página.")
     
@@ -690,36 +839,29 @@ def finalizacao_detail_view(request, pk):
         'finalizacao_form': finalizacao_form,
         'anexo_form': anexo_form,
         'pode_arquivar_direto': pode_arquivar_direto, # <-- Passa a permissão para o template
+        'pin_autorizado': pode_arquivar_direto and pin_autorizado(request),
     }
 
-    return render(request, 'gestao/finalizacao_detail.html', context)
+    with medir('render'):
+        return render(request, 'gestao/finalizacao_detail.html', context)
 
 
 
-@login_required
-def busca_view(request):
-    # 1. Inicia o formulário com os dados da URL
-    form = DocumentoFilterForm(request.GET or None)
-    
-    # --- OTIMIZAÇÃO DE PERFORMANCE (SELECT E PREFETCH) ---
-    # Já iniciamos o queryset trazendo tudo o que a tabela precisa
-    queryset = Documento.objects.select_related(
-        'tipo_documento', 
-        'prioridade', 
-    ).prefetch_related(
-        'interessados' # <--- Essencial para as badges na tabela
-    )
+# Colunas aceitas no parâmetro ?ordenar_por= da busca
+ORDENACOES_BUSCA = ['protocolo', 'num_doc_origem', 'status', 'data_recebimento', 'data_limite', 'dias_restantes', 'data_finalizacao']
 
-    # 2. Lógica de Permissão (Filtro de visibilidade)
-    is_protocolo_chefe = request.user.groups.filter(name='Protocolador-Chefe').exists()
-    is_protocolo = request.user.groups.filter(name='Protocolo').exists()
-    is_procurador_chefe = request.user.groups.filter(name='Procurador-Chefe').exists()
 
-    # Se não for um dos perfis "mestre", vê apenas os seus processos
-    if not (request.user.is_superuser or is_protocolo or is_protocolo_chefe or is_procurador_chefe):
-        queryset = queryset.filter(procurador_atribuido=request.user)
+def filtrar_busca(request, form, queryset):
+    """
+    Aplica sobre `queryset` a visibilidade do usuário, os filtros do DocumentoFilterForm e a
+    ordenação (?ordenar_por / ?ordem) da busca. Usado pela página e pela exportação CSV.
+    O queryset precisa de com_prazos() para ordenar por dias restantes.
+    Retorna o queryset, o campo de ordenação e a direção.
+    """
+    # Lógica de Permissão (Filtro de visibilidade): perfis "mestre" veem tudo, procuradores só os seus
+    queryset = queryset.visible_to(request.user, papeis_usuario(request))
 
-    # 3. Aplicação dos Filtros Dinâmicos
+    # Aplicação dos Filtros Dinâmicos
     if form.is_valid():
         protocolo = form.cleaned_data.get('protocolo')
         tipo_documento = form.cleaned_data.get('tipo_documento')
@@ -727,34 +869,56 @@ def busca_view(request):
         status = form.cleaned_data.get('status')
         data_inicio = form.cleaned_data.get('data_inicio')
         data_fim = form.cleaned_data.get('data_fim')
-        
+        prazo = form.cleaned_data.get('prazo')
+
         if protocolo:
             queryset = queryset.filter(protocolo__icontains=protocolo)
-        
+
         # ALTERADO: Agora filtra pela relação ManyToMany de Interessados
         if interessados:
             queryset = queryset.filter(interessados=interessados).distinct()
-            
+
         if status:
             queryset = queryset.filter(status=status)
-            
+
         if data_inicio:
             queryset = queryset.filter(data_recebimento__date__gte=data_inicio)
-            
+
         if data_fim:
             queryset = queryset.filter(data_recebimento__date__lte=data_fim)
         if tipo_documento:
-            queryset =queryset.filter(tipo_documento=tipo_documento)
+            queryset = queryset.filter(tipo_documento=tipo_documento)
+        if prazo:
+            queryset = queryset.filtrar_prazo(prazo)
 
-    # 4. Lógica de Ordenação
+    # Lógica de Ordenação
     ordenar_por = request.GET.get('ordenar_por', 'data_recebimento')
+    if ordenar_por not in ORDENACOES_BUSCA:
+        ordenar_por = 'data_recebimento'
     ordem = request.GET.get('ordem', 'desc')
     prefixo = '-' if ordem == 'desc' else ''
-    
+
     # Adicionamos 'id' como desempate para evitar instabilidade na paginação
-    queryset = queryset.order_by(f'{prefixo}{ordenar_por}', f'{prefixo}id')
+    return queryset.order_by(f'{prefixo}{ordenar_por}', f'{prefixo}id'), ordenar_por, ordem
+
 
-    # 5. Contexto para o template
+@login_required
+@leitura_em_replica
+def busca_view(request):
+    # 1. Inicia o formulário com os dados da URL
+    form = DocumentoFilterForm(request.GET or None)
+    
+    # --- OTIMIZAÇÃO DE PERFORMANCE (SELECT E PREFETCH) ---
+    # Já iniciamos o queryset trazendo tudo o que a tabela precisa
+    queryset = Documento.objects.para_listagem(
+        'busca'
+    ).com_prazos( # Permite ordenar por dias restantes direto no banco
+    ) # As badges de interessados vêm de interessados_resumo (sem prefetch do M2M)
+
+    # 2. Visibilidade, filtros e ordenação (compartilhados com a exportação CSV)
+    queryset, ordenar_por, ordem = filtrar_busca(request, form, queryset)
+
+    # 3. Contexto para o template
     context = {
         'filter_form': form,
         'documentos': queryset,
@@ -786,35 +950,27 @@ def busca_view(request):
     }
 
 
-    return render(request, 'gestao/busca.html', context)
+    with medir('render'):
+        return render(request, 'gestao/busca.html', context)
+
+
+@login_required
+@leitura_em_replica
+def busca_exportar_view(request):
+    """ Exporta em CSV (streaming) todo o resultado da busca, com os mesmos filtros e ordenação da página. """
+    form = DocumentoFilterForm(request.GET or None)
+    queryset, _, _ = filtrar_busca(request, form, Documento.objects.com_prazos())
+    return exportar_csv(queryset, 'busca', 'busca_documentos')
 
 
 @login_required
 def documento_consulta_view(request, pk):
-    documento = get_object_or_404(Documento, pk=pk)
+    # Busca e permissão na mesma consulta: quem não pode consultar recebe 404
+    documento = get_object_or_404(Documento.objects.visible_to(request.user, papeis_usuario(request)), pk=pk)
     origem = request.GET.get('origem', 'busca')
     procuradores = User.objects.filter(groups__name='Procuradores').order_by('first_name')
 
-    is_protocolo_chefe = request.user.groups.filter(name='Protocolador-Chefe').exists()
-    is_protocolo = request.user.groups.filter(name='Protocolo').exists()
-    is_procurador_chefe = request.user.groups.filter(name='Procurador-Chefe').exists()
-    is_procurador = request.user.groups.filter(name='Procuradores').exists()
-    is_procurador_analista = request.user.groups.filter(name='Procurador-Analista').exists()
-    is_procurador_atribuido = (request.user == documento.procurador_atribuido)
-
-    pode_ver = False
-    # Quem pode ver TODOS?
-    if request.user.is_superuser or is_protocolo or is_protocolo_chefe or is_procurador_chefe:
-        pode_ver = True
-    # Quem pode ver SÓ OS SEUS?
-    elif (is_procurador or is_procurador_analista) and is_procurador_atribuido:
-        pode_ver = True
-
-    if not pode_ver:
-        raise PermissionDenied("Você não tem permissão para consultar este documento.")
-
-
-    pode_reativar = is_procurador_chefe or request.user.is_superuser
+    pode_reativar = 'Procurador-Chefe' in papeis_usuario(request) or request.user.is_superuser
      # --- FIM DA LÓGICA DE PERMISSÃO ---
 
     # Busca os anexos
@@ -844,15 +1000,10 @@ def documento_consulta_view(request, pk):
 
 @login_required
 def devolver_documento_view(request, pk):
-    documento = get_object_or_404(Documento, pk=pk)
-
-    is_procurador_analista = request.user.groups.filter(name='Procurador-Analista').exists()
-    is_procurador = request.user.groups.filter(name='Procuradores').exists()
-    is_procurador_atribuido = (request.user == documento.procurador_atribuido)
-
-    # Só pode devolver se for Procurador OU Analista E for o atribuído
-    if not ( (is_procurador or is_procurador_analista) and is_procurador_atribuido ):
-         raise PermissionDenied("Apenas o procurador/analista atribuído pode devolver este documento.")
+    # Só pode devolver se for Procurador OU Analista E for o atribuído (filtro na própria consulta)
+    documento = get_object_or_404(
+        Documento.objects.actionable_by(request.user, papeis_usuario(request), somente_atribuidos=True), pk=pk
+    )
 
     # Ação só ocorre via POST (quando o formulário for enviado)
     if request.method == 'POST':
@@ -889,8 +1040,8 @@ def devolver_documento_view(request, pk):
 def reativar_documento_view(request, pk):
     documento = get_object_or_404(Documento, pk=pk)
 
-    is_protocolo_chefe = request.user.groups.filter(name='Protocolador-Chefe').exists()
-    is_protocolo = request.user.groups.filter(name='Protocolo').exists()
+    is_protocolo_chefe = 'Protocolador-Chefe' in papeis_usuario(request)
+    is_protocolo = 'Protocolo' in papeis_usuario(request)
     if not request.user.is_superuser and not is_protocolo_chefe and not is_protocolo:
         raise PermissionDenied("Você não tem permissão para reativar este documento.")
 
@@ -943,9 +1094,9 @@ def documento_confirmacao_view(request, pk):
 @login_required
 def cadastrar_remetente_ajax_view(request):
     
-    is_protocolo_chefe = request.user.groups.filter(name='Protocolador-Chefe').exists()
-    is_protocolo = request.user.groups.filter(name='Protocolo').exists()
-    is_cadastrante = request.user.groups.filter(name='Cadastrante').exists()
+    is_protocolo_chefe = 'Protocolador-Chefe' in papeis_usuario(request)
+    is_protocolo = 'Protocolo' in papeis_usuario(request)
+    is_cadastrante = 'Cadastrante' in papeis_usuario(request)
     if not request.user.is_superuser and not is_protocolo_chefe and not is_protocolo and not is_cadastrante:
          return JsonResponse({'success': False, 'error': 'Permissão negada'}, status=403)
     
@@ -979,20 +1130,26 @@ def remetente_autocomplete_view(request):
     if len(term) < 2: 
         return JsonResponse({'results': []}) # Retorna vazio se termo for muito curto
 
-    # Faz a busca no banco de dados
+    # Faz a busca no banco de dados (ou no cache compartilhado: o mesmo termo se repete a cada tecla/usuário)
     # Busca por nome OU por CPF/CNPJ que CONTENHAM o termo
-    remetentes = Remetente.objects.filter(
-        Q(nome_razao_social__icontains=term) | 
-        Q(cpf_cnpj__icontains=term)
-    ).order_by('nome_razao_social')[:10] # Limita a 10 resultados para performance
-
-    # Formata os resultados no formato que o Select2 espera: {'results': [{id: ..., text: ...}]}
-    results = []
-    for remetente in remetentes:
-        results.append({
-            'id': remetente.id,
-            'text': f"{remetente.nome_razao_social} ({remetente.cpf_cnpj})" # Exibe nome e CPF/CNPJ
-        })
+    def buscar_remetentes():
+        remetentes = Remetente.objects.filter(
+            Q(nome_razao_social__icontains=term) | 
+            Q(cpf_cnpj__icontains=term)
+        ).order_by('nome_razao_social')[:10] # Limita a 10 resultados para performance
+
+        # Formata os resultados no formato que o Select2 espera: {'results': [{id: ..., text: ...}]}
+        return [
+            {
+                'id': remetente.id,
+                'text': f"{remetente.nome_razao_social} ({remetente.cpf_cnpj})" # Exibe nome e CPF/CNPJ
+            }
+            for remetente in remetentes
+        ]
+
+    # O termo vira hash: chaves de cache não aceitam espaços nem caracteres arbitrários em todos os backends
+    chave = 'busca:' + hashlib.sha256(term.encode()).hexdigest()
+    results = obter_ou_calcular('remetentes', chave, buscar_remetentes, ttl=TTL_REFERENCIAS)
 
     return JsonResponse({'results': results})
 
@@ -1000,10 +1157,10 @@ def remetente_autocomplete_view(request):
 def enviar_lembrete_view(request, pk):
     from .email_utils import enviar_email_html, verificar_prazo_proximo
     
-    documento = get_object_or_404(Documento, pk=pk)
+    documento = get_object_or_404(Documento.objects.select_related('anexo_inicial_principal'), pk=pk)
 
-    is_protocolo_chefe = request.user.groups.filter(name='Protocolador-Chefe').exists()
-    is_protocolo = request.user.groups.filter(name='Protocolo').exists()
+    is_protocolo_chefe = 'Protocolador-Chefe' in papeis_usuario(request)
+    is_protocolo = 'Protocolo' in papeis_usuario(request)
     if not request.user.is_superuser and not is_protocolo_chefe and not is_protocolo:
         raise PermissionDenied("Você não tem permissão para enviar lembretes.")
 
@@ -1021,9 +1178,8 @@ def enviar_lembrete_view(request, pk):
         mensagem_personalizada = request.POST.get('custom_message', '').strip()
 
         try:
-            # 1. Busca o anexo inicial para gerar a URL (Já que Documento não tem 'arquivo')
-            anexo_inicial = documento.anexos.filter(tipo_anexo='INICIAL', ativo=True).first()
-            url_doc_storage = anexo_inicial.arquivo.url if anexo_inicial else None
+            # 1. URL do anexo inicial principal (já carregado via select_related)
+            url_doc_storage = documento.url_anexo_inicial
             
             contexto = {
                 'procurador_nome': documento.procurador_atribuido.get_full_name() or documento.procurador_atribuido.username,
@@ -1074,35 +1230,194 @@ def enviar_lembrete_view(request, pk):
         return render(request, 'gestao/lembrete_confirmacao.html', context)
     
 
+@login_required
+def enviar_lembretes_lote_view(request):
+    """
+    Lembrete em lote a partir do monitoramento: os documentos marcados são agrupados por procurador
+    e cada um recebe um único e-mail com todos os seus protocolos e links (sem anexos).
+    Uma consulta para todos os documentos e envio concorrente reaproveitando as conexões SMTP.
+    """
+    is_protocolo_chefe = 'Protocolador-Chefe' in papeis_usuario(request)
+    is_protocolo = 'Protocolo' in papeis_usuario(request)
+    if not request.user.is_superuser and not is_protocolo_chefe and not is_protocolo:
+        raise PermissionDenied("Você não tem permissão para enviar lembretes.")
+
+    destino = reverse('gestao:monitoramento_analises')
+    querystring = request.POST.get('querystring', '')
+    if querystring:
+        destino = f"{destino}?{querystring}"
+
+    if request.method != 'POST':
+        return redirect(destino)
+
+    documento_ids = [doc_id for doc_id in map(parse_int, request.POST.getlist('documentos')) if doc_id]
+    if not documento_ids:
+        messages.warning(request, "Selecione ao menos um documento para enviar lembretes.")
+        return redirect(destino)
+
+    mensagem_personalizada = request.POST.get('custom_message', '').strip()
+    hoje = timezone.localdate()
+    armazenamento = Anexo._meta.get_field('arquivo').storage
+    url_sistema = build_absolute_system_url(reverse('gestao:procurador_dashboard'))
+
+    linhas = Documento.objects.filter(
+        pk__in=documento_ids, status='Em Análise', procurador_atribuido__isnull=False
+    ).order_by('data_limite', 'id').values_list(
+        'id', 'protocolo', 'num_doc_origem', 'data_limite', 'tipo_documento__descricao', 'prioridade__descricao',
+        'anexo_inicial_principal__arquivo', 'procurador_atribuido', 'procurador_atribuido__first_name',
+        'procurador_atribuido__last_name', 'procurador_atribuido__username', 'procurador_atribuido__email',
+    )
+
+    grupos = {}
+    sem_email = set()
+    elegiveis = 0
+    for doc_id, protocolo, num_doc_origem, data_limite, tipo, prioridade, arquivo, proc_id, first_name, last_name, username, email in linhas:
+        elegiveis += 1
+        if not email:
+            sem_email.add(username)
+            continue
+        if proc_id not in grupos:
+            grupos[proc_id] = {'nome': f'{first_name} {last_name}'.strip() or username, 'email': email, 'processos': []}
+        grupos[proc_id]['processos'].append({
+            'protocolo': protocolo,
+            'num_doc_origem': num_doc_origem,
+            'data_limite': data_limite,
+            'dias_restantes': (data_limite - hoje).days if data_limite else None,
+            'tipo_documento': tipo,
+            'prioridade': prioridade,
+            'url': build_absolute_system_url(reverse('gestao:documento_detail', args=[doc_id])),
+            'url_anexo': armazenamento.url(arquivo) if arquivo else None,
+        })
+
+    envios = [
+        ((grupo['email'], len(grupo['processos'])), {
+            'assunto': f"Lembrete: {len(grupo['processos'])} documento(s) pendente(s) de análise",
+            'template_name': 'emails/lembrete_procurador_lote.html',
+            'contexto': {
+                'procurador_nome': grupo['nome'],
+                'processos': grupo['processos'],
+                'mensagem_personalizada': mensagem_personalizada,
+                'url_sistema': url_sistema,
+            },
+            'destinatarios': [grupo['email']],
+        })
+        for grupo in grupos.values()
+    ]
+
+    documentos_enviados = 0
+    falhas = []
+    for (email, quantidade), enviado in enviar_emails_em_paralelo(envios):
+        if enviado:
+            documentos_enviados += quantidade
+        else:
+            falhas.append(email)
+    logger.info(f"Lembretes em lote: {documentos_enviados} documento(s) para {len(envios) - len(falhas)} procurador(es), {len(falhas)} falha(s)")
+
+    if documentos_enviados:
+        messages.success(request, f"Lembretes de {documentos_enviados} documento(s) enviados a {len(envios) - len(falhas)} procurador(es).")
+    if falhas:
+        messages.error(request, f"Erro ao enviar lembrete para: {', '.join(sorted(falhas))}.")
+    if sem_email:
+        messages.warning(request, f"Procurador(es) sem e-mail cadastrado: {', '.join(sorted(sem_email))}.")
+    ignorados = len(set(documento_ids)) - elegiveis
+    if ignorados:
+        messages.warning(request, f"{ignorados} documento(s) ignorado(s): lembretes só valem para documentos 'Em Análise' com procurador atribuído.")
+    return redirect(destino)
+
+
 @login_required
 def confirmacao_lista_view(request):
     # --- LÓGICA DE PERMISSÃO (Mantida - está correta) ---
-    is_procurador_analista = request.user.groups.filter(name='Procurador-Analista').exists()
-    is_procurador_chefe = request.user.groups.filter(name='Procurador-Chefe').exists()
+    is_procurador_analista = 'Procurador-Analista' in papeis_usuario(request)
+    is_procurador_chefe = 'Procurador-Chefe' in papeis_usuario(request)
     
     if not is_procurador_analista and not is_procurador_chefe and not request.user.is_superuser:
         raise PermissionDenied("Você não tem permissão para acessar esta página.")
 
     # 1. A Lógica Otimizada:
-    # Usamos select_related para as chaves estrangeiras e prefetch_related para os interessados
+    # Colunas da tabela + procurador via JOIN; interessados vêm de interessados_resumo
+    # (índice em status + data_resposta_procurador)
     lista_de_documentos = Documento.objects.filter(
         status='Aguardando Confirmação'
-    ).select_related(
-        'remetente', 
-        'tipo_documento', 
-        'prioridade',
-        'procurador_atribuido' # Importante para saber quem respondeu
-    ).prefetch_related(
-        'interessados' # <--- O segredo para a tabela não travar
-    ).order_by('data_resposta_procurador')
-
-    # 2. O Contexto
+    ).para_listagem(
+        'confirmacao' # Inclui o procurador (autor da resposta) no mesmo JOIN
+    )
+
+    ordenacao = request.GET.get('ordenar', 'resposta')
+    if ordenacao == 'urgencia':
+        lista_de_documentos = lista_de_documentos.ordenar_por_urgencia()
+    else:
+        ordenacao = 'resposta'
+        lista_de_documentos = lista_de_documentos.order_by('data_resposta_procurador', 'id')
+
+    # 2. O Contexto (paginado)
     context = {
-        'documentos': lista_de_documentos
+        **paginar(request, lista_de_documentos, page_size_options=(25, 50, 100)),
+        'ordenacao': ordenacao,
+        'pin_autorizado': pin_autorizado(request),
     }
 
     # 3. Renderizar a página
-    return render(request, 'gestao/confirmacao_lista.html', context)
+    with medir('render'):
+        return render(request, 'gestao/confirmacao_lista.html', context)
+
+@login_required
+def confirmacao_lote_view(request):
+    """
+    Confirmação em lote: finaliza de uma vez os documentos marcados na lista de confirmação.
+    Um UPDATE para todos (status, data_finalizacao e finalizado_por), os intervalos de status e a fila
+    de respostas aos remetentes na mesma transação; as respostas saem depois do commit (gestao/respostas.py).
+    """
+    is_procurador_analista = 'Procurador-Analista' in papeis_usuario(request)
+    is_procurador_chefe = 'Procurador-Chefe' in papeis_usuario(request)
+    if not is_procurador_analista and not is_procurador_chefe and not request.user.is_superuser:
+        raise PermissionDenied("Você não tem permissão para acessar esta página.")
+
+    if request.method != 'POST':
+        return redirect('gestao:confirmacao_lista')
+
+    documento_ids = [doc_id for doc_id in map(parse_int, request.POST.getlist('documentos')) if doc_id]
+    if not documento_ids:
+        messages.warning(request, "Selecione ao menos um documento para confirmar.")
+        return redirect('gestao:confirmacao_lista')
+
+    # Vale a autorização de PIN da sessão; sem ela, o PIN vem no próprio POST
+    if not pin_autorizado(request):
+        pin_digitado = request.POST.get('pin_digitado', '').strip()
+        if not pin_digitado:
+            # Autorização expirada entre abrir a lista e confirmar: pede o PIN sem contar como tentativa errada
+            messages.error(request, "Sua autorização de PIN expirou. Digite o PIN para confirmar os documentos.")
+            return redirect('gestao:confirmacao_lista')
+        erro = autorizar_pin(request, pin_digitado)
+        if erro:
+            messages.error(request, f"{erro[0]} Nenhum documento foi confirmado.")
+            return redirect('gestao:confirmacao_lista')
+
+    agora = timezone.now()
+    with transaction.atomic():
+        confirmados = list(Documento.objects.select_for_update().filter(
+            pk__in=documento_ids, status='Aguardando Confirmação'
+        ).values_list('id', 'procurador_atribuido_id'))
+        ids_confirmados = [doc_id for doc_id, _ in confirmados]
+        Documento.objects.filter(pk__in=ids_confirmados).update(
+            status='Finalizado', data_finalizacao=agora, finalizado_por=request.user
+        )
+        IntervaloStatus.registrar_transicoes(
+            [(doc_id, 'Finalizado', procurador_id) for doc_id, procurador_id in confirmados], momento=agora
+        )
+        # A fila é gravada junto com a finalização: o que não sair agora é reenviado por enviar_respostas_pendentes
+        if enfileirar_respostas(ids_confirmados):
+            enviar_apos_commit(enviar_respostas_remetentes, ids_confirmados)
+
+    if ids_confirmados:
+        messages.success(
+            request, f"{len(ids_confirmados)} documento(s) confirmado(s) e arquivado(s); as respostas aos remetentes serão enviadas em instantes."
+        )
+    ignorados = len(set(documento_ids)) - len(ids_confirmados)
+    if ignorados:
+        messages.warning(request, f"{ignorados} documento(s) ignorado(s): já não estavam aguardando confirmação.")
+    return redirect('gestao:confirmacao_lista')
+
 
 @login_required
 def confirmacao_detail_view(request, pk):
@@ -1110,8 +1425,8 @@ def confirmacao_detail_view(request, pk):
     
     # --- LÓGICA DE PERMISSÃO ---
     # Apenas Procurador-Analista, Procurador-Chefe ou Superusuários podem confirmar
-    is_procurador_analista = request.user.groups.filter(name='Procurador-Analista').exists()
-    is_procurador_chefe = request.user.groups.filter(name='Procurador-Chefe').exists()
+    is_procurador_analista = 'Procurador-Analista' in papeis_usuario(request)
+    is_procurador_chefe = 'Procurador-Chefe' in papeis_usuario(request)
     if not is_procurador_analista and not is_procurador_chefe and not request.user.is_superuser:
         raise PermissionDenied("Você não tem permissão para acessar esta página.")
     # --- FIM DA LÓGICA DE PERMISSÃO ---
@@ -1130,55 +1445,20 @@ def confirmacao_detail_view(request, pk):
         documento.status = 'Finalizado'
         documento.data_finalizacao = timezone.now()
         documento.finalizado_por = request.user # Agora o 'finalizado_por' é o Analista
-        documento.save()
-
-        # --- LÓGICA DE ENVIO DE E-MAIL PARA O REMETENTE (CORRIGIDA PARA CLOUD) ---
-        email_enviado_sucesso = False
-        try:
-            from .email_utils import enviar_email_html
-            
-            email_remetente = documento.remetente.email
-            if email_remetente:
-                contexto = {
-                    'remetente_nome': documento.remetente.nome_razao_social,
-                    'protocolo': documento.protocolo,
-                    'num_doc_origem': documento.num_doc_origem,
-                    'data_finalizacao': documento.data_finalizacao.strftime('%d/%m/%Y %H:%M') if documento.data_finalizacao else timezone.now().strftime('%d/%m/%Y %H:%M'),
-                    'observacoes_finalizacao': documento.obs_final_atendimento if hasattr(documento, 'obs_final_atendimento') else documento.obs_finalizacao,
-                }
-                
-                # AJUSTE NOS ANEXOS: Captura os objetos de arquivo (FieldFile) diretamente
-                # Isso permite que a função enviar_email_html leia os bytes do Cloud Storage
-                lista_anexos = [
-                    anexo.arquivo for anexo in documento.anexos.filter(
-                        tipo_anexo__in=['INICIAL', 'RESPOSTA'], 
-                        ativo=True
-                    ) if anexo.arquivo
-                ]
-                
-                assunto = f"Resposta ao Documento Protocolo {documento.protocolo} - Procuradoria"
-                
-                # Chamada da função utilizando a lista de objetos
-                email_enviado_sucesso = enviar_email_html(
-                    assunto=assunto,
-                    template_name='emails/resposta_remetente.html',
-                    contexto=contexto,
-                    destinatarios=[email_remetente],
-                    anexos=lista_anexos
-                )
-                
-                if email_enviado_sucesso:
-                    logger.info(f"E-mail de resposta enviado para {email_remetente} - Documento {documento.protocolo}")
-            else:
-                logger.info(f"Doc {documento.protocolo} finalizado sem e-mail (remetente sem e-mail).")
+        with transaction.atomic():
+            documento.save()
+            # Mesma regra (e mesma fila) da confirmação em lote: só com "Notificar Remetente na Finalização?"
+            enfileirados = enfileirar_respostas([documento.pk])
 
-        except Exception as e:
-            logger.error(f"Erro ao enviar e-mail de resposta do documento {documento.protocolo}: {e}")
-            messages.error(request, f"Documento arquivado, mas falha ao enviar e-mail: {e}")
+        # --- E-MAIL PARA O REMETENTE ---
+        # Um único e-mail: sai já, depois do commit; se falhar, fica na fila para enviar_respostas_pendentes
+        enviados, falhas = enviar_respostas_remetentes(enfileirados) if enfileirados else (0, [])
 
         # Mensagens de feedback para o usuário
-        if email_enviado_sucesso:
+        if enviados:
             messages.success(request, f"Documento {documento.protocolo} confirmado, arquivado e e-mail enviado ao remetente!")
+        elif falhas:
+            messages.error(request, f"Documento {documento.protocolo} arquivado, mas houve falha ao enviar o e-mail ao remetente.")
         else:
             messages.success(request, f"Documento {documento.protocolo} confirmado e arquivado com sucesso! (E-mail não enviado).")
 
@@ -1199,9 +1479,11 @@ def confirmacao_detail_view(request, pk):
         'anexos_iniciais': anexos_iniciais,
         'anexos_resposta': anexos_resposta,
         'obs_protocolador': obs_protocolador, # Envia as observações para o template
+        'pin_autorizado': pin_autorizado(request), # Autorização da sessão ainda válida: dispensa o modal
     }
     
-    return render(request, 'gestao/confirmacao_detail.html', context)
+    with medir('render'):
+        return render(request, 'gestao/confirmacao_detail.html', context)
 
 @login_required
 def definir_pin_view(request):
@@ -1214,10 +1496,9 @@ def definir_pin_view(request):
         form = PinForm(request.POST)
         if form.is_valid():
             novo_pin = form.cleaned_data.get('novo_pin')
-            pin_hash = make_password(novo_pin)
-            
-            profile.pin_autorizacao = pin_hash
-            profile.save()
+            profile.definir_pin(novo_pin) # Invalida as autorizações emitidas com o PIN anterior
+            request.session.pop(SESSAO_AUTORIZACAO_PIN, None)
+            invalidar_papeis(request)
             
             messages.success(request, "Seu PIN de autorização foi definido/atualizado com sucesso!")
             return redirect('gestao:dashboard') 
@@ -1230,40 +1511,62 @@ def definir_pin_view(request):
     }
     return render(request, 'gestao/definir_pin.html', context)
 
+# Chave da sessão com a autorização emitida após um PIN correto (ver Profile.emitir_autorizacao_pin)
+SESSAO_AUTORIZACAO_PIN = 'gestao_autorizacao_pin'
+
+
+def pin_autorizado(request):
+    """ True se a sessão ainda tem uma autorização de PIN válida (não roda o hasher). """
+    autorizacao = request.session.get(SESSAO_AUTORIZACAO_PIN)
+    if not autorizacao:
+        return False
+    return Profile.autorizacao_pin_confere(autorizacao, request.user.pk, impressao_pin_usuario(request))
+
+
+def autorizar_pin(request, pin_digitado):
+    """
+    Confere o PIN (com limite de tentativas) e, se correto, guarda a autorização na sessão.
+    Retorna None em caso de sucesso ou (mensagem de erro, status HTTP).
+    """
+    profile = Profile.objects.filter(user=request.user).first()
+    if not profile or not profile.pin_autorizacao:
+        return 'PIN não definido. Por favor, defina seu PIN na página "Definir/Alterar PIN".', 400
+    if not Profile.formato_pin_valido(pin_digitado):
+        return 'PIN inválido. Deve conter 4 números.', 400
+
+    try:
+        pin_valido = profile.verificar_pin(pin_digitado)
+    except PinBloqueado:
+        minutos = max(settings.GESTAO_PIN_BLOQUEIO_SEGUNDOS // 60, 1)
+        return f'Muitas tentativas incorretas. Tente novamente em até {minutos} minuto(s).', 429
+    if not pin_valido:
+        return 'PIN incorreto.', 400
+
+    request.session[SESSAO_AUTORIZACAO_PIN] = profile.emitir_autorizacao_pin()
+    invalidar_papeis(request) # recarrega o resumo do PIN guardado na sessão
+    return None
+
+
 @login_required
 def verificar_pin_ajax_view(request):
     if request.method != 'POST':
         # Só permite o método POST
         return JsonResponse({'success': False, 'error': 'Método inválido'}, status=405)
 
-    pin_digitado = request.POST.get('pin_digitado', '').strip()
-    
-    # 1. Verifica se o usuário tem um PIN definido
-    pin_salvo_hash = request.user.profile.pin_autorizacao
-    if not pin_salvo_hash:
-        return JsonResponse({'success': False, 'error': 'PIN não definido. Por favor, defina seu PIN na página "Definir/Alterar PIN".'}, status=400)
-
-    # 2. Verifica se o PIN digitado tem 4 dígitos (validação rápida)
-    if not pin_digitado.isdigit() or len(pin_digitado) != 4:
-         return JsonResponse({'success': False, 'error': 'PIN inválido. Deve conter 4 números.'}, status=400)
-
-    # 3. Compara o PIN digitado com o PIN criptografado salvo
-    # Usamos check_password, que é a função correta para comparar um texto puro com um hash
-    pin_valido = check_password(pin_digitado, pin_salvo_hash)
-
-    if pin_valido:
-        return JsonResponse({'success': True})
-    else:
-        return JsonResponse({'success': False, 'error': 'PIN incorreto.'}, status=400)
+    erro = autorizar_pin(request, request.POST.get('pin_digitado', '').strip())
+    if erro:
+        mensagem, status = erro
+        return JsonResponse({'success': False, 'error': mensagem}, status=status)
+    return JsonResponse({'success': True})
     
 @login_required
 def rejeitar_confirmacao_view(request, pk):
-    documento = get_object_or_404(Documento, pk=pk)
+    documento = get_object_or_404(Documento.objects.select_related('anexo_inicial_principal'), pk=pk)
 
     # --- LÓGICA DE PERMISSÃO ---
     # Verifica se o usuário tem permissão para esta ação
-    is_procurador_analista = request.user.groups.filter(name='Procurador-Analista').exists()
-    is_procurador_chefe = request.user.groups.filter(name='Procurador-Chefe').exists()
+    is_procurador_analista = 'Procurador-Analista' in papeis_usuario(request)
+    is_procurador_chefe = 'Procurador-Chefe' in papeis_usuario(request)
     if not is_procurador_analista and not is_procurador_chefe and not request.user.is_superuser:
         raise PermissionDenied("Você não tem permissão para rejeitar este processo.")
     # --- FIM DA LÓGICA DE PERMISSÃO ---
@@ -1292,9 +1595,8 @@ def rejeitar_confirmacao_view(request, pk):
             procurador_original = documento.procurador_atribuido
             
             if procurador_original and procurador_original.email:
-                # 1. Definição da URL: pega o primeiro anexo inicial ativo do storage
-                anexo_inicial = documento.anexos.filter(tipo_anexo='INICIAL', ativo=True).first()
-                url_doc_storage = anexo_inicial.arquivo.url if anexo_inicial else None
+                # 1. Definição da URL: anexo inicial principal (já carregado via select_related)
+                url_doc_storage = documento.url_anexo_inicial
 
                 contexto = {
                     'procurador_nome': procurador_original.get_full_name() or procurador_original.username,
@@ -1354,7 +1656,7 @@ def excluir_anexo_view(request, pk, anexo_id):
     
     # 1. Quem pode? (Dono do anexo OU Protocolador-Chefe)
     is_dono = (request.user == anexo.usuario_upload)
-    is_protocolo_chefe = request.user.groups.filter(name='Protocolador-Chefe').exists()
+    is_protocolo_chefe = 'Protocolador-Chefe' in papeis_usuario(request)
     
     if not is_dono and not is_protocolo_chefe and not request.user.is_superuser:
         messages.error(request, "Você não tem permissão para excluir este anexo.")
@@ -1401,7 +1703,7 @@ def documento_update_view(request, pk):
         return redirect(f"{url_destino}?origem={origem}")
 
     # REGRA 2: Apenas Chefias e Admins
-    is_chefia = request.user.groups.filter(name__in=['Protocolador-Chefe', 'Procurador-Chefe']).exists()
+    is_chefia = not papeis_usuario(request).isdisjoint(['Protocolador-Chefe', 'Procurador-Chefe'])
     if not (request.user.is_superuser or is_chefia):
         raise PermissionDenied("Acesso restrito à chefia.")
 
@@ -1488,7 +1790,7 @@ def documento_update_view(request, pk):
 @login_required
 def diligencias_pendentes_view(request):
     # Apenas Chefias e Admins acessam esta central de controle
-    is_chefia = request.user.groups.filter(name__in=['Protocolador-Chefe', 'Procurador-Chefe']).exists()
+    is_chefia = not papeis_usuario(request).isdisjoint(['Protocolador-Chefe', 'Procurador-Chefe'])
     if not (request.user.is_superuser or is_chefia):
         raise PermissionDenied("Acesso restrito à gestão de diligências.")
 
@@ -1585,7 +1887,7 @@ def decidir_diligencia_view(request, diligencia_id):
 
 @login_required
 def atribuir_procurador_direto_view(request, pk):
-    documento = get_object_or_404(Documento, pk=pk)
+    documento = get_object_or_404(Documento.objects.select_related('anexo_inicial_principal'), pk=pk)
     
     if request.method == 'POST':
         procurador_id = request.POST.get('procurador_id')
@@ -1602,9 +1904,8 @@ def atribuir_procurador_direto_view(request, pk):
 
             # 2. PREPARAÇÃO DO E-MAIL (CORRIGIDA PARA GOOGLE CLOUD STORAGE)
             try:
-                # 1. Ajuste da URL: usa o primeiro anexo inicial ativo do storage
-                anexo_inicial = documento.anexos.filter(tipo_anexo='INICIAL', ativo=True).first()
-                url_doc_storage = anexo_inicial.arquivo.url if anexo_inicial else None
+                # 1. Ajuste da URL: anexo inicial principal (já carregado via select_related)
+                url_doc_storage = documento.url_anexo_inicial
 
                 contexto = {
                     'procurador_nome': procurador.get_full_name() or procurador.username,
@@ -1653,7 +1954,7 @@ def atribuir_procurador_direto_view(request, pk):
 @transaction.atomic
 def redistribuir_ferias_view(request):
     # REGRA DE ACESSO: Apenas Admins ou quem você definir como chefia
-    if not (request.user.is_superuser or request.user.groups.filter(name__in=['Protocolador-Chefe', 'Procurador-Chefe']).exists()):
+    if not (request.user.is_superuser or not papeis_usuario(request).isdisjoint(['Protocolador-Chefe', 'Procurador-Chefe'])):
         raise PermissionDenied("Você não tem permissão para realizar redistribuições.")
 
     if request.method == 'POST':
@@ -1694,6 +1995,115 @@ def redistribuir_ferias_view(request):
 
     return render(request, 'gestao/redistribuir_ferias.html', {'form': form})
 
+@login_required
+@leitura_em_replica
+def produtividade_view(request):
+    """ Indicadores de produtividade e prazo da chefia, lidos apenas de ResumoProdutividadeDiaria. """
+    if not (request.user.is_superuser or not papeis_usuario(request).isdisjoint(['Protocolador-Chefe', 'Procurador-Chefe'])):
+        raise PermissionDenied("Você não tem permissão para acessar os indicadores.")
+
+    hoje = timezone.localdate()
+    try:
+        data_fim = datetime.strptime(request.GET.get('data_fim', ''), '%Y-%m-%d').date()
+    except ValueError:
+        data_fim = hoje
+    try:
+        data_inicio = datetime.strptime(request.GET.get('data_inicio', ''), '%Y-%m-%d').date()
+    except ValueError:
+        # Padrão: os últimos 12 meses completos até data_fim
+        meses = data_fim.year * 12 + data_fim.month - 1 - 11
+        data_inicio = data_fim.replace(year=meses // 12, month=meses % 12 + 1, day=1)
+
+    resumos = ResumoProdutividadeDiaria.objects.filter(data__range=(data_inicio, data_fim))
+    procurador_id = parse_int(request.GET.get('procurador'))
+    if procurador_id:
+        resumos = resumos.filter(procurador_id=procurador_id)
+    tipo_id = parse_int(request.GET.get('tipo_documento'))
+    if tipo_id:
+        resumos = resumos.filter(tipo_documento_id=tipo_id)
+    prioridade_id = parse_int(request.GET.get('prioridade'))
+    if prioridade_id:
+        resumos = resumos.filter(prioridade_id=prioridade_id)
+
+    somas = {
+        'recebidos': Sum('recebidos'),
+        'atribuidos': Sum('atribuidos'),
+        'respondidos': Sum('respondidos'),
+        'respondidos_com_atraso': Sum('respondidos_com_atraso'),
+        'finalizados': Sum('finalizados'),
+        'tempo_total': Sum('tempo_resposta_total_horas'),
+    }
+
+    # "Em atraso" é um retrato diário: vale o do último dia consolidado do período
+    ultimo_dia = resumos.aggregate(ultimo=Max('data'))['ultimo']
+    em_atraso_por_procurador = dict(
+        resumos.filter(data=ultimo_dia).values('procurador').annotate(total=Sum('em_atraso')).values_list('procurador', 'total')
+    ) if ultimo_dia else {}
+
+    # Histogramas somados em Python (percentis não são somáveis no SQL)
+    histogramas = {}
+    for procurador, histograma in resumos.filter(respondidos__gt=0).values_list('procurador', 'histograma_resposta').iterator():
+        histogramas.setdefault(procurador, []).append(histograma)
+
+    def indicadores(linha, histograma):
+        respondidos = linha['respondidos'] or 0
+        linha['tempo_medio_dias'] = round(linha['tempo_total'] / respondidos / 24, 1) if respondidos else None
+        linha['percentual_no_prazo'] = round(100 * (respondidos - linha['respondidos_com_atraso']) / respondidos) if respondidos else None
+        linha['p50_dias'] = percentil_histograma(histograma, 50)
+        linha['p90_dias'] = percentil_histograma(histograma, 90)
+        return linha
+
+    histograma_geral = somar_histogramas(h for lista in histogramas.values() for h in lista)
+    totais = indicadores(resumos.aggregate(**somas), histograma_geral)
+    totais['em_atraso'] = sum(em_atraso_por_procurador.values())
+
+    por_procurador = []
+    linhas_procurador = resumos.values(
+        'procurador', 'procurador__username', 'procurador__first_name', 'procurador__last_name'
+    ).annotate(**somas).order_by('procurador__first_name', 'procurador__username')
+    for linha in linhas_procurador:
+        linha = indicadores(linha, somar_histogramas(histogramas.get(linha['procurador'], [])))
+        linha['em_atraso'] = em_atraso_por_procurador.get(linha['procurador'], 0)
+        linha['nome'] = (
+            f"{linha['procurador__first_name']} {linha['procurador__last_name']}".strip() or linha['procurador__username'] or 'Sem procurador'
+        )
+        por_procurador.append(linha)
+
+    # Série mensal para o gráfico (média diária de "em atraso" no mês)
+    serie_mensal = []
+    linhas_mes = resumos.annotate(mes=TruncMonth('data')).values('mes').annotate(
+        recebidos=Sum('recebidos'), respondidos=Sum('respondidos'), finalizados=Sum('finalizados'),
+        soma_em_atraso=Sum('em_atraso'), dias=Count('data', distinct=True),
+    ).order_by('mes')
+    for linha in linhas_mes:
+        serie_mensal.append({
+            'mes': linha['mes'].strftime('%m/%Y'),
+            'recebidos': linha['recebidos'],
+            'respondidos': linha['respondidos'],
+            'finalizados': linha['finalizados'],
+            'em_atraso_media': round(linha['soma_em_atraso'] / linha['dias'], 1) if linha['dias'] else 0,
+        })
+
+    context = {
+        'totais': totais,
+        'por_procurador': por_procurador,
+        'serie_mensal': serie_mensal,
+        'ultimo_dia': ultimo_dia,
+        'filtros': {
+            'data_inicio': data_inicio.isoformat(),
+            'data_fim': data_fim.isoformat(),
+            'procurador': procurador_id or '',
+            'tipo_documento': tipo_id or '',
+            'prioridade': prioridade_id or '',
+        },
+        'procuradores': User.objects.filter(groups__name='Procuradores').order_by('first_name', 'username'),
+        'tipos_documento': TipoDocumento.objects.order_by('descricao'),
+        'prioridades': NivelPrioridade.objects.order_by('descricao'),
+    }
+    with medir('render'):
+        return render(request, 'gestao/produtividade.html', context)
+
+
 def get_process_count_ajax(request):
     user_id = request.GET.get('user_id')
     # O print abaixo aparecerá no terminal do PythonAnywhere (Server Log)